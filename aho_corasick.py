@@ -0,0 +1,70 @@
+# aho_corasick.py
+# Multi-pattern substring matcher: every pattern is found in one pass over
+# the text, however many patterns there are.
+import collections
+
+
+class AhoCorasick:
+
+    # Example: AhoCorasick(["miner", "keygen"]); values, if given, are
+    # returned for each pattern instead of the pattern itself.
+    def __init__(self, patterns, values=None, ignore_case=True):
+        self.ignore_case = ignore_case
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        values = list(patterns) if values is None else list(values)
+        for pattern, value in zip(patterns, values):
+            self._add(pattern.lower() if ignore_case else pattern, value)
+        self._build()
+        self.size = len(values)
+
+    def _add(self, pattern, value):
+        if not pattern:
+            return
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] += (value,)
+
+    # Breadth-first: failure links point to the longest proper suffix that
+    # is also a prefix of some pattern, and outputs are merged along them.
+    def _build(self):
+        todo = collections.deque(self._goto[0].values())
+        while todo:
+            state = todo.popleft()
+            for ch, nxt in self._goto[state].items():
+                todo.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    # Example: Values of all patterns occurring in text, in order of first
+    # occurrence, each once.
+    def search(self, text):
+        if self.ignore_case:
+            text = text.lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        found = {}
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                for value in out[state]:
+                    found.setdefault(value, None)
+        return list(found)
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,307 @@
+# antigus_cli.py
+# Headless command line for servers and cron jobs. Never imports Qt; only
+# the commands that need psutil (daemon, through the monitor and the scan
+# scheduler) load it.
+#
+# Example:
+#   python antigus_cli.py scan /home          exit status 1 if threats were found
+#   python antigus_cli.py scan / --quick --time-budget 600 [--byte-budget 2048]
+#   python antigus_cli.py scan / --io-mode cache-friendly
+#   python antigus_cli.py update              exit status 1 if the feed could not be applied
+#   python antigus_cli.py quarantine list | restore ID [--to PATH] [--overwrite] | delete ID | purge [--older-than DAYS]
+#   python antigus_cli.py report
+#   python antigus_cli.py rematch [--definitions iocs.txt] [MANIFEST_OR_DIR ...]
+#   python antigus_cli.py daemon --scan-every 24 /home /srv
+#   python antigus_cli.py status
+#
+# While a daemon is running, "scan" hands the job to it (see scan_daemon.py)
+# unless --local or an option only a local scan has is given.
+#
+# Only argparse is imported up front; each command imports the modules it
+# uses. "scan --json" includes first_file_ms, the time from process start
+# to the first file judged (target: under 100 ms), which benchmark.py
+# tracks as cold_start.
+import argparse
+import os
+import sys
+import time
+
+_imported = time.monotonic()
+
+# Same as scan_daemon.DAEMON_SOCKET, which is only imported when used.
+DAEMON_SOCKET = os.path.expanduser("~/.cache/antigus/daemon.sock")
+# Same as scanner_utils.IO_MODES.
+IO_MODES = ("buffered", "cache-friendly")
+
+
+# Seconds since this process started, from /proc; falls back to the time
+# since this module was imported.
+def _process_age():
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - started
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.monotonic() - _imported
+
+
+def _print_summary(args, threats, summary, first):
+    import json
+    summary["threats"] = threats
+    # first_file_ms counts from process start, interpreter start-up
+    # included; startup_ms only from when this module was imported.
+    summary["first_file_ms"] = round(first[0][0] * 1000, 1) if first else None
+    summary["startup_ms"] = round(first[0][1] * 1000, 1) if first else None
+    if args.json:
+        print(json.dumps(summary, default=str))
+    else:
+        resumed = f" ({summary['resumed_files']} before resuming)" if summary.get("resumed_files") else ""
+        print(f"Scan complete. {summary.get('files', 0)} files scanned{resumed}, "
+              f"{len(threats)} threats quarantined.")
+        if first:
+            print(f"First file scanned {summary['first_file_ms']} ms after start "
+                  f"({summary['startup_ms']} ms after the interpreter was up).")
+        if summary.get("manifest"):
+            print(f"Scan manifest: {summary['manifest']}")
+        if summary.get("coverage"):
+            from arfetanti import print_coverage
+            print_coverage(summary["coverage"])
+        if summary.get("journal"):
+            print(f"Scan journal: {summary['journal']}")
+    return 1 if threats else 0
+
+
+# Runs the scan in the daemon; returns None if it could not be reached.
+def _scan_in_daemon(args):
+    from scan_daemon import DaemonClient, daemon_running
+    from similarity_hash import describe_match
+    if not daemon_running():
+        return None
+    client = DaemonClient()
+    first = []
+    threats, summary = [], {"error": "the scan daemon went away"}
+    try:
+        for event in client.scan(args.path, files=args.verbose):
+            kind = event.get("event")
+            if kind == "accepted" and event["joined"] and not args.json:
+                print(f"Joined the running scan of {event['job_path']}")
+            elif kind == "results":
+                for fpath, matched in event["items"]:
+                    if not first:
+                        first.append((_process_age(), time.monotonic() - _imported))
+                    if not args.json:
+                        print(f"Threat detected: {fpath}{describe_match(matched)}" if matched
+                              else f"Scanned: {fpath}")
+            elif kind == "done":
+                threats, summary = event["threats"], event["summary"]
+    except KeyboardInterrupt:
+        client.close()
+        raise
+    return _print_summary(args, threats, summary, first)
+
+
+def cmd_scan(args):
+    import contextlib
+    # A budget only makes sense for a quick scan.
+    args.quick = args.quick or args.time_budget is not None or args.byte_budget is not None
+    if not (args.local or args.workers is not None or args.resume or args.no_cache or args.no_archives
+            or args.manifest or args.quick or args.io_mode):
+        status = _scan_in_daemon(args)
+        if status is not None:
+            return status
+    import arfetanti
+    from similarity_hash import describe_match
+    first = []
+    def on_result(fpath, matched):
+        if not first:
+            first.append((_process_age(), time.monotonic() - _imported))
+        if matched and not args.json:
+            print(f"Threat detected: {fpath}" + describe_match(matched))
+        elif args.verbose and not args.json:
+            print(f"Scanned: {fpath}")
+    arfetanti.load_local_definitions()
+    if args.no_archives:
+        arfetanti.SCAN_ARCHIVES = False
+    if args.no_cache:
+        arfetanti.SCAN_CACHE_FILE = None
+    if args.manifest:
+        arfetanti.SCAN_MANIFESTS = True
+    if args.io_mode:
+        arfetanti.SCAN_IO_MODE = args.io_mode
+    # With --json, stdout carries only the summary; messages go to stderr.
+    with contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext():
+        if args.quick:
+            byte_budget = int(args.byte_budget * 1024 * 1024) if args.byte_budget is not None else None
+            threats, summary = arfetanti.run_quick_scan(os.path.abspath(args.path), on_result,
+                                                        args.time_budget, byte_budget)
+        else:
+            threats, summary = arfetanti.run_scan(os.path.abspath(args.path), on_result, workers=args.workers,
+                                                  resume=args.resume)
+    return _print_summary(args, threats, summary, first)
+
+
+def cmd_update(args):
+    import arfetanti
+    updated = arfetanti.update_definitions()
+    if args.rematch:
+        return 1 if arfetanti.rematch_manifests() else 0
+    return 0 if updated else 1
+
+
+# Matches stored manifests against the current definitions, or against a
+# definitions file (a compiled store or one digest per line) such as a list
+# of new IOCs. Exit status 1 if anything matched.
+def cmd_rematch(args):
+    import contextlib
+    import json
+    import arfetanti
+    from signature_store import MAGIC, SignatureStore
+    definitions = None
+    with contextlib.ExitStack() as stack:
+        if args.definitions:
+            with open(args.definitions, "rb") as f:
+                compiled = f.read(len(MAGIC)) == MAGIC
+            if compiled:
+                definitions = SignatureStore(args.definitions)
+            else:
+                definitions = stack.enter_context(open(args.definitions))
+        else:
+            arfetanti.load_local_definitions()
+        if args.json:
+            stack.enter_context(contextlib.redirect_stdout(sys.stderr))
+        hits = arfetanti.rematch_manifests(args.manifests, definitions)
+    if args.json:
+        print(json.dumps(hits))
+    return 1 if hits else 0
+
+
+def cmd_quarantine(args):
+    import quarantine
+    if args.action == "list":
+        items = quarantine.print_quarantine(args.limit, args.before)
+        if len(items) == args.limit:
+            print(f"More: quarantine list --before {items[-1]['id']}")
+    elif args.action == "restore":
+        return 0 if quarantine.restore_file(args.id, args.to, args.overwrite) else 1
+    elif args.action == "delete":
+        quarantine.delete_quarantined_file(args.id)
+    elif args.action == "purge":
+        older_than = time.time() - args.older_than * 86400 if args.older_than is not None else None
+        print(f"{quarantine.purge_quarantine(older_than)} items removed.")
+    return 0
+
+
+def cmd_report(args):
+    import arfetanti
+    arfetanti.load_local_definitions()
+    arfetanti.generate_report()
+    return 0
+
+
+# Real-time protection and the scan daemon, which also scans the given
+# paths every --scan-every hours.
+def cmd_daemon(args):
+    import arfetanti
+    from scan_daemon import ScanDaemon
+    if args.io_mode:
+        arfetanti.SCAN_IO_MODE = args.io_mode
+    daemon = ScanDaemon(args.socket, scan_every=args.scan_every, scan_paths=args.paths)
+    daemon.load()
+    monitor = arfetanti.start_monitoring(block=False) if not args.no_monitor else None
+    try:
+        daemon.run()
+    except RuntimeError as e:
+        print(e)
+        return 1
+    finally:
+        if monitor:
+            monitor.stop()
+    return 0
+
+
+def cmd_status(args):
+    import json
+    from scan_daemon import DaemonClient
+    try:
+        reply = DaemonClient(args.socket).call("status")
+    except OSError:
+        reply = None
+    if reply is None:
+        print("No scan daemon is running.")
+        return 1
+    print(json.dumps(reply, indent=2, default=str))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="antigus", description="Antigus headless scanner")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan = commands.add_parser("scan", help="scan a directory tree")
+    scan.add_argument("path", nargs="?", default="/")
+    scan.add_argument("--workers", type=int, help="hashing threads (0 scans serially)")
+    scan.add_argument("--resume", action="store_true", help="continue the last interrupted scan of path")
+    scan.add_argument("--no-cache", action="store_true", help="hash every file, ignoring the hash cache")
+    scan.add_argument("--no-archives", action="store_true", help="do not look inside archives")
+    scan.add_argument("--verbose", action="store_true", help="print every file scanned")
+    scan.add_argument("--json", action="store_true", help="print the scan summary as JSON")
+    scan.add_argument("--local", action="store_true", help="scan in this process even if a daemon is running")
+    scan.add_argument("--manifest", action="store_true", help="write a manifest of the scan for rematch")
+    scan.add_argument("--quick", action="store_true", help="scan the riskiest files first, within a budget")
+    scan.add_argument("--time-budget", type=float, metavar="SECONDS",
+                      help="quick scan time limit, ranking included (0 for none; default 300)")
+    scan.add_argument("--byte-budget", type=float, metavar="MB", help="quick scan read limit (0 for none)")
+    scan.add_argument("--io-mode", choices=IO_MODES,
+                      help="cache-friendly reads around the page cache, sparing other programs' cached data")
+    scan.set_defaults(func=cmd_scan)
+
+    update = commands.add_parser("update", help="download new definitions")
+    update.add_argument("--rematch", action="store_true", help="then rematch the stored scan manifests")
+    update.set_defaults(func=cmd_update)
+
+    rematch = commands.add_parser("rematch", help="match scan manifests against definitions without rescanning")
+    rematch.add_argument("manifests", nargs="*", help="manifest files or directories (default: this host's)")
+    rematch.add_argument("--definitions", help="compiled store or digest list to match instead of the current one")
+    rematch.add_argument("--json", action="store_true", help="print the hits as JSON")
+    rematch.set_defaults(func=cmd_rematch)
+
+    quarantine = commands.add_parser("quarantine", help="list, restore, delete or purge quarantined files")
+    actions = quarantine.add_subparsers(dest="action", required=True)
+    listing = actions.add_parser("list")
+    listing.add_argument("--limit", type=int, default=50)
+    listing.add_argument("--before", type=int, help="list items older than this id")
+    restore = actions.add_parser("restore")
+    restore.add_argument("id", type=int)
+    restore.add_argument("--to", help="restore to this path instead of the original one")
+    restore.add_argument("--overwrite", action="store_true", help="replace a file already at the destination")
+    delete = actions.add_parser("delete")
+    delete.add_argument("id", type=int)
+    purge = actions.add_parser("purge")
+    purge.add_argument("--older-than", type=float, metavar="DAYS")
+    quarantine.set_defaults(func=cmd_quarantine)
+
+    report = commands.add_parser("report", help="write antivirus_report.json from the last scan")
+    report.set_defaults(func=cmd_report)
+
+    daemon = commands.add_parser("daemon", help="run real-time protection and scheduled scans")
+    daemon.add_argument("paths", nargs="*", default=["/"])
+    daemon.add_argument("--scan-every", type=float, metavar="HOURS", help="full scan interval")
+    daemon.add_argument("--socket", default=DAEMON_SOCKET, help="unix socket to take scan jobs on")
+    daemon.add_argument("--no-monitor", action="store_true", help="do not start real-time protection")
+    daemon.add_argument("--io-mode", choices=IO_MODES, help="how the daemon's scans read files")
+    daemon.set_defaults(func=cmd_daemon)
+
+    status = commands.add_parser("status", help="show the scan daemon's running jobs")
+    status.add_argument("--socket", default=DAEMON_SOCKET)
+    status.set_defaults(func=cmd_status)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
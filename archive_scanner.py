@@ -0,0 +1,340 @@
+# archive_scanner.py
+# Looks inside zip, tar, gzip, xz and bzip2 files. Members are decompressed
+# in memory, a chunk at a time, and go through the same hashing and
+# content-signature path as ordinary files; nothing is extracted to disk.
+# Nested archives are opened up to a depth limit, and limits on the bytes
+# unpacked and on the compression ratio stop decompression bombs.
+#
+# Members are named with composite paths: a.zip!/dir/b.exe, and for a
+# nested archive a.zip!/inner.tar.gz!/x.
+import bz2
+import gzip
+import io
+import lzma
+import os
+import tarfile
+import threading
+import zipfile
+import zlib
+
+from scanner_utils import (CHUNK_SIZE, DEFAULT_ALGORITHMS, IO_BUFFERED, IO_CACHE_FRIENDLY, drop_cache,
+                           match_digests, new_hashers, page_cached)
+from similarity_hash import format_match
+
+ARCHIVE_MAX_DEPTH = 3
+# Uncompressed bytes read from one file on disk, over all nesting levels.
+ARCHIVE_MAX_BYTES = 512 * 1024 * 1024
+# Uncompressed:compressed ratio above which a stream counts as a bomb,
+# checked once at least RATIO_MIN_BYTES have been unpacked.
+ARCHIVE_MAX_RATIO = 100
+RATIO_MIN_BYTES = 1024 * 1024
+ARCHIVE_MAX_MEMBERS = 10000
+# Nested archives are buffered in memory to be opened; larger ones are
+# only hashed as a whole.
+ARCHIVE_MAX_BUFFER = 64 * 1024 * 1024
+# What a limit hit is reported as when limits_are_threats is on.
+LIMIT_VERDICT = "heuristic:archive-limit"
+
+_MAGIC = (
+    ("zip", 0, b"PK\x03\x04"),
+    ("zip", 0, b"PK\x05\x06"),
+    ("gzip", 0, b"\x1f\x8b"),
+    ("xz", 0, b"\xfd7zXZ\x00"),
+    ("bzip2", 0, b"BZh"),
+    ("tar", 257, b"ustar"),
+)
+_OPENERS = {
+    "gzip": lambda f: gzip.GzipFile(fileobj=f, mode="rb"),
+    "xz": lzma.LZMAFile,
+    "bzip2": bz2.BZ2File,
+}
+_SUFFIXES = {"gzip": (".gz",), "xz": (".xz",), "bzip2": (".bz2",)}
+# Bytes archive_kind needs to see; tar's magic is the furthest in.
+SNIFF_SIZE = 512
+_ERRORS = (OSError, EOFError, ValueError, TypeError, RuntimeError, NotImplementedError,
+           zipfile.BadZipFile, tarfile.TarError, lzma.LZMAError, zlib.error)
+
+
+# Example: archive_kind(first 512 bytes) -> "zip", "tar", "gzip", ... or None
+def archive_kind(head):
+    for kind, offset, magic in _MAGIC:
+        if head[offset:offset + len(magic)] == magic:
+            return kind
+    return None
+
+
+class ArchiveLimitExceeded(Exception):
+    pass
+
+
+# A sink for scanner_utils.file_digests that keeps the first bytes of the
+# file, so whether it is an archive is known from the read that hashed it.
+class ArchiveSniff:
+
+    def __init__(self):
+        self.head = b""
+
+    def start(self, size):
+        pass
+
+    def update(self, block):
+        if len(self.head) < SNIFF_SIZE:
+            self.head += bytes(block[:SNIFF_SIZE - len(self.head)])
+
+    def kind(self):
+        return archive_kind(self.head)
+
+
+# Counts bytes read through a stream.
+class _Counter:
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.count = 0
+
+    def read(self, n=-1):
+        data = self.raw.read(n)
+        self.count += len(data)
+        return data
+
+    def readable(self):
+        return True
+
+    def close(self):
+        pass
+
+
+# Stream with some bytes already read from its start put back in front.
+class _Prefixed(io.RawIOBase):
+
+    def __init__(self, head, rest):
+        self.head = head
+        self.rest = rest
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        if self.head:
+            n = min(len(buf), len(self.head))
+            buf[:n] = self.head[:n]
+            self.head = self.head[n:]
+            return n
+        data = self.rest.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+
+class ArchiveScanner:
+
+    # The key hash_file stores member verdicts under, next to the digests.
+    key = "archive"
+
+    def __init__(self, bad_hashes, content=None, algorithms=None, max_depth=ARCHIVE_MAX_DEPTH,
+                 max_bytes=ARCHIVE_MAX_BYTES, max_ratio=ARCHIVE_MAX_RATIO,
+                 max_members=ARCHIVE_MAX_MEMBERS, max_buffer=ARCHIVE_MAX_BUFFER,
+                 limits_are_threats=False, similarity=None):
+        self.bad_hashes = bad_hashes
+        self.content = content
+        self.similarity = similarity
+        self.algorithms = tuple(algorithms or getattr(bad_hashes, "algorithms", DEFAULT_ALGORITHMS))
+        self.max_depth = max_depth
+        self.max_bytes = max_bytes
+        self.max_ratio = max_ratio
+        self.max_members = max_members
+        self.max_buffer = max_buffer
+        self.limits_are_threats = limits_are_threats
+        # Archives are scanned on several hash workers at once; each call
+        # counts into its own state and adds it here at the end.
+        self._lock = threading.Lock()
+        self.archives = 0
+        self.members = 0
+        self.bytes_unpacked = 0
+        self.limits_hit = 0
+
+    # Example: sinks=(archives.session(),) ... then session.kind()
+    def session(self):
+        return ArchiveSniff()
+
+    # Example: sniff(path) -> "zip", ... or None; reads only the first bytes.
+    # With IO_CACHE_FRIENDLY, the pages the read (and its readahead) brought
+    # in are dropped again, unless the file was cached already.
+    def sniff(self, path, io_mode=IO_BUFFERED):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return None
+        try:
+            keep = io_mode != IO_CACHE_FRIENDLY or page_cached(fd)
+            head = os.pread(fd, SNIFF_SIZE, 0)
+            if not keep:
+                drop_cache(fd)
+            return archive_kind(head)
+        except OSError:
+            return None
+        finally:
+            os.close(fd)
+
+    # Example: Scan the members of the archive at path.
+    # Returns [[composite path, matched], ...] for the members that matched
+    # (empty for clean archives), or None if path is not an archive. kind,
+    # when the caller has already sniffed it, saves reading the magic again.
+    # With IO_CACHE_FRIENDLY the archive's pages are dropped once it has
+    # been unpacked, unless they were cached before: after the hashing
+    # read, that means someone else uses the file.
+    def scan(self, path, kind=None, io_mode=IO_BUFFERED):
+        kind = kind or self.sniff(path, io_mode)
+        if kind is None:
+            return None
+        state = {"bytes": 0, "members": 0, "archives": 0, "limits_hit": 0}
+        found = []
+        try:
+            with open(path, "rb") as f:
+                keep = io_mode != IO_CACHE_FRIENDLY or page_cached(f.fileno())
+                try:
+                    self._archive(f, kind, path, 1, state, found)
+                except ArchiveLimitExceeded as e:
+                    state["limits_hit"] += 1
+                    if self.limits_are_threats:
+                        found.append([f"{path}!/", f"{LIMIT_VERDICT}:{e}"])
+                finally:
+                    if not keep:
+                        drop_cache(f.fileno())
+        except _ERRORS:
+            found = None
+        with self._lock:
+            self.archives += state["archives"]
+            self.members += state["members"]
+            self.bytes_unpacked += state["bytes"]
+            self.limits_hit += state["limits_hit"]
+        return found
+
+    def _archive(self, f, kind, name, depth, state, found):
+        state["archives"] += 1
+        try:
+            if kind == "zip":
+                self._zip(f, name, depth, state, found)
+            elif kind == "tar":
+                self._tar(f, name, depth, state, found)
+            else:
+                self._compressed(f, kind, name, depth, state, found)
+        except ArchiveLimitExceeded:
+            raise
+        except _ERRORS:
+            pass    # damaged, truncated or encrypted: judged by its outer digest only
+
+    def _zip(self, f, name, depth, state, found):
+        with zipfile.ZipFile(f) as z:
+            for info in z.infolist():
+                if info.is_dir():
+                    continue
+                try:
+                    with z.open(info) as member:
+                        self._member(member, f"{name}!/{info.filename}", depth, state, found,
+                                     info.compress_size, info.file_size)
+                except ArchiveLimitExceeded:
+                    raise
+                except _ERRORS:
+                    continue
+
+    # Streaming mode reads members in order and never seeks. raw counts the
+    # compressed bytes under a .tar.gz (or .xz, .bz2) for the ratio check.
+    # A member that fails is skipped; the stream moves on to the next one.
+    def _tar(self, f, name, depth, state, found, raw=None):
+        with tarfile.open(fileobj=f, mode="r|") as t:
+            for info in t:
+                if not info.isfile():
+                    continue
+                member = t.extractfile(info)
+                if member is None:
+                    continue
+                try:
+                    self._member(member, f"{name}!/{info.name}", depth, state, found, raw, info.size)
+                except ArchiveLimitExceeded:
+                    raise
+                except _ERRORS:
+                    continue
+
+    def _compressed(self, f, kind, name, depth, state, found):
+        raw = _Counter(f)
+        stream = _OPENERS[kind](raw)
+        head = stream.read(SNIFF_SIZE)
+        body = io.BufferedReader(_Prefixed(head, stream), CHUNK_SIZE)
+        if archive_kind(head) == "tar":
+            # .tar.gz and friends: the tar inside is the archive.
+            self._tar(body, name, depth, state, found, raw)
+            return
+        inner = os.path.basename(name.rsplit("!/", 1)[-1])
+        for suffix in _SUFFIXES[kind]:
+            if inner.lower().endswith(suffix) and len(inner) > len(suffix):
+                inner = inner[:-len(suffix)]
+                break
+        self._member(body, f"{name}!/{inner}", depth, state, found, raw)
+
+    # Hash (and content-match) one member while reading it; nested archives
+    # are buffered so they can be opened after the read.
+    # packed is the member's compressed size, or a _Counter of the
+    # compressed bytes read so far, for the ratio check. size is its
+    # uncompressed size (None when a gzip, xz or bzip2 stream does not say),
+    # which EOF-anchored content signatures need.
+    def _member(self, stream, name, depth, state, found, packed, size=None):
+        state["members"] += 1
+        if state["members"] > self.max_members:
+            raise ArchiveLimitExceeded(f"more than {self.max_members} members")
+        hashers = new_hashers(self.algorithms)
+        updaters = [h.update for h in hashers.values()]
+        scan = None
+        if self.content is not None:
+            scan = self.content.session()
+            scan.start(size)
+            updaters.append(scan.update)
+        sketch = None
+        if self.similarity is not None:
+            sketch = self.similarity.session()
+            sketch.start(size)
+            updaters.append(sketch.update)
+        nested = None
+        kind = None
+        read = 0
+        while True:
+            block = stream.read(CHUNK_SIZE)
+            if not block:
+                break
+            if read == 0 and depth < self.max_depth:
+                kind = archive_kind(block[:SNIFF_SIZE])
+                if kind is not None:
+                    nested = io.BytesIO()
+            read += len(block)
+            state["bytes"] += len(block)
+            if state["bytes"] > self.max_bytes:
+                raise ArchiveLimitExceeded(f"more than {self.max_bytes} bytes unpacked")
+            packed_bytes = packed.count if isinstance(packed, _Counter) else packed
+            if read >= RATIO_MIN_BYTES and packed_bytes is not None and read / max(packed_bytes, 1) > self.max_ratio:
+                raise ArchiveLimitExceeded(f"compression ratio over {self.max_ratio}")
+            for update in updaters:
+                update(block)
+            if nested is not None:
+                if read > self.max_buffer:
+                    nested = None
+                else:
+                    nested.write(block)
+        digests = {name_: h.hexdigest() for name_, h in hashers.items()}
+        matched = match_digests(digests, self.bad_hashes)
+        if not matched and scan is not None:
+            hits = scan.finish()
+            if hits:
+                matched = f"content:{hits[0][0]}"
+        if not matched and sketch is not None:
+            best = self.similarity.match(sketch.finish())
+            if best:
+                matched = format_match(*best)
+        if matched:
+            found.append([name, matched])
+        if nested is not None:
+            nested.seek(0)
+            self._archive(nested, kind, name, depth + 1, state, found)
+
+    def stats(self):
+        with self._lock:
+            return {"archives": self.archives, "members": self.members,
+                    "bytes_unpacked": self.bytes_unpacked, "limits_hit": self.limits_hit}
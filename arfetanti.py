@@ -1,14 +1,29 @@
-
 # Antigus - Premium Free Antivirus (Starter Template)
+#
+# Importing this module has no side effects and loads neither Qt nor
+# psutil, nor the network and archive libraries: those are imported by the
+# functions that need them, so a headless scan (antigus_cli.py) starts fast.
 
 import os
+import sys
 import time
 import platform
 import json
-from scanner_utils import is_malicious
-from quarantine import quarantine_file, list_quarantine
-from dashboard import show_dashboard
-from updater_utils import fetch_definitions
+import threading
+from scan_pipeline import (scan_tree, hash_file, split_content_verdict, split_archive_verdict,
+                           split_similarity_verdict, DEFAULT_WORKERS, DEFAULT_QUEUE_DEPTH)
+from hash_cache import HashCache, HASH_CACHE_FILE
+from prefilter import build_prefilter
+from scan_checkpoint import ScanCheckpointer
+from scan_scheduler import ScanScheduler
+from scan_exclusions import ScanExclusions
+from scan_metrics import (METRICS, METRICS_FILE, TextfileWriter, SamplingProfiler, serve_metrics,
+                          delta as metrics_delta)
+from scan_journal import ScanJournal, VERBOSITY_THREATS, VERBOSITY_FILES, latest_journal, read_journal
+from scanner_utils import DEFAULT_ALGORITHMS, IO_BUFFERED, match_digests
+from quarantine import (quarantine_file, list_quarantine, count_quarantine, purge_quarantine,
+                        print_quarantine)
+from signature_store import SIGNATURE_STORE_FILE, load_definitions
 
 # --- OS Selection (First Run) ---
 CONFIG_FILE = "antivirus_config.json"
@@ -30,53 +45,350 @@ def select_os_once():
     return chosen
 
 # --- Updater Module ---
+# The signature store; empty until definitions are loaded or updated.
+BAD_HASHES = []
+# Byte-pattern signatures (content_signatures.py); None when there are none.
+CONTENT_SIGNATURES = None
+# Similarity digests of known samples (similarity_hash.py), matching their
+# variants; None when there are none.
+SIMILARITY_SIGNATURES = None
+# Lowest similarity score (0-100) reported as a threat.
+SIMILARITY_THRESHOLD = 50
+
+def _load_similarity_signatures():
+    from similarity_hash import SIMILARITY_SIGNATURES_FILE, load_similarity_signatures
+    return load_similarity_signatures(SIMILARITY_SIGNATURES_FILE, SIMILARITY_THRESHOLD)
+
 def update_definitions():
+    from updater_utils import update_signature_store
+    from content_signatures import CONTENT_SIGNATURES_FILE, load_content_signatures
     print("Updating virus definitions...")
     # Example: Fetch from a public source (replace URL with a real one)
     url = "https://example.com/virus_hashes.txt"
-    global BAD_HASHES
-    BAD_HASHES = fetch_definitions(url)
-    print("Definitions updated.")
+    global BAD_HASHES, CONTENT_SIGNATURES, SIMILARITY_SIGNATURES
+    # Falls back to the last compiled store if the download fails.
+    BAD_HASHES, updated = update_signature_store(url, SIGNATURE_STORE_FILE)
+    CONTENT_SIGNATURES = load_content_signatures(CONTENT_SIGNATURES_FILE)
+    SIMILARITY_SIGNATURES = _load_similarity_signatures()
+    print(f"{'Definitions updated' if updated else 'Update failed, using the last definitions'}: "
+          f"{len(BAD_HASHES)} signatures, "
+          f"{len(CONTENT_SIGNATURES or [])} content signatures, "
+          f"{len(SIMILARITY_SIGNATURES or [])} similarity signatures.")
+    return updated
+
+# Example: Use the last compiled definitions, without going to the network.
+def load_local_definitions():
+    from content_signatures import CONTENT_SIGNATURES_FILE, load_content_signatures
+    global BAD_HASHES, CONTENT_SIGNATURES, SIMILARITY_SIGNATURES
+    BAD_HASHES = load_definitions(SIGNATURE_STORE_FILE)
+    CONTENT_SIGNATURES = load_content_signatures(CONTENT_SIGNATURES_FILE)
+    SIMILARITY_SIGNATURES = _load_similarity_signatures()
 
 
 # --- Scanner Module ---
-def scan_system(path="/"):
+# workers=0 scans on a single thread; queue_depth bounds files in flight.
+SCAN_WORKERS = DEFAULT_WORKERS
+SCAN_QUEUE_DEPTH = DEFAULT_QUEUE_DEPTH
+# Digests of unchanged files are reused across scans; set to None to disable.
+SCAN_CACHE_FILE = HASH_CACHE_FILE
+# VERBOSITY_FILES also journals and prints every clean file.
+SCAN_VERBOSITY = VERBOSITY_THREATS
+# Load-aware scheduling: shrink the pool or pause when the host is busy,
+# and run scan threads at idle CPU/IO priority. The budgets are off when
+# None: SCAN_CPU_BUDGET is percent of one core (below what one worker uses,
+# the scan rests for part of each second), SCAN_BYTES_PER_SEC caps reads.
+SCAN_ADAPTIVE = True
+SCAN_IDLE_PRIORITY = True
+SCAN_CPU_BUDGET = None
+SCAN_BYTES_PER_SEC = None
+# gitignore-style patterns kept out of scans, matched against absolute
+# paths; "scan_exclude" in antivirus_config.json adds to them. /proc, /sys,
+# /dev, network and FUSE mounts are skipped by filesystem type regardless.
+SCAN_EXCLUDES = ["*.swp"]
+# Stay on the filesystem the scan started on.
+SCAN_ONE_FILESYSTEM = False
+# Look inside zip, tar, gzip, xz and bzip2 files (limits in archive_scanner.py).
+SCAN_ARCHIVES = True
+# Write a manifest (paths, sizes, mtimes, digests) of each completed scan to
+# MANIFEST_DIR, for rematch_manifests() when definitions change. Every file
+# is then hashed, as the size prefilter cannot skip any.
+SCAN_MANIFESTS = False
+# scanner_utils.IO_CACHE_FRIENDLY reads files around the page cache, in
+# inode order, so a full scan does not evict the working set of databases
+# and services on the same host; IO_BUFFERED reads them like anything else.
+SCAN_IO_MODE = IO_BUFFERED
+# Per-stage metrics in Prometheus text format: rewritten to SCAN_METRICS_FILE
+# while scans run, and served on SCAN_METRICS_SOCKET (a unix socket path)
+# when set. Either is off when None.
+SCAN_METRICS_FILE = METRICS_FILE
+SCAN_METRICS_SOCKET = None
+# Sample every scan thread's stack and write folded stacks (for flame
+# graphs) to this path after each scan; None leaves the profiler off.
+SCAN_PROFILE_FILE = None
+
+def open_hash_cache():
+    if not SCAN_CACHE_FILE:
+        return None
+    try:
+        return HashCache(SCAN_CACHE_FILE)
+    except Exception as e:
+        print(f"Hash cache unavailable: {e}")
+        return None
+
+def open_archive_scanner():
+    if not SCAN_ARCHIVES:
+        return None
+    from archive_scanner import ArchiveScanner
+    return ArchiveScanner(BAD_HASHES, CONTENT_SIGNATURES, similarity=SIMILARITY_SIGNATURES)
+
+def open_manifest(path):
+    if not SCAN_MANIFESTS:
+        return None
+    from scan_manifest import ManifestWriter, manifest_path
+    try:
+        return ManifestWriter(manifest_path(path), path)
+    except OSError as e:
+        print(f"Could not start a scan manifest: {e}")
+        return None
+
+def scan_exclusions():
+    import quarantine
+    patterns = list(SCAN_EXCLUDES)
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE) as f:
+            patterns += json.load(f).get("scan_exclude", [])
+    # Never rescan what has already been quarantined.
+    patterns.append(os.path.abspath(quarantine.QUARANTINE_DIR) + "/")
+    return ScanExclusions(patterns, one_filesystem=SCAN_ONE_FILESYSTEM)
+
+# Example: Run a journaled, checkpointed scan with the hash cache and
+# prefilter. Returns (threats, summary); the summary is what was written to
+# the journal plus "journal" (its path). Shared by the CLI and the GUI scan
+# worker. resume=True continues from the last checkpoint of a scan of path.
+# scan_daemon passes its open hash cache and hashing pool, which are kept
+# open afterwards. With a ranked quick_scan.QuickScan, its files are scanned
+# in rank order instead of walking path, without a checkpoint or manifest,
+# and the summary gets its "coverage".
+def run_scan(path="/", on_result=None, workers=None, queue_depth=None, verbosity=None,
+             stop_event=None, progress=None, resume=False, cache=None, executor=None, quick=None):
+    # The checkpoint and manifest are keyed on the root, and exclusions
+    # match absolute paths, so "." and its absolute path are the same scan.
+    path = os.path.abspath(path)
+    verbosity = SCAN_VERBOSITY if verbosity is None else verbosity
+    journal = ScanJournal(path, verbosity=verbosity)
+    checkpoint = ScanCheckpointer(path, resume=resume) if quick is None else None
+    summary = {}
+    if checkpoint is not None and checkpoint.state:
+        print(f"Resuming scan of {path}: {checkpoint.files_done()} files already scanned.")
+        journal.event("resume", files=checkpoint.files_done(), started=checkpoint.started)
+        for fpath, matched in checkpoint.threats():
+            journal.file(fpath, matched)
+        # The count goes on from the interrupted scan, whose files include
+        # the threats just replayed.
+        journal.files = checkpoint.files_done()
+        summary["resumed_files"] = checkpoint.files_done()
+    def record(fpath, matched):
+        journal.file(fpath, matched)
+        if on_result:
+            on_result(fpath, matched)
+    own_cache = cache is None
+    if own_cache:
+        cache = open_hash_cache()
+    # A shared cache has counted earlier scans too; report this one's share.
+    cache_before = (cache.hits, cache.misses) if cache else (0, 0)
+    prefilter = build_prefilter(BAD_HASHES)
+    workers = SCAN_WORKERS if workers is None else workers
+    scheduler = ScanScheduler(workers, cpu_budget=SCAN_CPU_BUDGET, bytes_per_sec=SCAN_BYTES_PER_SEC,
+                              adaptive=SCAN_ADAPTIVE, idle_priority=SCAN_IDLE_PRIORITY, journal=journal)
+    scheduler.start()
+    exclusions = scan_exclusions()
+    archives = open_archive_scanner()
+    # A resumed or quick scan only sees part of the tree.
+    manifest = open_manifest(path) if checkpoint is not None and not checkpoint.state else None
+    if SCAN_METRICS_SOCKET:
+        serve_metrics(SCAN_METRICS_SOCKET)
+    metrics_file = TextfileWriter(SCAN_METRICS_FILE).start() if SCAN_METRICS_FILE else None
+    profiler = SamplingProfiler().start() if SCAN_PROFILE_FILE else None
+    before = METRICS.snapshot()
+    try:
+        threats = scan_tree(path, BAD_HASHES, workers=workers,
+                            queue_depth=queue_depth or SCAN_QUEUE_DEPTH,
+                            on_result=record, cache=cache, prefilter=prefilter,
+                            stop_event=stop_event, progress=progress, checkpoint=checkpoint,
+                            scheduler=scheduler, exclusions=exclusions, content=CONTENT_SIGNATURES,
+                            archives=archives, executor=executor, manifest=manifest,
+                            similarity=SIMILARITY_SIGNATURES, entries=quick.entries() if quick else None,
+                            io_mode=SCAN_IO_MODE)
+        summary["complete"] = not (stop_event and stop_event.is_set())
+        if manifest is not None and summary["complete"]:
+            try:
+                summary["manifest"] = manifest.close()
+            except OSError as e:
+                print(f"Could not write the scan manifest: {e}")
+    finally:
+        if manifest is not None:
+            manifest.discard()
+        scheduler.stop()
+        summary["metrics"] = metrics_delta(before, METRICS.snapshot())
+        if metrics_file:
+            metrics_file.stop()
+        if profiler:
+            profiler.stop().write(SCAN_PROFILE_FILE)
+            summary["profile"] = SCAN_PROFILE_FILE
+        summary["scheduler"] = scheduler.stats()
+        summary["exclusions"] = exclusions.stats()
+        if archives:
+            summary["archives"] = archives.stats()
+        if cache:
+            if own_cache:
+                cache.close()
+            stats = cache.stats()
+            stats["hits"] -= cache_before[0]
+            stats["misses"] -= cache_before[1]
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            summary["cache"] = stats
+        if prefilter:
+            summary["prefilter"] = prefilter.report()
+        if SIMILARITY_SIGNATURES:
+            summary["similarity"] = SIMILARITY_SIGNATURES.stats()
+        if quick is not None:
+            summary["coverage"] = quick.coverage()
+        journal.close(**summary)
+    summary["files"] = journal.files
+    summary["journal"] = journal.path
+    return threats, summary
+
+# Example: Rank the files under path by risk from their metadata and scan
+# the riskiest first, until time_budget seconds or byte_budget bytes are
+# spent (quick_scan's defaults when None, no limit when 0). Returns
+# (threats, summary) like run_scan, with the "coverage" achieved.
+def run_quick_scan(path="/", on_result=None, time_budget=None, byte_budget=None, stop_event=None,
+                   progress=None, cache=None, executor=None):
+    import quick_scan
+    time_budget = quick_scan.QUICK_SCAN_TIME_BUDGET if time_budget is None else time_budget
+    byte_budget = quick_scan.QUICK_SCAN_BYTE_BUDGET if byte_budget is None else byte_budget
+    plan = quick_scan.QuickScan(path, time_budget or None, byte_budget or None, stop_event)
+    exclusions = scan_exclusions()
+    exclusions.start(plan.path)
+    plan.rank(exclusions)
+    return run_scan(plan.path, on_result, queue_depth=quick_scan.QUICK_SCAN_QUEUE_DEPTH,
+                    stop_event=stop_event, progress=progress, cache=cache, executor=executor, quick=plan)
+
+# Example: Print one line on how much of a quick scan's candidates it covered.
+def print_coverage(coverage):
+    stopped = {"time": "time budget spent", "bytes": "byte budget spent", "stopped": "stopped",
+               "limit": f"{coverage['candidates_dropped']} lower-ranked candidates not kept"}
+    print(f"Quick scan: {coverage['files']} of {coverage['candidates']} candidates "
+          f"({coverage['file_coverage']:.0%} of files, {coverage['byte_coverage']:.0%} of bytes, "
+          f"{coverage['risk_covered']:.0%} of risk), "
+          f"{stopped.get(coverage['stopped_by'], 'all candidates scanned')}"
+          + ("" if coverage["walk_complete"] else "; the candidate walk was cut short") + ".")
+    if coverage["highest_unscanned"]:
+        top = coverage["highest_unscanned"]
+        print(f"Highest-risk file not scanned: {top['path']} ({', '.join(top['reasons'])}).")
+
+# quick=True runs run_quick_scan with the given budgets instead.
+def scan_system(path="/", workers=None, queue_depth=None, verbosity=None, resume=False, quick=False,
+                time_budget=None, byte_budget=None):
     print(f"Scanning {path} for threats...")
-    threats = []
-    for root, dirs, files in os.walk(path):
-        for file in files:
-            fpath = os.path.join(root, file)
-            if is_malicious(fpath, BAD_HASHES):
-                print(f"Threat detected: {fpath}")
-                quarantine_file(fpath)
-                threats.append(fpath)
-            else:
-                print(f"Scanned: {fpath}")
-    print(f"Scan complete. {len(threats)} threats quarantined.")
+    verbosity = SCAN_VERBOSITY if verbosity is None else verbosity
+    from similarity_hash import describe_match
+    def report(fpath, matched):
+        if matched:
+            print(f"Threat detected: {fpath}" + describe_match(matched))
+        elif verbosity >= VERBOSITY_FILES:
+            print(f"Scanned: {fpath}")
+    if quick:
+        threats, summary = run_quick_scan(path, report, time_budget, byte_budget)
+    else:
+        threats, summary = run_scan(path, report, workers, queue_depth, verbosity, resume=resume)
+    resumed = f" ({summary['resumed_files']} before resuming)" if summary.get("resumed_files") else ""
+    print(f"Scan complete. {summary['files']} files scanned{resumed}, {len(threats)} threats quarantined.")
+    if "cache" in summary:
+        stats = summary["cache"]
+        print(f"Hash cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%}).")
+    if "prefilter" in summary:
+        stats = summary["prefilter"]
+        print(f"Prefilter: skipped {stats['skipped_by_size']} of {stats['files']} files "
+              f"({stats['skip_ratio']:.0%}, {stats['bytes_skipped']} bytes unread), "
+              f"Bloom false-positive rate {stats['bloom_false_positive_rate']:.4%}.")
+        if stats["sniffed_for_archives"]:
+            print(f"Prefilter: {stats['sniffed_for_archives']} skipped files were still checked for "
+                  f"archive magic.")
+    if "similarity" in summary:
+        stats = summary["similarity"]
+        print(f"Similarity: {stats['lookups']} digests checked against {stats['signatures']} signatures, "
+              f"{stats['candidates_per_lookup']} candidates each.")
+    if summary.get("archives", {}).get("archives"):
+        stats = summary["archives"]
+        print(f"Archives: {stats['archives']} opened, {stats['members']} members, "
+              f"{stats['bytes_unpacked']} bytes unpacked, {stats['limits_hit']} stopped at a limit.")
+    stages = summary["metrics"]["stage_seconds"]
+    print("Time per stage: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in stages.items())
+          + f"; {summary['metrics']['counters']['bytes_read']} bytes read.")
+    stats = summary["exclusions"]
+    if any(stats.values()):
+        print(f"Excluded: {stats['dirs_skipped']} directories, {stats['files_skipped']} files, "
+              f"{stats['hardlinks_skipped']} duplicate hard links.")
+    if "profile" in summary:
+        print(f"Profile (folded stacks): {summary['profile']}")
+    if "manifest" in summary:
+        print(f"Scan manifest: {summary['manifest']}")
+    if "coverage" in summary:
+        print_coverage(summary["coverage"])
+    print(f"Scan journal: {summary['journal']}")
     return threats
 
+# Example: Check the files recorded in scan manifests against the current
+# definitions, without reading them again. paths are manifest files or
+# directories of them (e.g. manifests collected from other hosts); the
+# default is this host's MANIFEST_DIR. Returns the hits.
+def rematch_manifests(paths=None, definitions=None):
+    from scan_manifest import MANIFEST_DIR, find_manifests, rematch
+    manifests = find_manifests(paths or [MANIFEST_DIR])
+    started = time.monotonic()
+    hits = rematch(manifests, BAD_HASHES if definitions is None else definitions)
+    for hit in hits:
+        print(f"Match on {hit['host']}: {hit['path']} ({hit['algorithm']} {hit['digest']})")
+    print(f"Rematched {len(manifests)} manifests in {time.monotonic() - started:.2f}s: {len(hits)} hits.")
+    return hits
+
 # --- Cleaner Module ---
 def clean_quarantine():
-    files = list_quarantine()
-    if not files:
+    removed = purge_quarantine()
+    if not removed:
         print("No files to clean.")
         return
-    for f in files:
-        try:
-            os.remove(f)
-            print(f"Removed: {f}")
-        except Exception as e:
-            print(f"Failed to remove {f}: {e}")
-    print("Quarantine cleaned.")
+    print(f"Quarantine cleaned: {removed} items removed.")
 
 # --- Report Module ---
+# Built from the most recent scan journal; only scans if there is none.
 def generate_report():
     print("Generating security report...")
-    threats = scan_system()
-    files = list_quarantine()
+    path = latest_journal()
+    if path is None:
+        scan_system()
+        path = latest_journal()
+    from similarity_hash import parse_match
+    journal = read_journal(path)
+    summary = journal["summary"] or {}
+    similar = []
+    for t in journal["threats"]:
+        match = parse_match(t.get("digest"))
+        if match:
+            similar.append(dict(match, path=t["path"]))
     report = {
-        "threats_found": len(threats),
-        "quarantined": files,
+        "threats_found": len(journal["threats"]),
+        "threats": [t["path"] for t in journal["threats"]],
+        # Variants of known samples: [{"path", "signature", "score"}, ...]
+        "similarity_matches": similar,
+        "scan_root": (journal["start"] or {}).get("root"),
+        "scan_time": time.ctime((journal["start"] or {}).get("time", 0)),
+        "scan_complete": bool(summary.get("complete")),
+        "files_scanned": summary.get("files"),
+        "quarantined": count_quarantine(),
+        "recently_quarantined": [item["path"] for item in list_quarantine()],
         "os": platform.system(),
         "time": time.ctime()
     }
@@ -85,437 +397,180 @@ def generate_report():
     print("Report saved to antivirus_report.json.")
 
 # --- Monitor Module ---
-def start_monitoring():
-    print("Real-time protection enabled.")
-    # Simulate monitoring loop (demo)
-    for i in range(3):
-        print(f"[Monitor] System check {i+1}...")
-        time.sleep(1)
-    print("Monitoring complete.")
+# Trees watched for new and rewritten files; "monitor_paths" in
+# antivirus_config.json overrides this.
+MONITOR_PATHS = [os.path.expanduser("~"), "/tmp"]
+MONITOR_REPORT_INTERVAL = 10
+
+def monitored_paths():
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE) as f:
+            paths = json.load(f).get("monitor_paths")
+        if paths:
+            return paths
+    return MONITOR_PATHS
+
+def check_file(fpath):
+    algorithms = getattr(BAD_HASHES, "algorithms", DEFAULT_ALGORITHMS)
+    archives = open_archive_scanner()
+    digests = hash_file(fpath, algorithms, CONTENT_SIGNATURES, archives, SIMILARITY_SIGNATURES)
+    digests, content_match = split_content_verdict(digests, CONTENT_SIGNATURES)
+    digests, similar_match = split_similarity_verdict(digests, SIMILARITY_SIGNATURES)
+    digests, members = split_archive_verdict(digests, archives)
+    matched = match_digests(digests, BAD_HASHES) or content_match or similar_match
+    for member, _ in members:
+        print(f"[Monitor] Threat detected: {member}")
+    if matched or members:
+        if matched:
+            print(f"[Monitor] Threat detected: {fpath}")
+        quarantine_file(fpath, matched or members[0][1])
+
+# Example: Rescan a tree whose monitor events were lost, with the same
+# checks as a scan: digests, content, archives and similarity. Threats are
+# quarantined as the monitor's are.
+def rescan_tree(directory, exclusions):
+    from similarity_hash import describe_match
+    def report(fpath, matched):
+        if matched:
+            print(f"[Monitor] Threat detected: {fpath}{describe_match(matched)}")
+    archives = open_archive_scanner()
+    cache = open_hash_cache()
+    try:
+        return scan_tree(directory, BAD_HASHES, workers=SCAN_WORKERS, on_result=report, cache=cache,
+                         prefilter=build_prefilter(BAD_HASHES), exclusions=exclusions,
+                         content=CONTENT_SIGNATURES, archives=archives, similarity=SIMILARITY_SIGNATURES,
+                         io_mode=SCAN_IO_MODE)
+    finally:
+        if cache:
+            cache.close()
+
+def _monitor_loop(monitor, stop_after=None):
+    started = time.time()
+    while stop_after is None or time.time() - started < stop_after:
+        time.sleep(MONITOR_REPORT_INTERVAL)
+        # Events were lost for these trees, so check them the slow way,
+        # keeping out of the same paths as a scan.
+        for directory in monitor.take_overflow_dirs():
+            if monitor.exclusions.excludes_path(directory, is_dir=True):
+                continue
+            rescan_tree(directory, monitor.exclusions)
+        stats = monitor.stats()
+        print(f"[Monitor] {stats['events_per_sec']} events/s, {stats['checked']} files checked, "
+              f"{stats['pending']} pending, queue lag {stats['max_queue_lag']:.3f}s max")
+
+# Blocks until ctrl-C (or stop_after seconds) unless block=False, in which
+# case the running monitor is returned and the caller must stop() it.
+# inotify and fanotify are Linux only; elsewhere this returns None.
+def start_monitoring(block=True, stop_after=None):
+    if not sys.platform.startswith("linux"):
+        print("Real-time protection is only available on Linux.")
+        return None
+    from realtime_monitor import RealtimeMonitor
+    # Files moved into the quarantine vault must not come back as events.
+    monitor = RealtimeMonitor(monitored_paths(), check_file, exclusions=scan_exclusions())
+    monitor.start()
+    print(f"Real-time protection enabled ({monitor.backend}).")
+    if not block:
+        threading.Thread(target=_monitor_loop, args=(monitor,), daemon=True).start()
+        return monitor
+    try:
+        _monitor_loop(monitor, stop_after)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        monitor.stop()
+    print("Monitoring stopped.")
+
+# --- Process Scanner Module ---
+# Shared by the CLI and the GUI; each call only examines processes started
+# since the previous one and reports every suspicious process still running.
+_process_scanner = None
+
+def get_process_scanner():
+    from process_scanner import ProcessScanner, load_process_patterns
+    global _process_scanner
+    if _process_scanner is None:
+        _process_scanner = ProcessScanner(load_process_patterns(), cache=open_hash_cache())
+    _process_scanner.bad_hashes = BAD_HASHES
+    return _process_scanner
+
+# Example: Close the shared process scanner and the hash cache it holds;
+# the next get_process_scanner() opens a new one.
+def close_process_scanner():
+    global _process_scanner
+    if _process_scanner is not None:
+        _process_scanner.close()
+        _process_scanner = None
+
+def suspicious_software_report():
+    from process_scanner import format_finding
+    try:
+        findings = get_process_scanner().running_findings()
+    except ImportError:
+        return "psutil not installed. Run 'pip install psutil' for advanced detection."
+    if not findings:
+        return "No suspicious software found."
+    return "Suspicious software detected:\n" + "\n".join(format_finding(p) for p in findings)
+
+def detect_suspicious_software():
+    print("Detecting suspicious software...")
+    print(suspicious_software_report())
 
 # --- Quarantine Module ---
+# Shows the newest page; quarantine.py lists the rest.
 def show_quarantine():
-    files = list_quarantine()
-    if files:
-        print("Quarantined files:")
-        for f in files:
-            print(f"- {f}")
+    if count_quarantine():
+        print_quarantine()
     else:
         print("Quarantine is empty.")
 
-from PyQt5 import QtWidgets, QtGui, QtCore
-
-
 APP_NAME = "Antigus"
 APP_VERSION = "1.0.0"
 GIT_URL = "https://github.com/arduinoUNO65/antigus/archive/refs/heads/main.zip"
-PROGRESS_FILE = "antigus_progress.json"
-
-# Write version info to file
-with open("antigus_version.txt", "w") as vf:
-    vf.write(f"{APP_NAME} v{APP_VERSION}\n")
-
-# Load or initialize persistent settings
-def load_progress():
-    if os.path.exists(PROGRESS_FILE):
-        with open(PROGRESS_FILE) as f:
-            return json.load(f)
-    return {"theme": "light", "scans": 0, "threats": 0}
-
-def save_progress(data):
-    with open(PROGRESS_FILE, "w") as f:
-        json.dump(data, f)
-
-progress = load_progress()
-
-class MainWindow(QtWidgets.QMainWindow):
-
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle(f"{APP_NAME} - Premium Free Antivirus")
-        self.setGeometry(100, 100, 900, 600)
-        self.theme = progress.get("theme", "light")
-        self.apply_theme()
-
-        # Sidebar
-        sidebar = QtWidgets.QFrame()
-        sidebar.setFixedWidth(180)
-        sidebar.setStyleSheet("background: #181a1b; border-top-right-radius: 18px; border-bottom-right-radius: 18px;")
-        sidebar_layout = QtWidgets.QVBoxLayout()
-        sidebar_layout.setAlignment(QtCore.Qt.AlignTop)
-        logo = QtWidgets.QLabel(f"<h2 style='color:#00ff99; text-align:center;'>🛡️<br>{APP_NAME}</h2><p style='color:#888; font-size:0.9em;'>A trusted friend for your PC</p>")
-        logo.setAlignment(QtCore.Qt.AlignCenter)
-        sidebar_layout.addWidget(logo)
-        self.btn_dashboard = QtWidgets.QPushButton("Dashboard")
-        self.btn_dashboard.setStyleSheet(self.sidebar_btn_style(True))
-        self.btn_scan = QtWidgets.QPushButton("Scan")
-        self.btn_scan.setStyleSheet(self.sidebar_btn_style(False))
-        self.btn_quarantine = QtWidgets.QPushButton("Quarantine")
-        self.btn_quarantine.setStyleSheet(self.sidebar_btn_style(False))
-        self.btn_update = QtWidgets.QPushButton("Update")
-        self.btn_update.setStyleSheet(self.sidebar_btn_style(False))
-        self.btn_tools = QtWidgets.QPushButton("Tools")
-        self.btn_tools.setStyleSheet(self.sidebar_btn_style(False))
-        self.btn_settings = QtWidgets.QPushButton("Settings")
-        self.btn_settings.setStyleSheet(self.sidebar_btn_style(False))
-        for btn in [self.btn_dashboard, self.btn_scan, self.btn_quarantine, self.btn_update, self.btn_tools, self.btn_settings]:
-            btn.setCursor(QtCore.Qt.PointingHandCursor)
-            sidebar_layout.addWidget(btn)
-        sidebar_layout.addStretch()
-        sidebar.setLayout(sidebar_layout)
-
-        # Main content area (stacked)
-        self.stack = QtWidgets.QStackedWidget()
-        self.page_dashboard = self.build_dashboard()
-        self.page_scan = self.build_scan()
-        self.page_quarantine = self.build_quarantine()
-        self.page_update = self.build_update()
-        self.page_tools = self.build_tools()
-        self.page_settings = self.build_settings()
-        self.stack.addWidget(self.page_dashboard)
-        self.stack.addWidget(self.page_scan)
-        self.stack.addWidget(self.page_quarantine)
-        self.stack.addWidget(self.page_update)
-        self.stack.addWidget(self.page_tools)
-        self.stack.addWidget(self.page_settings)
-
-        # Layout
-        main_layout = QtWidgets.QHBoxLayout()
-        main_layout.addWidget(sidebar)
-        main_layout.addWidget(self.stack)
-        container = QtWidgets.QWidget()
-        container.setLayout(main_layout)
-        self.setCentralWidget(container)
-
-        # Connect sidebar
-        self.btn_dashboard.clicked.connect(lambda: self.switch_page(0))
-        self.btn_scan.clicked.connect(lambda: self.switch_page(1))
-        self.btn_quarantine.clicked.connect(lambda: self.switch_page(2))
-        self.btn_update.clicked.connect(lambda: self.switch_page(3))
-        self.btn_tools.clicked.connect(lambda: self.switch_page(4))
-        self.btn_settings.clicked.connect(lambda: self.switch_page(5))
-
-    def sidebar_btn_style(self, active):
-        if active:
-            return "background:#00ff99; color:#181a1b; font-weight:bold; border-radius:10px; margin:8px 0; padding:12px; font-size:1.1em;"
-        return "background:transparent; color:#fff; font-weight:bold; border-radius:10px; margin:8px 0; padding:12px; font-size:1.1em;"
-
-    def switch_page(self, idx):
-        btns = [self.btn_dashboard, self.btn_scan, self.btn_quarantine, self.btn_update, self.btn_tools, self.btn_settings]
-        for i, btn in enumerate(btns):
-            btn.setStyleSheet(self.sidebar_btn_style(i == idx))
-        self.stack.setCurrentIndex(idx)
-
-    def build_update(self):
-        page = QtWidgets.QWidget()
-        layout = QtWidgets.QVBoxLayout()
-        title = QtWidgets.QLabel("<h2 style='color:#00c3ff;'>Update Antigus</h2>")
-        title.setAlignment(QtCore.Qt.AlignCenter)
-        layout.addWidget(title)
-        self.update_btn = QtWidgets.QPushButton("Update from GitHub")
-        self.update_btn.setStyleSheet("background:#00c3ff; color:#fff; font-weight:bold; border-radius:10px; padding:12px; font-size:1.1em;")
-        self.update_btn.clicked.connect(self.start_update)
-        layout.addWidget(self.update_btn)
-        self.update_progress = QtWidgets.QProgressBar()
-        self.update_progress.setStyleSheet("background:#333; color:#00c3ff; border-radius:8px; height:24px;")
-        layout.addWidget(self.update_progress)
-        self.update_status = QtWidgets.QLabel("<b>Status:</b> Ready for update.")
-        self.update_status.setStyleSheet("color:#00c3ff; font-size:1.1em;")
-        layout.addWidget(self.update_status)
-        github_label = QtWidgets.QLabel('<a href="https://github.com/arduinoUNO65/antigus" style="color:#00c3ff;">Visit Antigus on GitHub</a>')
-        github_label.setOpenExternalLinks(True)
-        github_label.setAlignment(QtCore.Qt.AlignCenter)
-        layout.addWidget(github_label)
-        page.setLayout(layout)
-        return page
-
-    def start_update(self):
-        import threading
-        def do_update():
-            import requests, shutil, tempfile, os
-            self.update_status.setText("<b>Status:</b> Downloading update...")
-            self.update_progress.setValue(0)
-            try:
-                tmp = tempfile.NamedTemporaryFile(delete=False)
-                with requests.get(GIT_URL, stream=True) as r:
-                    r.raise_for_status()
-                    total = int(r.headers.get('content-length', 0))
-                    downloaded = 0
-                    chunk_size = 8192
-                    for chunk in r.iter_content(chunk_size=chunk_size):
-                        if chunk:
-                            tmp.write(chunk)
-                            downloaded += len(chunk)
-                            percent = int((downloaded / total) * 100) if total else 0
-                            self.update_progress.setValue(percent)
-                            QtCore.QCoreApplication.processEvents()
-                tmp.close()
-                self.update_status.setText("<b>Status:</b> Update downloaded! (Not auto-installed)")
-            except Exception as e:
-                self.update_status.setText(f"<b>Status:</b> Update failed: {e}")
-                self.update_progress.setValue(0)
-        threading.Thread(target=do_update).start()
-
-    def build_tools(self):
-        page = QtWidgets.QWidget()
-        layout = QtWidgets.QVBoxLayout()
-        title = QtWidgets.QLabel("<h2 style='color:#2af598;'>Tools & Utilities</h2>")
-        title.setAlignment(QtCore.Qt.AlignCenter)
-        layout.addWidget(title)
-        self.sus_btn = QtWidgets.QPushButton("Detect Suspicious Software")
-        self.sus_btn.setStyleSheet("background:#2af598; color:#181a1b; font-weight:bold; border-radius:10px; padding:12px; font-size:1.1em;")
-        self.sus_btn.clicked.connect(self.detect_sus_software_gui)
-        layout.addWidget(self.sus_btn)
-        self.sus_result = QtWidgets.QTextEdit()
-        self.sus_result.setReadOnly(True)
-        self.sus_result.setStyleSheet("background:#222; color:#fff; border-radius:8px; font-size:1em;")
-        layout.addWidget(self.sus_result)
-        page.setLayout(layout)
-        return page
-
-    def detect_sus_software_gui(self):
-        try:
-            import psutil
-        except ImportError:
-            self.sus_result.setPlainText("psutil not installed. Run 'pip install psutil' for advanced detection.")
-            return
-        sus_processes = []
-        for proc in psutil.process_iter(['pid', 'name', 'exe', 'username']):
-            try:
-                pname = proc.info['name'] or ''
-                if any(s in pname.lower() for s in ['hack', 'crack', 'keygen', 'inject', 'miner', 'steal', 'spy', 'rat', 'trojan', 'suspicious']):
-                    sus_processes.append(proc.info)
-            except Exception:
-                continue
-        if sus_processes:
-            result = "Suspicious software detected:\n" + "\n".join([f"- {p['name']} (PID: {p['pid']}, User: {p['username']})" for p in sus_processes])
-        else:
-            result = "No suspicious software found."
-        self.sus_result.setPlainText(result)
-
-    def build_dashboard(self):
-        page = QtWidgets.QWidget()
-        layout = QtWidgets.QVBoxLayout()
-        title = QtWidgets.QLabel(f"""
-            <h1 style='color:#fff; font-size:2.2em; letter-spacing:2px; text-shadow:0 0 10px #00ff99;'>{APP_NAME}</h1>
-            <p style='color:#eee; font-size:1.1em;'>Premium Free Antivirus</p>
-        """)
-        title.setAlignment(QtCore.Qt.AlignCenter)
-        layout.addWidget(title)
-        self.status_label = QtWidgets.QLabel("<b>Status:</b> Ready")
-        self.status_label.setStyleSheet("color:#fff; font-size:1.1em;")
-        layout.addWidget(self.status_label)
-        self.resource_label = QtWidgets.QLabel("<b>Resources:</b> CPU: -- | RAM: -- | Disk: --")
-        self.resource_label.setStyleSheet("color:#fff; font-size:1.1em;")
-        layout.addWidget(self.resource_label)
-        version_label = QtWidgets.QLabel(f"<b>Version:</b> {APP_VERSION}")
-        version_label.setStyleSheet("color:#00ff99; font-size:1.1em;")
-        layout.addWidget(version_label)
-        layout.addStretch()
-        page.setLayout(layout)
-        # Timer for resource updates
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.update_resources)
-        self.timer.start(1000)
-        return page
-
-    def build_scan(self):
-        page = QtWidgets.QWidget()
-        layout = QtWidgets.QVBoxLayout()
-        title = QtWidgets.QLabel("<h2 style='color:#00ff99;'>System Scan</h2>")
-        title.setAlignment(QtCore.Qt.AlignCenter)
-        layout.addWidget(title)
-        self.scan_btn = QtWidgets.QPushButton("Start Scan")
-        self.scan_btn.setStyleSheet("background:#00ff99; color:#181a1b; font-weight:bold; border-radius:10px; padding:12px; font-size:1.1em;")
-        self.scan_btn.clicked.connect(self.start_scan)
-        layout.addWidget(self.scan_btn)
-        self.scan_progress = QtWidgets.QProgressBar()
-        self.scan_progress.setStyleSheet("background:#333; color:#00ff99; border-radius:8px; height:24px;")
-        layout.addWidget(self.scan_progress)
-        self.scan_result = QtWidgets.QTextEdit()
-        self.scan_result.setReadOnly(True)
-        self.scan_result.setStyleSheet("background:#222; color:#fff; border-radius:8px; font-size:1em;")
-        layout.addWidget(self.scan_result)
-        page.setLayout(layout)
-        return page
-
-    def build_quarantine(self):
-        page = QtWidgets.QWidget()
-        layout = QtWidgets.QVBoxLayout()
-        title = QtWidgets.QLabel("<h2 style='color:#ff61a6;'>Quarantine</h2>")
-        title.setAlignment(QtCore.Qt.AlignCenter)
-        layout.addWidget(title)
-        self.clean_btn = QtWidgets.QPushButton("Clean Quarantine")
-        self.clean_btn.setStyleSheet("background:#ff61a6; color:#fff; font-weight:bold; border-radius:10px; padding:12px; font-size:1.1em;")
-        self.clean_btn.clicked.connect(self.clean_quarantine)
-        layout.addWidget(self.clean_btn)
-        self.quarantine_list = QtWidgets.QTextEdit()
-        self.quarantine_list.setReadOnly(True)
-        self.quarantine_list.setStyleSheet("background:#222; color:#fff; border-radius:8px; font-size:1em;")
-        layout.addWidget(self.quarantine_list)
-        page.setLayout(layout)
-        return page
-
-    def build_settings(self):
-        page = QtWidgets.QWidget()
-        layout = QtWidgets.QVBoxLayout()
-        title = QtWidgets.QLabel("<h2 style='color:#ffd200;'>Settings</h2>")
-        title.setAlignment(QtCore.Qt.AlignCenter)
-        layout.addWidget(title)
-        # Version info
-        version_label = QtWidgets.QLabel(f"<b>Version:</b> {APP_VERSION}")
-        version_label.setStyleSheet("color:#ffd200; font-size:1.1em;")
-        layout.addWidget(version_label)
-        # Premium features info
-        premium_label = QtWidgets.QLabel("<b>Premium:</b> All features are free. No upsells. No paywall. Enjoy full protection!")
-        premium_label.setStyleSheet("color:#00ff99; font-size:1.1em;")
-        layout.addWidget(premium_label)
-        # Theme switcher
-        theme_label = QtWidgets.QLabel("<b>Theme:</b>")
-        theme_label.setStyleSheet("color:#fff; font-size:1.1em;")
-        layout.addWidget(theme_label)
-        self.theme_toggle = QtWidgets.QCheckBox("Enable dark theme")
-        self.theme_toggle.setChecked(self.theme == "dark")
-        self.theme_toggle.stateChanged.connect(self.toggle_theme)
-        layout.addWidget(self.theme_toggle)
-        # OS info
-        os_label = QtWidgets.QLabel(f"<b>OS:</b> {platform.system()}")
-        os_label.setStyleSheet("color:#fff; font-size:1.1em;")
-        layout.addWidget(os_label)
-        layout.addStretch()
-        page.setLayout(layout)
-        return page
-
-    def apply_theme(self):
-        if self.theme == "dark":
-            self.setStyleSheet("background: qlineargradient(x1:0, y1:0, x2:1, y2:1, stop:0 #232526, stop:1 #00ff99); color: #fff;")
-        else:
-            self.setStyleSheet("background: #fff; color: #222;")
-
-    def toggle_theme(self):
-        self.theme = "dark" if self.theme_toggle.isChecked() else "light"
-        progress['theme'] = self.theme
-        save_progress(progress)
-        self.apply_theme()
-
-    def update_resources(self):
-        try:
-            from monitor_utils import get_resource_usage
-            usage = get_resource_usage()
-            self.resource_label.setText(f"<b>Resources:</b> CPU: {usage['cpu_percent']}% | RAM: {usage['memory_percent']}% | Disk: {usage['disk_percent']}%")
-        except Exception:
-            self.resource_label.setText("<b>Resources:</b> CPU: -- | RAM: -- | Disk: --")
-
-    def start_scan(self):
-        self.status_label.setText("<b>Status:</b> Scanning...")
-        self.scan_progress.setValue(0)
-        self.scan_result.clear()
-        QtCore.QTimer.singleShot(100, self.fake_scan)
-
-    def fake_scan(self):
-        threats = []
-        import threading
-        def scan():
-            from scanner_utils import is_malicious
-            from quarantine import quarantine_file
-            import os
-            total = 100
-            count = 0
-            for root, dirs, files in os.walk("/"):
-                for file in files:
-                    fpath = os.path.join(root, file)
-                    count += 1
-                    if is_malicious(fpath, BAD_HASHES):
-                        quarantine_file(fpath)
-                        threats.append(fpath)
-                        self.scan_result.append(f"<span style='color:#ff61a6;'>Threat detected: {fpath}</span>")
-                    else:
-                        self.scan_result.append(f"Scanned: {fpath}")
-                    self.scan_progress.setValue(min(100, int((count/total)*100)))
-                    QtCore.QCoreApplication.processEvents()
-                    if count >= total:
-                        break
-                if count >= total:
-                    break
-            self.status_label.setText(f"<b>Status:</b> Scan Complete. {len(threats)} threats quarantined.")
-        threading.Thread(target=scan).start()
-
-    def clean_quarantine(self):
-        clean_quarantine()
-        self.status_label.setText("<b>Status:</b> Quarantine Cleaned")
-        self.update_quarantine_list()
-
-    def update_quarantine_list(self):
-        files = list_quarantine()
-        if files:
-            self.quarantine_list.setPlainText("\n".join(files))
-        else:
-            self.quarantine_list.setPlainText("Quarantine is empty.")
+VERSION_FILE = "antigus_version.txt"
 
-def launch_ui():
-    app = QtWidgets.QApplication([])
-    window = MainWindow()
-    window.show()
-    app.exec_()
-def detect_suspicious_software():
-    print("Detecting suspicious software...")
-    sus_processes = []
-    try:
-        import psutil
-    except ImportError:
-        print("psutil not installed. Run 'pip install psutil' for advanced detection.")
-        return
-    for proc in psutil.process_iter(['pid', 'name', 'exe', 'username']):
-        try:
-            pname = proc.info['name'] or ''
-            pexe = proc.info['exe'] or ''
-            if any(s in pname.lower() for s in ['hack', 'crack', 'keygen', 'inject', 'miner', 'steal', 'spy', 'rat', 'trojan', 'suspicious']):
-                sus_processes.append(proc.info)
-        except Exception:
-            continue
-    if sus_processes:
-        print("Suspicious software detected:")
-        for p in sus_processes:
-            print(f"- {p['name']} (PID: {p['pid']}, User: {p['username']})")
-    else:
-        print("No suspicious software found.")
-    def start_scan(self):
-        self.status.setText("<b>Status:</b> Scanning...")
-        self.progress.setValue(0)
-        QtCore.QTimer.singleShot(100, self.fake_scan)
-    def fake_scan(self):
-        for i in range(1, 101):
-            QtCore.QCoreApplication.processEvents()
-            self.progress.setValue(i)
-            time.sleep(0.008)
-        self.status.setText("<b>Status:</b> Scan Complete")
-    def clean_quarantine(self):
-        clean_quarantine()
-        self.status.setText("<b>Status:</b> Quarantine Cleaned")
-    def generate_report(self):
-        generate_report()
-        self.status.setText("<b>Status:</b> Report Generated")
-    def update_resources(self):
-        from monitor_utils import get_resource_usage
-        usage = get_resource_usage()
-        self.resource_label.setText(f"<b>Resources:</b> CPU: {usage['cpu_percent']}% | RAM: {usage['memory_percent']}% | Disk: {usage['disk_percent']}%")
+# Write version info to file (for the PyInstaller build)
+def write_version_file():
+    with open(VERSION_FILE, "w") as vf:
+        vf.write(f"{APP_NAME} v{APP_VERSION}\n")
 
+# --- GUI ---
+# The PyQt5 interface lives in gui.py and is only imported when it is
+# launched, so headless scans never load Qt.
 def launch_ui():
-    app = QtWidgets.QApplication([])
-    window = MainWindow()
-    window.show()
-    app.exec_()
+    from gui import launch_ui
+    launch_ui()
 
 # --- Main App ---
 def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=f"{APP_NAME} antivirus")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the last interrupted full scan, then exit")
+    args = parser.parse_args()
+    if args.resume:
+        load_local_definitions()
+        scan_system(resume=True)
+        return
     select_os_once()
-    update_definitions()
+    write_version_file()
+    # The window opens on the local definitions while the download runs.
+    load_local_definitions()
+    updater = threading.Thread(target=update_definitions, name="antigus-update", daemon=True)
+    updater.start()
+    monitor = start_monitoring(block=False)
     launch_ui()
-    start_monitoring()
+    updater.join()
     scan_system()
     show_quarantine()
     detect_suspicious_software()
+    close_process_scanner()
+    if monitor:
+        monitor.stop()
 
 # PyInstaller entry point for .exe conversion
 if __name__ == "__main__":
-    main()
+    # Run from the imported module so gui.py and antigus_cli.py share its
+    # state (definitions, settings) instead of getting a second copy.
+    import arfetanti
+    arfetanti.main()
@@ -0,0 +1,506 @@
+# benchmark.py
+# Offline, reproducible benchmarks for the scan hot paths. A synthetic tree
+# and signature set are generated from a seed, so two runs on the same
+# machine measure the same work. Results are written as JSON; --compare
+# checks them against a stored baseline and exits non-zero on regressions.
+#
+# Example:
+#   python benchmark.py --files 5000 --out baseline.json
+#   python benchmark.py --files 5000 --compare baseline.json
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+
+# (weight, min bytes, max bytes) of the synthetic file sizes.
+SIZE_PROFILE = ((70, 0, 16 * 1024), (25, 16 * 1024, 1024 * 1024), (5, 1024 * 1024, 8 * 1024 * 1024))
+DEFAULT_FILES = 2000
+DEFAULT_DEPTH = 4
+DEFAULT_FANOUT = 6
+DEFAULT_SIGNATURES = 100000
+DEFAULT_ARCHIVES = 0.02
+DEFAULT_SEED = 1
+# Each benchmark runs this many times and keeps the best value per metric.
+DEFAULT_REPEAT = 3
+LOOKUPS = 20000
+# Files copied and quarantined by the quarantine benchmark.
+QUARANTINE_SAMPLE = 200
+# Random digests in the similarity index, besides the tree's own.
+SIMILARITY_SIGNATURES = 10000
+# A metric that got this much worse than the baseline is a regression.
+REGRESSION_THRESHOLD = 0.10
+# Metrics where smaller is better; everything else is a throughput.
+LOWER_IS_BETTER = ("seconds", "peak_rss_mb", "_ms", "_us", "manifest_bytes", "growth_mb")
+
+
+def _size(rng, profile=SIZE_PROFILE):
+    weights = [w for w, _, _ in profile]
+    _, low, high = rng.choices(profile, weights)[0]
+    return rng.randint(low, high)
+
+
+# Example: Write a deterministic tree of files under root.
+# archives is the share of files written as zip or tar.gz archives of a
+# few members each. Returns {"files": n, "bytes": n, "paths": [...]}.
+def make_tree(root, files=DEFAULT_FILES, depth=DEFAULT_DEPTH, fanout=DEFAULT_FANOUT,
+              archives=DEFAULT_ARCHIVES, seed=DEFAULT_SEED, profile=SIZE_PROFILE):
+    rng = random.Random(seed)
+    dirs = [root]
+    frontier = [root]
+    for level in range(depth):
+        nxt = []
+        for parent in frontier:
+            for i in range(rng.randint(1, fanout)):
+                path = os.path.join(parent, f"d{level}_{i}")
+                nxt.append(path)
+        dirs.extend(nxt)
+        frontier = nxt
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+    paths, total = [], 0
+    for n in range(files):
+        directory = rng.choice(dirs)
+        if rng.random() < archives:
+            members = [(f"m{j}.bin", rng.randbytes(_size(rng, profile[:2]))) for j in range(rng.randint(2, 8))]
+            if rng.random() < 0.5:
+                path = os.path.join(directory, f"f{n}.zip")
+                with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+                    for name, data in members:
+                        z.writestr(zipfile.ZipInfo(name, (2020, 1, 1, 0, 0, 0)), data)
+            else:
+                path = os.path.join(directory, f"f{n}.tar.gz")
+                with tarfile.open(path, "w:gz") as t:
+                    for name, data in members:
+                        info = tarfile.TarInfo(name)
+                        info.size = len(data)
+                        info.mtime = 0
+                        t.addfile(info, _BytesReader(data))
+        else:
+            path = os.path.join(directory, f"f{n}.bin")
+            with open(path, "wb") as f:
+                f.write(rng.randbytes(_size(rng, profile)))
+        paths.append(path)
+        total += os.path.getsize(path)
+    return {"files": len(paths), "bytes": total, "paths": paths}
+
+
+class _BytesReader:
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+
+    def read(self, n=-1):
+        n = len(self.data) if n < 0 else n
+        block, self.data = self.data[:n], self.data[n:]
+        return bytes(block)
+
+
+# Example: Deterministic sha256 signatures, plus the given real digests
+# (e.g. a few files of the tree, so scans have threats to find).
+def make_signatures(count=DEFAULT_SIGNATURES, seed=DEFAULT_SEED, include=()):
+    rng = random.Random(seed + 1)
+    lines = [rng.randbytes(32).hex() for _ in range(count)]
+    lines.extend(include)
+    return lines
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _rates(seconds, files, size):
+    return {"seconds": round(seconds, 4),
+            "files_per_sec": round(files / seconds, 1) if seconds else None,
+            "mb_per_sec": round(size / 1e6 / seconds, 1) if seconds else None}
+
+
+def bench_file_hash(tree, **_):
+    from scanner_utils import file_hash
+    started = time.perf_counter()
+    for path in tree["paths"]:
+        file_hash(path)
+    return _rates(time.perf_counter() - started, tree["files"], tree["bytes"])
+
+
+def bench_is_malicious(tree, store, **_):
+    from scanner_utils import is_malicious
+    started = time.perf_counter()
+    for path in tree["paths"]:
+        is_malicious(path, store)
+    return _rates(time.perf_counter() - started, tree["files"], tree["bytes"])
+
+
+# Membership tests, half known digests and half unknown, against the
+# compiled store and against a plain set of the same signatures.
+def bench_lookup(tree, store, signatures, seed=DEFAULT_SEED, **_):
+    rng = random.Random(seed + 2)
+    probes = [rng.choice(signatures) if i % 2 else rng.randbytes(32).hex() for i in range(LOOKUPS)]
+    clock = time.perf_counter_ns
+    result = {"lookups": len(probes)}
+    for label, bad_hashes in (("store", store), ("set", set(signatures))):
+        latencies = []
+        for h in probes:
+            started = clock()
+            h in bad_hashes
+            latencies.append(clock() - started)
+        latencies.sort()
+        result[f"{label}_lookups_per_sec"] = round(len(probes) / (sum(latencies) / 1e9), 1)
+        result[f"{label}_lookup_p50_us"] = round(statistics.median(latencies) / 1000, 2)
+        result[f"{label}_lookup_p99_us"] = round(latencies[int(len(latencies) * 0.99)] / 1000, 2)
+    return result
+
+
+def bench_walk(tree, root, **_):
+    from scan_pipeline import walk_files
+    started = time.perf_counter()
+    count = sum(1 for _ in walk_files(root))
+    seconds = time.perf_counter() - started
+    return {"seconds": round(seconds, 4), "files_per_sec": round(count / seconds, 1)}
+
+
+def bench_quarantine(tree, workdir, **_):
+    import quarantine
+    sample = tree["paths"][:QUARANTINE_SAMPLE]
+    victims = os.path.join(workdir, "victims")
+    os.makedirs(victims)
+    copies = []
+    for i, path in enumerate(sample):
+        dest = os.path.join(victims, f"{i}-{os.path.basename(path)}")
+        shutil.copyfile(path, dest)
+        copies.append(dest)
+    size = sum(os.path.getsize(p) for p in copies)
+    saved = quarantine.QUARANTINE_DIR
+    quarantine.QUARANTINE_DIR = os.path.join(workdir, "vault")
+    try:
+        vault = quarantine.get_vault()
+        started = time.perf_counter()
+        for path in copies:
+            vault.add(path)
+        result = _rates(time.perf_counter() - started, len(copies), size)
+        started = time.perf_counter()
+        vault.purge()
+        result["purge_seconds"] = round(time.perf_counter() - started, 4)
+        vault.close()
+    finally:
+        quarantine.QUARANTINE_DIR = saved
+    return result
+
+
+# End to end: scan_tree with a cold and then a warm hash cache, archives
+# unpacked, nothing quarantined. prefilter_skip_ratio is the share of the
+# cold scan's files the size prefilter kept from being hashed.
+def bench_scan(tree, root, store, **_):
+    from archive_scanner import ArchiveScanner
+    from hash_cache import HashCache
+    from prefilter import build_prefilter
+    from scan_pipeline import scan_tree
+    cache = HashCache(":memory:")
+    result = {}
+    for label in ("cold", "warm"):
+        archives = ArchiveScanner(store)
+        prefilter = build_prefilter(store)
+        started = time.perf_counter()
+        threats = scan_tree(root, store, quarantine=False, cache=cache,
+                            prefilter=prefilter, archives=archives)
+        rates = _rates(time.perf_counter() - started, tree["files"], tree["bytes"])
+        result.update({f"{label}_{k}": v for k, v in rates.items()})
+        result["threats"] = len(threats)
+        if label == "cold" and prefilter is not None:
+            result["prefilter_skip_ratio"] = round(prefilter.report()["skip_ratio"], 4)
+    cache.close()
+    return result
+
+
+# Cached: from /proc/meminfo in MB, or None where there is none.
+def _page_cache_mb():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("Cached:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+# Writes out and drops the cached pages of the given files, so the next
+# read of them comes from the disk.
+def _evict(paths):
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+# The same cold scan in each I/O mode, side by side: throughput and how
+# much the page cache grew meanwhile. It is configured as a real scan is,
+# archives unpacked and the size prefilter on, just without a hash cache.
+# Other activity on the host shows up in the growth too.
+def bench_io_modes(tree, root, store, **_):
+    from archive_scanner import ArchiveScanner
+    from prefilter import build_prefilter
+    from scan_pipeline import scan_tree
+    from scanner_utils import IO_MODES
+    if not hasattr(os, "posix_fadvise"):
+        return {}
+    result = {}
+    for mode in IO_MODES:
+        label = mode.replace("-", "_")
+        _evict(tree["paths"])
+        before = _page_cache_mb()
+        started = time.perf_counter()
+        scan_tree(root, store, quarantine=False, prefilter=build_prefilter(store),
+                  archives=ArchiveScanner(store), io_mode=mode)
+        rates = _rates(time.perf_counter() - started, tree["files"], tree["bytes"])
+        result.update({f"{label}_{k}": v for k, v in rates.items()})
+        if before is not None:
+            result[f"{label}_page_cache_growth_mb"] = round(max(0.0, _page_cache_mb() - before), 1)
+    return result
+
+
+# Similarity digests of the tree's files (computed in the same read as
+# the hashes), then lookups of them in an index of SIMILARITY_SIGNATURES
+# random digests plus every 100th file's own.
+def bench_similarity(tree, seed=DEFAULT_SEED, **_):
+    from similarity_hash import SKETCH_SIZE, SimilarityIndex, digest_file
+    started = time.perf_counter()
+    digests = [digest_file(path)[1] for path in tree["paths"]]
+    result = {f"digest_{k}": v for k, v in _rates(time.perf_counter() - started, tree["files"],
+                                                   tree["bytes"]).items()}
+    rng = random.Random(seed + 3)
+    signatures = [(f"random-{i}", rng.randbytes(4 * SKETCH_SIZE).hex()) for i in range(SIMILARITY_SIGNATURES)]
+    signatures += [(f"tree-{i}", d) for i, d in enumerate(digests[::100]) if d]
+    started = time.perf_counter()
+    index = SimilarityIndex(signatures)
+    result["index_seconds"] = round(time.perf_counter() - started, 4)
+    probes = [d for d in digests if d]
+    started = time.perf_counter()
+    result["threats"] = sum(1 for d in probes if index.match(d))
+    if probes:
+        result["lookup_us"] = round((time.perf_counter() - started) / len(probes) * 1e6, 2)
+    return result
+
+
+# Rematch of a manifest of the tree against the store, which reads no
+# files. The manifest is written by a scan that is not timed.
+def bench_rematch(tree, root, store, workdir, **_):
+    from scan_manifest import ManifestWriter, rematch
+    from scan_pipeline import scan_tree
+    writer = ManifestWriter(os.path.join(workdir, "tree.agm"), root)
+    scan_tree(root, store, quarantine=False, manifest=writer)
+    path = writer.close()
+    started = time.perf_counter()
+    hits = rematch([path], store)
+    seconds = time.perf_counter() - started
+    return {"seconds": round(seconds, 4), "rows_per_sec": round(len(writer) / seconds, 1),
+            "manifest_bytes": os.path.getsize(path), "threats": len(hits)}
+
+
+# Headless CLI start-up: process start to first file judged (the target is
+# 100 ms), next to the bare interpreter start for reference. Runs a scan
+# of a small tree of its own, with its own home directory.
+def bench_cold_start(workdir, seed=DEFAULT_SEED, **_):
+    from signature_store import SIGNATURE_STORE_FILE
+    root = os.path.join(workdir, "cold")
+    make_tree(root, files=50, depth=2, archives=0, seed=seed)
+    shutil.copyfile(os.path.join(os.path.dirname(workdir), SIGNATURE_STORE_FILE),
+                    os.path.join(workdir, SIGNATURE_STORE_FILE))
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), "antigus_cli.py")
+    env = dict(os.environ, HOME=workdir)
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    interpreter = time.perf_counter() - started
+    out = os.path.join(workdir, "scan.json")
+    with open(out, "w") as f:
+        subprocess.run([sys.executable, cli, "scan", root, "--json", "--no-cache"], cwd=workdir, env=env,
+                       stdout=f, stderr=subprocess.DEVNULL)
+    with open(out) as f:
+        summary = json.load(f)
+    return {"first_file_ms": summary["first_file_ms"], "startup_ms": summary["startup_ms"],
+            "interpreter_ms": round(interpreter * 1000, 1)}
+
+
+BENCHMARKS = {
+    "file_hash": bench_file_hash,
+    "is_malicious": bench_is_malicious,
+    "lookup": bench_lookup,
+    "walk": bench_walk,
+    "quarantine": bench_quarantine,
+    "scan": bench_scan,
+    "io_modes": bench_io_modes,
+    "rematch": bench_rematch,
+    "similarity": bench_similarity,
+    "cold_start": bench_cold_start,
+}
+
+
+# Each benchmark runs in a forked child, so its peak RSS is its own and
+# the page cache is the only state it shares with the others.
+def _run_isolated(func, kwargs):
+    try:
+        import multiprocessing
+        ctx = multiprocessing.get_context("fork")
+    except (ImportError, ValueError):
+        result = func(**kwargs)
+        result["peak_rss_mb"] = _peak_rss_mb()
+        return result
+    parent, child = ctx.Pipe(duplex=False)
+
+    def target():
+        try:
+            result = func(**kwargs)
+            result["peak_rss_mb"] = _peak_rss_mb()
+        except Exception as e:
+            result = {"error": repr(e)}
+        child.send(result)
+
+    proc = ctx.Process(target=target)
+    proc.start()
+    # With the parent's copy of the sending end closed, a child that dies
+    # without sending (killed, os._exit) ends recv() with EOFError.
+    child.close()
+    try:
+        result = parent.recv()
+    except EOFError:
+        result = None
+    proc.join()
+    parent.close()
+    return result if result is not None else {"error": f"exit {proc.exitcode}"}
+
+
+def _lower_is_better(metric):
+    return metric.endswith(LOWER_IS_BETTER)
+
+
+def _best(runs):
+    best = {}
+    for run in runs:
+        for metric, value in run.items():
+            old = best.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                best.setdefault(metric, value)
+            elif (value < old) if _lower_is_better(metric) else (value > old):
+                best[metric] = value
+    return best
+
+
+# Example: Generate the data set, run the benchmarks and return the results.
+def run_benchmarks(files=DEFAULT_FILES, signatures=DEFAULT_SIGNATURES, depth=DEFAULT_DEPTH,
+                   archives=DEFAULT_ARCHIVES, seed=DEFAULT_SEED, only=None, workdir=None,
+                   repeat=DEFAULT_REPEAT):
+    from signature_store import SIGNATURE_STORE_FILE, SignatureStore, compile_definitions
+    from scanner_utils import file_hash
+    own = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix="antigus-bench-")
+    try:
+        root = os.path.join(workdir, "tree")
+        tree = make_tree(root, files, depth, archives=archives, seed=seed)
+        # Every 100th file is a known threat.
+        include = [file_hash(p) for p in tree["paths"][::100]]
+        lines = make_signatures(signatures, seed, include)
+        # The store has sizes, as a full feed does, so the size prefilter
+        # has files to skip.
+        rng = random.Random(seed + 2)
+        sizes = [_size(rng) for _ in range(signatures)] + [os.path.getsize(p) for p in tree["paths"][::100]]
+        store_path = os.path.join(workdir, SIGNATURE_STORE_FILE)
+        compile_definitions([f"{line}:{size}" for line, size in zip(lines, sizes)], store_path).close()
+        store = SignatureStore(store_path)
+        kwargs = {"tree": tree, "root": root, "store": store, "signatures": lines,
+                  "seed": seed, "workdir": workdir}
+        results = {}
+        for name, func in BENCHMARKS.items():
+            if only and name not in only:
+                continue
+            runs = []
+            for i in range(max(1, repeat)):
+                kwargs["workdir"] = os.path.join(workdir, f"{name}-{i}")
+                os.makedirs(kwargs["workdir"])
+                runs.append(_run_isolated(func, kwargs))
+                shutil.rmtree(kwargs["workdir"], ignore_errors=True)
+            results[name] = _best(runs)
+        store.close()
+    finally:
+        if own:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {"time": time.time(), "python": platform.python_version(), "platform": platform.platform(),
+                 "cpus": os.cpu_count(), "files": tree["files"], "bytes": tree["bytes"],
+                 "signatures": len(lines), "depth": depth, "archives": archives, "seed": seed,
+                 "repeat": repeat},
+        "results": results,
+    }
+
+
+# Example: Metrics that got worse than the baseline by more than threshold,
+# as [(benchmark, metric, baseline, current, change), ...].
+def compare(current, baseline, threshold=REGRESSION_THRESHOLD):
+    regressions = []
+    for name, metrics in current["results"].items():
+        base = baseline.get("results", {}).get(name, {})
+        for metric, value in metrics.items():
+            old = base.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            if metric in ("threats", "lookups", "purge_seconds", "interpreter_ms"):
+                continue
+            change = (value - old) / old
+            worse = change > threshold if _lower_is_better(metric) else change < -threshold
+            if worse:
+                regressions.append((name, metric, old, value, round(change, 3)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Antigus scan benchmarks")
+    parser.add_argument("--files", type=int, default=DEFAULT_FILES)
+    parser.add_argument("--signatures", type=int, default=DEFAULT_SIGNATURES)
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH)
+    parser.add_argument("--archives", type=float, default=DEFAULT_ARCHIVES,
+                        help="share of files written as archives")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS))
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a results file")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+    current = run_benchmarks(args.files, args.signatures, args.depth, args.archives, args.seed, args.only,
+                             repeat=args.repeat)
+    text = json.dumps(current, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("files") != current["meta"]["files"]:
+            print("Warning: the baseline was run on a different data set.")
+        regressions = compare(current, baseline, args.threshold)
+        for name, metric, old, new, change in regressions:
+            print(f"REGRESSION {name}.{metric}: {old} -> {new} ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+# content_signatures.py
+# Byte-pattern signatures matched while a file is being hashed, so a file
+# is read once for both checks and a changed byte elsewhere in it does not
+# evade detection.
+#
+# One definition per line, "Name:FileType:Offset:HexPattern":
+#   FileType   * or one of FILETYPES (elf, pe, zip, pdf, gzip, script)
+#   Offset     * anywhere, n exactly at byte n, n,m anywhere in n..n+m,
+#              EOF-n exactly n bytes before the end
+#   HexPattern hex bytes with ?? (any byte), {n} {n-m} {-m} {n-} (gaps),
+#              * (gap of up to MAX_WILDCARD_GAP) and (aa|bbcc) alternatives
+# e.g. Eicar-Test:*:0:58354f2150254041505b345c505a58353428505e2937434329377d24
+#
+# Matching: every signature gets an anchor, a run of ANCHOR_SIZE literal
+# bytes at a fixed distance from its start. The four aligned 4-byte words
+# such an anchor can contain are put in one set, and each block is checked
+# by intersecting that set with the block's aligned words, which runs at C
+# speed however many signatures there are. Only blocks that hit are
+# searched for the full anchor and verified with the signature's own regex.
+# Signatures with a fixed offset are just verified at that offset. Small
+# rule sets skip the word set and bytes.find each anchor directly.
+#
+# Python's re is not used for the search: it backtracks through an
+# alternation one branch at a time, so one combined pattern drops from
+# ~50 MB/s with 10 signatures to under 1 MB/s with 1000, and a pure-Python
+# automaton steps once per byte in the interpreter.
+import hashlib
+import os
+import re
+import sys
+import time
+
+from scanner_utils import DEFAULT_ALGORITHMS, IO_BUFFERED, file_digests
+
+CONTENT_SIGNATURES_FILE = "antigus_content_signatures.txt"
+MAX_WILDCARD_GAP = 4096
+ANCHOR_SIZE = 7
+# Signatures without an ANCHOR_SIZE literal run fall back to a plain search
+# for their longest run, which must be at least this long.
+MIN_LITERAL = 3
+# Up to this many searchable signatures, each anchor is looked for with
+# bytes.find instead; one find costs about 1/25 of the word intersection.
+FIND_LIMIT = 24
+FILETYPES = {
+    "elf": (b"\x7fELF",),
+    "pe": (b"MZ",),
+    "zip": (b"PK\x03\x04",),
+    "pdf": (b"%PDF",),
+    "gzip": (b"\x1f\x8b",),
+    "script": (b"#!",),
+}
+_WORD = 4
+# Bytes detect_filetype looks at.
+_MAGIC_SIZE = 8
+_TOKEN = re.compile(r"\s*(?:(?P<hex>(?:[0-9a-fA-F]{2})+)|(?P<any>\?\?)|(?P<star>\*)"
+                    r"|\{(?P<lo>\d*)(?:(?P<dash>-)(?P<hi>\d*))?\}|\((?P<alt>[0-9a-fA-F|]+)\))")
+
+
+# Example: detect_filetype(b"\x7fELF...") -> "elf"; None if unknown
+def detect_filetype(head):
+    for name, magics in FILETYPES.items():
+        if head.startswith(magics):
+            return name
+    return None
+
+
+# Parse a hex pattern into tokens: ("lit", bytes), ("gap", lo, hi) or
+# ("alt", [bytes, ...]). ?? is a gap of exactly one byte.
+def _tokenize(text):
+    tokens, pos = [], 0
+    text = text.strip()
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if not m:
+            raise ValueError(f"bad pattern at {text[pos:pos + 10]!r}")
+        pos = m.end()
+        if m.group("hex"):
+            lit = bytes.fromhex(m.group("hex"))
+            if tokens and tokens[-1][0] == "lit":
+                tokens[-1] = ("lit", tokens[-1][1] + lit)
+            else:
+                tokens.append(("lit", lit))
+        elif m.group("any"):
+            tokens.append(("gap", 1, 1))
+        elif m.group("star"):
+            tokens.append(("gap", 0, MAX_WILDCARD_GAP))
+        elif m.group("alt"):
+            tokens.append(("alt", [bytes.fromhex(a) for a in m.group("alt").split("|")]))
+        else:
+            lo = int(m.group("lo") or 0)
+            if not m.group("dash"):
+                hi = lo
+            else:
+                hi = int(m.group("hi")) if m.group("hi") else lo + MAX_WILDCARD_GAP
+            if hi < lo:
+                raise ValueError(f"bad gap {{{lo}-{hi}}}")
+            tokens.append(("gap", lo, hi))
+    if not any(t[0] != "gap" for t in tokens):
+        raise ValueError("pattern has no bytes")
+    return tokens
+
+
+def _token_widths(token):
+    if token[0] == "lit":
+        return len(token[1]), len(token[1])
+    if token[0] == "gap":
+        return token[1], token[2]
+    widths = [len(a) for a in token[1]]
+    return min(widths), max(widths)
+
+
+def _token_regex(token):
+    if token[0] == "lit":
+        return re.escape(token[1])
+    if token[0] == "gap":
+        return b".{%d}" % token[1] if token[1] == token[2] else b".{%d,%d}" % (token[1], token[2])
+    return b"(?:" + b"|".join(re.escape(a) for a in token[1]) + b")"
+
+
+# Distinct bytes in the anchor's weakest aligned word; runs of zeros or
+# padding make poor anchors because they hit in nearly every block.
+def _anchor_score(anchor):
+    return min(len(set(anchor[j:j + _WORD])) for j in range(ANCHOR_SIZE - _WORD + 1))
+
+
+class ContentSignature:
+
+    def __init__(self, name, filetype, offset, pattern):
+        self.name = name
+        self.filetype = None if filetype in ("*", "") else filetype
+        if self.filetype is not None and self.filetype not in FILETYPES:
+            raise ValueError(f"unknown file type {filetype!r}")
+        self.offset = self.shift = None
+        self.from_eof = False
+        offset = offset.strip()
+        if offset.upper().startswith("EOF-"):
+            self.offset, self.from_eof = int(offset[4:]), True
+        elif offset not in ("*", ""):
+            start, _, shift = offset.partition(",")
+            self.offset, self.shift = int(start), int(shift) if shift else None
+        tokens = _tokenize(pattern)
+        self.regex = re.compile(b"".join(_token_regex(t) for t in tokens), re.DOTALL)
+        self.max_len = sum(_token_widths(t)[1] for t in tokens)
+        # Anchor: the best literal run inside the fixed-width head, where its
+        # distance from the start of a match is known.
+        self.anchor = self.anchor_offset = None
+        best, at = None, 0
+        for token in tokens:
+            low, high = _token_widths(token)
+            if token[0] == "lit":
+                lit = token[1]
+                for i in range(max(1, len(lit) - ANCHOR_SIZE + 1)):
+                    candidate = lit[i:i + ANCHOR_SIZE]
+                    key = (len(candidate) >= ANCHOR_SIZE, _anchor_score(candidate)
+                           if len(candidate) >= ANCHOR_SIZE else len(candidate))
+                    if best is None or key > best:
+                        best, self.anchor, self.anchor_offset = key, candidate, at + i
+            if low != high:
+                break
+            at += low
+        if self.positional:
+            return
+        if self.anchor is None or len(self.anchor) < MIN_LITERAL:
+            raise ValueError(f"needs {MIN_LITERAL} literal bytes before any variable gap, or a fixed offset")
+
+    # Signatures pinned to one offset are verified there instead of searched for.
+    @property
+    def positional(self):
+        return self.offset is not None and not self.shift
+
+    def start_allowed(self, start):
+        if self.offset is None or self.from_eof:
+            return True
+        return self.offset <= start <= self.offset + (self.shift or 0)
+
+
+# Example: Parse "Name:FileType:Offset:HexPattern"; returns None for blank
+# lines and comments, raises ValueError for bad definitions.
+def parse_content_signature(line):
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    fields = line.split(":", 3)
+    if len(fields) != 4:
+        raise ValueError("expected Name:FileType:Offset:HexPattern")
+    return ContentSignature(*fields)
+
+
+class ContentMatcher:
+
+    def __init__(self, signatures):
+        self.signatures = list(signatures)
+        digest = hashlib.sha1()
+        for sig in self.signatures:
+            digest.update(f"{sig.name}:{sig.filetype}:{sig.offset}:{sig.shift}:{sig.from_eof}:".encode())
+            digest.update(sig.regex.pattern + b"\n")
+        # Stored with the file digests in the hash cache; a new rule set
+        # changes the key, so cached results from the old one are not reused.
+        self.key = f"content-{digest.hexdigest()[:12]}"
+        # Longest match minus one byte is carried over between blocks.
+        self.overlap = max((s.max_len for s in self.signatures), default=1) - 1
+        self.positional = [s for s in self.signatures if s.positional]
+        searchable = [s for s in self.signatures if not s.positional]
+        # Signatures looked for with bytes.find on their anchor.
+        self.short = []
+        self.by_word = {}
+        for sig in searchable:
+            if len(sig.anchor) < ANCHOR_SIZE or len(searchable) <= FIND_LIMIT:
+                self.short.append(sig)
+                continue
+            # Whatever its alignment, an anchor contains an aligned word at
+            # one of these four offsets.
+            for j in range(ANCHOR_SIZE - _WORD + 1):
+                word = int.from_bytes(sig.anchor[j:j + _WORD], sys.byteorder)
+                self.by_word.setdefault(word, set()).add(sig)
+        self.words = frozenset(self.by_word)
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def session(self):
+        return ContentScan(self)
+
+    # Example: Hash a file and match it in the same read.
+    # Returns (digests, [(signature name, offset), ...]), or (None, None)
+    # if the file can't be read. sinks are fed the same blocks.
+    def scan_file(self, path, algorithms=DEFAULT_ALGORITHMS, sinks=(), io_mode=IO_BUFFERED):
+        scan = self.session()
+        digests = file_digests(path, algorithms, sinks=(scan,) + tuple(sinks), io_mode=io_mode)
+        if digests is None:
+            return None, None
+        return digests, scan.finish()
+
+
+# The matching state for one file: a sink for scanner_utils.file_digests.
+class ContentScan:
+
+    def __init__(self, matcher):
+        self.m = matcher
+        self.size = None
+        self.filetype = None
+        self.matches = []
+        self._found = set()
+        self._tail = b""
+        self._base = 0      # file offset of self._tail[0]
+        self._head = True
+
+    def start(self, size):
+        self.size = size
+
+    def update(self, block):
+        window = self._tail + bytes(block) if self._tail else bytes(block)
+        if self._head:
+            # The file type is known once its magic has been seen in full.
+            if len(window) < _MAGIC_SIZE:
+                self._tail = window
+                return
+            self.filetype = detect_filetype(window[:_MAGIC_SIZE])
+            self._head = False
+        cutoff = len(window) - self.m.overlap
+        if cutoff <= 0:
+            self._tail = window
+            return
+        self._search(window, cutoff)
+        self._tail = window[cutoff:]
+        self._base += cutoff
+
+    def finish(self):
+        if self._head:
+            self.filetype = detect_filetype(self._tail[:_MAGIC_SIZE])
+        if self._tail:
+            self._search(self._tail, len(self._tail))
+            self._base += len(self._tail)
+            self._tail = b""
+        return self.matches
+
+    def _verify(self, sig, window, start):
+        if sig in self._found or (sig.filetype and sig.filetype != self.filetype):
+            return
+        if not sig.start_allowed(self._base + start):
+            return
+        if sig.regex.match(window, start):
+            self._found.add(sig)
+            self.matches.append((sig.name, self._base + start))
+
+    # Checks every match starting in window[:cutoff]; later starts are
+    # checked with the next block, when the whole match can be seen.
+    def _search(self, window, cutoff):
+        base = self._base
+        for sig in self.m.positional:
+            # A stream of unknown size (a compressed archive member) has no
+            # end to anchor to.
+            if sig.from_eof and self.size is None:
+                continue
+            start = (self.size - sig.offset if sig.from_eof else sig.offset) - base
+            if 0 <= start < cutoff:
+                self._verify(sig, window, start)
+        if self.m.words:
+            usable = len(window) // _WORD * _WORD
+            with memoryview(window)[:usable] as view, view.cast("I") as words:
+                hits = self.m.words.intersection(words)
+            candidates = set()
+            for word in hits:
+                candidates.update(self.m.by_word[word])
+            for sig in candidates:
+                self._find(sig, window, cutoff)
+        for sig in self.m.short:
+            self._find(sig, window, cutoff)
+
+    def _find(self, sig, window, cutoff):
+        if sig in self._found:
+            return
+        pos = window.find(sig.anchor, sig.anchor_offset)
+        while pos != -1:
+            start = pos - sig.anchor_offset
+            if start >= cutoff:
+                break
+            self._verify(sig, window, start)
+            if sig in self._found:
+                break
+            pos = window.find(sig.anchor, pos + 1)
+
+
+# Example: Load a ContentMatcher from a definitions file; None if the file
+# is missing or defines no signatures. Bad lines are reported and skipped.
+def load_content_signatures(path=CONTENT_SIGNATURES_FILE):
+    if not os.path.exists(path):
+        return None
+    signatures = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            try:
+                sig = parse_content_signature(line)
+            except ValueError as e:
+                print(f"{path}:{number}: skipped content signature: {e}")
+                continue
+            if sig:
+                signatures.append(sig)
+    return ContentMatcher(signatures) if signatures else None
+
+
+# Example: Random signatures for benchmarks: mostly anchored hex patterns
+# with ?? and {n-m} wildcards, some pinned to offsets.
+def synthetic_signatures(count, seed=0):
+    import random
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        parts = []
+        parts.append(bytes(rng.getrandbits(8) for _ in range(rng.randint(8, 16))).hex())
+        if rng.random() < 0.5:
+            parts.append("??" * rng.randint(1, 4))
+            parts.append(bytes(rng.getrandbits(8) for _ in range(4)).hex())
+        if rng.random() < 0.3:
+            parts.append(f"{{{rng.randint(0, 8)}-{rng.randint(16, 64)}}}")
+            parts.append(bytes(rng.getrandbits(8) for _ in range(4)).hex())
+        offset = str(rng.randint(0, 512)) if rng.random() < 0.05 else "*"
+        lines.append(f"Synthetic.{i}:*:{offset}:{''.join(parts)}")
+    return [parse_content_signature(line) for line in lines]
+
+
+# Example: Compare hash-only and hash+content throughput in MB/s on a
+# temporary file of size_mb random bytes.
+def benchmark(size_mb=256, signature_counts=(10, 1000, 10000), path=None):
+    import tempfile
+    own = path is None
+    if own:
+        fd, path = tempfile.mkstemp(prefix="antigus-bench-")
+        with os.fdopen(fd, "wb") as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+    size = os.path.getsize(path)
+    results = {"bytes": size}
+    try:
+        started = time.perf_counter()
+        file_digests(path)
+        results["hash_only_mb_s"] = round(size / 1e6 / (time.perf_counter() - started), 1)
+        for count in signature_counts:
+            matcher = ContentMatcher(synthetic_signatures(count))
+            started = time.perf_counter()
+            matcher.scan_file(path)
+            results[f"hash_content_{count}_mb_s"] = round(size / 1e6 / (time.perf_counter() - started), 1)
+    finally:
+        if own:
+            os.remove(path)
+    return results
+
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(benchmark(path=sys.argv[1] if len(sys.argv) > 1 else None), indent=2))
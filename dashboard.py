@@ -1,10 +1,46 @@
 # dashboard.py
 # Functions for displaying system health and security status
-from monitor_utils import get_resource_usage
+from monitor_utils import get_sampler
+from scan_metrics import METRICS_FILE, METRICS_FILE_INTERVAL, METRICS_SOCKET, read_metrics
 
-def show_dashboard():
-    usage = get_resource_usage()
+_BARS = "▁▂▃▄▅▆▇█"
+
+# Example: sparkline([0, 50, 100]) -> "▁▅█" (values are percentages)
+def sparkline(values, width=60):
+    values = values[-width:]
+    return "".join(_BARS[min(len(_BARS) - 1, int(v / 100 * len(_BARS)))] for v in values)
+
+def _average(values):
+    return sum(values) / len(values) if values else None
+
+# Scans run in another process (the scan daemon, a CLI scan), so their
+# numbers come from what it exports: the metrics socket if one is served,
+# else the textfile it rewrites while scanning. A textfile that stopped
+# being rewritten belongs to a scan that is no longer running.
+def show_dashboard(metrics_socket=METRICS_SOCKET, metrics_file=METRICS_FILE):
+    sampler = get_sampler()
+    usage = sampler.latest()
     print("System Health Dashboard:")
     print(f"CPU Usage: {usage['cpu_percent']}%")
     print(f"Memory Usage: {usage['memory_percent']}%")
     print(f"Disk Usage: {usage['disk_percent']}%")
+    # Trends from the sampler's history; nothing here touches psutil.
+    minute = sampler.history("raw", 60)
+    hour = sampler.history("1m", 60)
+    if len(minute["time"]) > 1:
+        print(f"CPU last minute:  {sparkline(minute['cpu_percent'])} avg {_average(minute['cpu_percent']):.1f}%")
+    if hour["time"]:
+        print(f"CPU last hour:    {sparkline(hour['cpu_percent'])} avg {_average(hour['cpu_percent']):.1f}%")
+        print(f"Memory last hour: {sparkline(hour['memory_percent'])} avg {_average(hour['memory_percent']):.1f}%")
+    metrics = read_metrics(metrics_socket, metrics_file)
+    if metrics is None:
+        print("Scan Throughput: no scan has run yet")
+        return
+    if metrics.get("scans_running") and metrics["age"] <= 3 * METRICS_FILE_INTERVAL:
+        print(f"Scan Throughput: {metrics.get('files_per_second', 0):.0f} files/s, "
+              f"{metrics.get('bytes_per_second', 0) / 1e6:.1f} MB/s")
+    else:
+        print("Scan Throughput: idle")
+    print(f"Files Scanned: {metrics.get('files_scanned_total', 0):.0f} "
+          f"({metrics.get('bytes_read_total', 0):.0f} bytes read, "
+          f"cache hits {metrics.get('cache_hit_ratio', 0):.0%})")
@@ -0,0 +1,564 @@
+# gui.py
+# PyQt5 interface for Antigus. Everything runs through the same functions
+# as the CLI in arfetanti.py; this module is only imported to show a window.
+import collections
+import json
+import os
+import platform
+import threading
+
+from PyQt5 import QtWidgets, QtGui, QtCore
+
+from arfetanti import (APP_NAME, APP_VERSION, GIT_URL, run_scan, run_quick_scan, suspicious_software_report,
+                       close_process_scanner, clean_quarantine)
+from dashboard import sparkline
+from monitor_utils import get_sampler
+from quick_scan import QUICK_SCAN_TIME_BUDGET
+from quarantine import list_quarantine, count_quarantine, format_item, QUARANTINE_PAGE_SIZE
+from scan_journal import VERBOSITY_THREATS
+from scan_daemon import DaemonClient, daemon_running
+from scan_metrics import METRICS
+from scan_pipeline import ScanProgress
+
+PROGRESS_FILE = "antigus_progress.json"
+
+# Load or initialize persistent settings
+def load_progress():
+    if os.path.exists(PROGRESS_FILE):
+        with open(PROGRESS_FILE) as f:
+            return json.load(f)
+    return {"theme": "light", "scans": 0, "threats": 0}
+
+def save_progress(data):
+    with open(PROGRESS_FILE, "w") as f:
+        json.dump(data, f)
+
+# Rows of clean files kept in the scan results view; threats are always kept.
+SCAN_VIEW_MAX_ROWS = 10000
+# How often the scan worker sends results and progress to the GUI thread,
+# in seconds, whether or not files were judged in between.
+SCAN_BATCH_INTERVAL = 0.05
+
+class ScanResultsModel(QtCore.QAbstractListModel):
+
+    def __init__(self, max_rows=SCAN_VIEW_MAX_ROWS):
+        super().__init__()
+        self.max_rows = max_rows
+        self.threats = []
+        self.recent = collections.deque()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.threats) + len(self.recent)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        row = index.row()
+        is_threat = row < len(self.threats)
+        if role == QtCore.Qt.DisplayRole:
+            if is_threat:
+                return f"Threat detected: {self.threats[row]}"
+            return f"Scanned: {self.recent[row - len(self.threats)]}"
+        if role == QtCore.Qt.ForegroundRole and is_threat:
+            return QtGui.QBrush(QtGui.QColor("#ff61a6"))
+        return None
+
+    def clear(self):
+        self.beginResetModel()
+        self.threats = []
+        self.recent.clear()
+        self.endResetModel()
+
+    # Threats go to the top; clean files are appended and the oldest ones
+    # dropped so the row count never exceeds max_rows plus the threats.
+    def add_batch(self, batch):
+        threats = [p for p, matched in batch if matched]
+        clean = [p for p, matched in batch if not matched][-self.max_rows:]
+        if threats:
+            start = len(self.threats)
+            self.beginInsertRows(QtCore.QModelIndex(), start, start + len(threats) - 1)
+            self.threats.extend(threats)
+            self.endInsertRows()
+        overflow = len(self.recent) + len(clean) - self.max_rows
+        if overflow > 0:
+            first = len(self.threats)
+            self.beginRemoveRows(QtCore.QModelIndex(), first, first + overflow - 1)
+            for _ in range(overflow):
+                self.recent.popleft()
+            self.endRemoveRows()
+        if clean:
+            start = len(self.threats) + len(self.recent)
+            self.beginInsertRows(QtCore.QModelIndex(), start, start + len(clean) - 1)
+            self.recent.extend(clean)
+            self.endInsertRows()
+
+# Runs the real scan engine on a QThread and reports back in batches, so the
+# GUI thread only ever touches widgets from signal handlers.
+class ScanWorker(QtCore.QObject):
+    batch = QtCore.pyqtSignal(list)
+    progress = QtCore.pyqtSignal(int, int, bool)
+    finished = QtCore.pyqtSignal(list, dict)
+
+    # quick=True runs a risk-ranked quick scan within time_budget seconds,
+    # always in this process.
+    def __init__(self, path="/", quick=False, time_budget=None):
+        super().__init__()
+        self.path = path
+        self.quick = quick
+        self.time_budget = time_budget
+        self.stop_event = threading.Event()
+        self.scan_progress = ScanProgress()
+        self.client = None
+        # (files/s, bytes/s, cache hit rate) from the daemon's progress
+        # events, when the daemon runs the scan.
+        self.daemon_rates = None
+        # Results not yet sent; filled by the scan, drained by the ticker.
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def _emit(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            self.batch.emit(pending)
+        p = self.scan_progress
+        self.progress.emit(p.done, p.discovered, p.walk_finished)
+
+    def _on_result(self, fpath, matched):
+        with self._lock:
+            self._pending.append((fpath, matched))
+
+    # Sends what came in every SCAN_BATCH_INTERVAL on its own thread, so the
+    # progress bar moves during a long file or a long run of skipped ones.
+    def _tick(self, done):
+        while not done.wait(SCAN_BATCH_INTERVAL):
+            self._emit()
+
+    # Lets a running scan daemon do the work, with its warm cache and
+    # definitions, and relays its events.
+    def _run_in_daemon(self):
+        self.client = DaemonClient()
+        threats, summary = [], None
+        for event in self.client.scan(self.path, files=True):
+            kind = event.get("event")
+            if kind == "results":
+                with self._lock:
+                    self._pending.extend((fpath, matched) for fpath, matched in event["items"])
+            elif kind == "progress":
+                p = self.scan_progress
+                p.done, p.discovered, p.walk_finished = event["done"], event["discovered"], event["walk_finished"]
+                if "files_per_sec" in event:
+                    self.daemon_rates = (event["files_per_sec"], event["bytes_per_sec"], event["cache_hit_rate"])
+            elif kind == "done":
+                threats, summary = event["threats"], event["summary"]
+        if summary is None:
+            summary = {"complete": False} if self.stop_event.is_set() else {"error": "the scan daemon went away"}
+        return threats, summary
+
+    def run(self):
+        threats, summary = [], {}
+        done = threading.Event()
+        ticker = threading.Thread(target=self._tick, args=(done,), name="antigus-scan-progress", daemon=True)
+        ticker.start()
+        try:
+            if self.quick:
+                threats, summary = run_quick_scan(self.path, self._on_result, self.time_budget,
+                                                  stop_event=self.stop_event, progress=self.scan_progress)
+            elif daemon_running():
+                threats, summary = self._run_in_daemon()
+            else:
+                threats, summary = run_scan(self.path, self._on_result, verbosity=VERBOSITY_THREATS,
+                                            stop_event=self.stop_event, progress=self.scan_progress)
+        except Exception as e:
+            summary = {"error": str(e)}
+        done.set()
+        ticker.join()
+        self._emit()
+        self.finished.emit(threats, summary)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.client:
+            self.client.close()
+
+class MainWindow(QtWidgets.QMainWindow):
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle(f"{APP_NAME} - Premium Free Antivirus")
+        self.setGeometry(100, 100, 900, 600)
+        self.settings = load_progress()
+        self.theme = self.settings.get("theme", "light")
+        self.apply_theme()
+
+        # Sidebar
+        sidebar = QtWidgets.QFrame()
+        sidebar.setFixedWidth(180)
+        sidebar.setStyleSheet("background: #181a1b; border-top-right-radius: 18px; border-bottom-right-radius: 18px;")
+        sidebar_layout = QtWidgets.QVBoxLayout()
+        sidebar_layout.setAlignment(QtCore.Qt.AlignTop)
+        logo = QtWidgets.QLabel(f"<h2 style='color:#00ff99; text-align:center;'>🛡️<br>{APP_NAME}</h2><p style='color:#888; font-size:0.9em;'>A trusted friend for your PC</p>")
+        logo.setAlignment(QtCore.Qt.AlignCenter)
+        sidebar_layout.addWidget(logo)
+        self.btn_dashboard = QtWidgets.QPushButton("Dashboard")
+        self.btn_dashboard.setStyleSheet(self.sidebar_btn_style(True))
+        self.btn_scan = QtWidgets.QPushButton("Scan")
+        self.btn_scan.setStyleSheet(self.sidebar_btn_style(False))
+        self.btn_quarantine = QtWidgets.QPushButton("Quarantine")
+        self.btn_quarantine.setStyleSheet(self.sidebar_btn_style(False))
+        self.btn_update = QtWidgets.QPushButton("Update")
+        self.btn_update.setStyleSheet(self.sidebar_btn_style(False))
+        self.btn_tools = QtWidgets.QPushButton("Tools")
+        self.btn_tools.setStyleSheet(self.sidebar_btn_style(False))
+        self.btn_settings = QtWidgets.QPushButton("Settings")
+        self.btn_settings.setStyleSheet(self.sidebar_btn_style(False))
+        for btn in [self.btn_dashboard, self.btn_scan, self.btn_quarantine, self.btn_update, self.btn_tools, self.btn_settings]:
+            btn.setCursor(QtCore.Qt.PointingHandCursor)
+            sidebar_layout.addWidget(btn)
+        sidebar_layout.addStretch()
+        sidebar.setLayout(sidebar_layout)
+
+        # Main content area (stacked)
+        self.stack = QtWidgets.QStackedWidget()
+        self.page_dashboard = self.build_dashboard()
+        self.page_scan = self.build_scan()
+        self.page_quarantine = self.build_quarantine()
+        self.page_update = self.build_update()
+        self.page_tools = self.build_tools()
+        self.page_settings = self.build_settings()
+        self.stack.addWidget(self.page_dashboard)
+        self.stack.addWidget(self.page_scan)
+        self.stack.addWidget(self.page_quarantine)
+        self.stack.addWidget(self.page_update)
+        self.stack.addWidget(self.page_tools)
+        self.stack.addWidget(self.page_settings)
+
+        # Layout
+        main_layout = QtWidgets.QHBoxLayout()
+        main_layout.addWidget(sidebar)
+        main_layout.addWidget(self.stack)
+        container = QtWidgets.QWidget()
+        container.setLayout(main_layout)
+        self.setCentralWidget(container)
+
+        # Connect sidebar
+        self.btn_dashboard.clicked.connect(lambda: self.switch_page(0))
+        self.btn_scan.clicked.connect(lambda: self.switch_page(1))
+        self.btn_quarantine.clicked.connect(lambda: self.switch_page(2))
+        self.btn_update.clicked.connect(lambda: self.switch_page(3))
+        self.btn_tools.clicked.connect(lambda: self.switch_page(4))
+        self.btn_settings.clicked.connect(lambda: self.switch_page(5))
+
+    def sidebar_btn_style(self, active):
+        if active:
+            return "background:#00ff99; color:#181a1b; font-weight:bold; border-radius:10px; margin:8px 0; padding:12px; font-size:1.1em;"
+        return "background:transparent; color:#fff; font-weight:bold; border-radius:10px; margin:8px 0; padding:12px; font-size:1.1em;"
+
+    def switch_page(self, idx):
+        btns = [self.btn_dashboard, self.btn_scan, self.btn_quarantine, self.btn_update, self.btn_tools, self.btn_settings]
+        for i, btn in enumerate(btns):
+            btn.setStyleSheet(self.sidebar_btn_style(i == idx))
+        self.stack.setCurrentIndex(idx)
+
+    def build_update(self):
+        page = QtWidgets.QWidget()
+        layout = QtWidgets.QVBoxLayout()
+        title = QtWidgets.QLabel("<h2 style='color:#00c3ff;'>Update Antigus</h2>")
+        title.setAlignment(QtCore.Qt.AlignCenter)
+        layout.addWidget(title)
+        self.update_btn = QtWidgets.QPushButton("Update from GitHub")
+        self.update_btn.setStyleSheet("background:#00c3ff; color:#fff; font-weight:bold; border-radius:10px; padding:12px; font-size:1.1em;")
+        self.update_btn.clicked.connect(self.start_update)
+        layout.addWidget(self.update_btn)
+        self.update_progress = QtWidgets.QProgressBar()
+        self.update_progress.setStyleSheet("background:#333; color:#00c3ff; border-radius:8px; height:24px;")
+        layout.addWidget(self.update_progress)
+        self.update_status = QtWidgets.QLabel("<b>Status:</b> Ready for update.")
+        self.update_status.setStyleSheet("color:#00c3ff; font-size:1.1em;")
+        layout.addWidget(self.update_status)
+        github_label = QtWidgets.QLabel('<a href="https://github.com/arduinoUNO65/antigus" style="color:#00c3ff;">Visit Antigus on GitHub</a>')
+        github_label.setOpenExternalLinks(True)
+        github_label.setAlignment(QtCore.Qt.AlignCenter)
+        layout.addWidget(github_label)
+        page.setLayout(layout)
+        return page
+
+    def start_update(self):
+        import threading
+        def do_update():
+            import requests, tempfile
+            self.update_status.setText("<b>Status:</b> Downloading update...")
+            self.update_progress.setValue(0)
+            try:
+                tmp = tempfile.NamedTemporaryFile(delete=False)
+                with requests.get(GIT_URL, stream=True) as r:
+                    r.raise_for_status()
+                    total = int(r.headers.get('content-length', 0))
+                    downloaded = 0
+                    chunk_size = 8192
+                    for chunk in r.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            tmp.write(chunk)
+                            downloaded += len(chunk)
+                            percent = int((downloaded / total) * 100) if total else 0
+                            self.update_progress.setValue(percent)
+                            QtCore.QCoreApplication.processEvents()
+                tmp.close()
+                self.update_status.setText("<b>Status:</b> Update downloaded! (Not auto-installed)")
+            except Exception as e:
+                self.update_status.setText(f"<b>Status:</b> Update failed: {e}")
+                self.update_progress.setValue(0)
+        threading.Thread(target=do_update).start()
+
+    def build_tools(self):
+        page = QtWidgets.QWidget()
+        layout = QtWidgets.QVBoxLayout()
+        title = QtWidgets.QLabel("<h2 style='color:#2af598;'>Tools & Utilities</h2>")
+        title.setAlignment(QtCore.Qt.AlignCenter)
+        layout.addWidget(title)
+        self.sus_btn = QtWidgets.QPushButton("Detect Suspicious Software")
+        self.sus_btn.setStyleSheet("background:#2af598; color:#181a1b; font-weight:bold; border-radius:10px; padding:12px; font-size:1.1em;")
+        self.sus_btn.clicked.connect(self.detect_sus_software_gui)
+        layout.addWidget(self.sus_btn)
+        self.sus_result = QtWidgets.QTextEdit()
+        self.sus_result.setReadOnly(True)
+        self.sus_result.setStyleSheet("background:#222; color:#fff; border-radius:8px; font-size:1em;")
+        layout.addWidget(self.sus_result)
+        page.setLayout(layout)
+        return page
+
+    def detect_sus_software_gui(self):
+        self.sus_result.setPlainText(suspicious_software_report())
+
+    def build_dashboard(self):
+        page = QtWidgets.QWidget()
+        layout = QtWidgets.QVBoxLayout()
+        title = QtWidgets.QLabel(f"""
+            <h1 style='color:#fff; font-size:2.2em; letter-spacing:2px; text-shadow:0 0 10px #00ff99;'>{APP_NAME}</h1>
+            <p style='color:#eee; font-size:1.1em;'>Premium Free Antivirus</p>
+        """)
+        title.setAlignment(QtCore.Qt.AlignCenter)
+        layout.addWidget(title)
+        self.status_label = QtWidgets.QLabel("<b>Status:</b> Ready")
+        self.status_label.setStyleSheet("color:#fff; font-size:1.1em;")
+        layout.addWidget(self.status_label)
+        self.resource_label = QtWidgets.QLabel("<b>Resources:</b> CPU: -- | RAM: -- | Disk: --")
+        self.resource_label.setStyleSheet("color:#fff; font-size:1.1em;")
+        layout.addWidget(self.resource_label)
+        self.throughput_label = QtWidgets.QLabel("<b>Scan throughput:</b> idle")
+        self.throughput_label.setStyleSheet("color:#fff; font-size:1.1em;")
+        layout.addWidget(self.throughput_label)
+        version_label = QtWidgets.QLabel(f"<b>Version:</b> {APP_VERSION}")
+        version_label.setStyleSheet("color:#00ff99; font-size:1.1em;")
+        layout.addWidget(version_label)
+        layout.addStretch()
+        page.setLayout(layout)
+        # Timer for resource updates, drawn from the shared background sampler
+        try:
+            self.sampler = get_sampler()
+        except Exception:
+            self.sampler = None
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.update_resources)
+        self.timer.start(1000)
+        return page
+
+    def build_scan(self):
+        page = QtWidgets.QWidget()
+        layout = QtWidgets.QVBoxLayout()
+        title = QtWidgets.QLabel("<h2 style='color:#00ff99;'>System Scan</h2>")
+        title.setAlignment(QtCore.Qt.AlignCenter)
+        layout.addWidget(title)
+        self.scan_btn = QtWidgets.QPushButton("Start Scan")
+        self.scan_btn.setStyleSheet("background:#00ff99; color:#181a1b; font-weight:bold; border-radius:10px; padding:12px; font-size:1.1em;")
+        self.scan_btn.clicked.connect(lambda: self.start_scan())
+        layout.addWidget(self.scan_btn)
+        # Quick scan: riskiest files first, for as long as the budget allows.
+        quick_row = QtWidgets.QHBoxLayout()
+        self.quick_scan_btn = QtWidgets.QPushButton("Quick Scan")
+        self.quick_scan_btn.setStyleSheet("background:#222; color:#00ff99; font-weight:bold; border-radius:10px; padding:8px;")
+        self.quick_scan_btn.clicked.connect(lambda: self.start_scan(quick=True))
+        quick_row.addWidget(self.quick_scan_btn)
+        quick_row.addWidget(QtWidgets.QLabel("Time budget (minutes):"))
+        self.quick_budget = QtWidgets.QSpinBox()
+        self.quick_budget.setRange(1, 24 * 60)
+        self.quick_budget.setValue(max(1, round((QUICK_SCAN_TIME_BUDGET or 300) / 60)))
+        quick_row.addWidget(self.quick_budget)
+        layout.addLayout(quick_row)
+        self.scan_progress = QtWidgets.QProgressBar()
+        self.scan_progress.setStyleSheet("background:#333; color:#00ff99; border-radius:8px; height:24px;")
+        layout.addWidget(self.scan_progress)
+        self.scan_model = ScanResultsModel()
+        self.scan_result = QtWidgets.QListView()
+        self.scan_result.setModel(self.scan_model)
+        self.scan_result.setUniformItemSizes(True)
+        self.scan_result.setStyleSheet("background:#222; color:#fff; border-radius:8px; font-size:1em;")
+        layout.addWidget(self.scan_result)
+        self.scan_thread = None
+        self.scan_worker = None
+        self.scanning = False
+        page.setLayout(layout)
+        return page
+
+    def build_quarantine(self):
+        page = QtWidgets.QWidget()
+        layout = QtWidgets.QVBoxLayout()
+        title = QtWidgets.QLabel("<h2 style='color:#ff61a6;'>Quarantine</h2>")
+        title.setAlignment(QtCore.Qt.AlignCenter)
+        layout.addWidget(title)
+        self.clean_btn = QtWidgets.QPushButton("Clean Quarantine")
+        self.clean_btn.setStyleSheet("background:#ff61a6; color:#fff; font-weight:bold; border-radius:10px; padding:12px; font-size:1.1em;")
+        self.clean_btn.clicked.connect(self.clean_quarantine)
+        layout.addWidget(self.clean_btn)
+        self.quarantine_list = QtWidgets.QTextEdit()
+        self.quarantine_list.setReadOnly(True)
+        self.quarantine_list.setStyleSheet("background:#222; color:#fff; border-radius:8px; font-size:1em;")
+        layout.addWidget(self.quarantine_list)
+        page.setLayout(layout)
+        return page
+
+    def build_settings(self):
+        page = QtWidgets.QWidget()
+        layout = QtWidgets.QVBoxLayout()
+        title = QtWidgets.QLabel("<h2 style='color:#ffd200;'>Settings</h2>")
+        title.setAlignment(QtCore.Qt.AlignCenter)
+        layout.addWidget(title)
+        # Version info
+        version_label = QtWidgets.QLabel(f"<b>Version:</b> {APP_VERSION}")
+        version_label.setStyleSheet("color:#ffd200; font-size:1.1em;")
+        layout.addWidget(version_label)
+        # Premium features info
+        premium_label = QtWidgets.QLabel("<b>Premium:</b> All features are free. No upsells. No paywall. Enjoy full protection!")
+        premium_label.setStyleSheet("color:#00ff99; font-size:1.1em;")
+        layout.addWidget(premium_label)
+        # Theme switcher
+        theme_label = QtWidgets.QLabel("<b>Theme:</b>")
+        theme_label.setStyleSheet("color:#fff; font-size:1.1em;")
+        layout.addWidget(theme_label)
+        self.theme_toggle = QtWidgets.QCheckBox("Enable dark theme")
+        self.theme_toggle.setChecked(self.theme == "dark")
+        self.theme_toggle.stateChanged.connect(self.toggle_theme)
+        layout.addWidget(self.theme_toggle)
+        # OS info
+        os_label = QtWidgets.QLabel(f"<b>OS:</b> {platform.system()}")
+        os_label.setStyleSheet("color:#fff; font-size:1.1em;")
+        layout.addWidget(os_label)
+        layout.addStretch()
+        page.setLayout(layout)
+        return page
+
+    def apply_theme(self):
+        if self.theme == "dark":
+            self.setStyleSheet("background: qlineargradient(x1:0, y1:0, x2:1, y2:1, stop:0 #232526, stop:1 #00ff99); color: #fff;")
+        else:
+            self.setStyleSheet("background: #fff; color: #222;")
+
+    def toggle_theme(self):
+        self.theme = "dark" if self.theme_toggle.isChecked() else "light"
+        self.settings['theme'] = self.theme
+        save_progress(self.settings)
+        self.apply_theme()
+
+    # Reads the background sampler's latest snapshot; no syscalls here.
+    def update_resources(self):
+        usage = self.sampler.latest() if self.sampler else None
+        if usage:
+            cpu = self.sampler.history("raw", 60)["cpu_percent"]
+            self.resource_label.setText(f"<b>Resources:</b> CPU: {usage['cpu_percent']}% {sparkline(cpu, 30)} | "
+                                        f"RAM: {usage['memory_percent']}% | Disk: {usage['disk_percent']}%")
+        else:
+            self.resource_label.setText("<b>Resources:</b> CPU: -- | RAM: -- | Disk: --")
+        # A scan handed to the daemon runs there, so its rates come with
+        # the daemon's progress events rather than from this process.
+        files_per_sec, bytes_per_sec = METRICS.throughput()
+        hit_rate = METRICS.cache_hit_rate()
+        rates = self.scan_worker.daemon_rates if self.scan_worker is not None else None
+        if rates is not None:
+            files_per_sec, bytes_per_sec, hit_rate = rates
+        if rates is not None or METRICS.scans_running:
+            self.throughput_label.setText(f"<b>Scan throughput:</b> {files_per_sec:.0f} files/s | "
+                                          f"{bytes_per_sec / 1e6:.1f} MB/s | "
+                                          f"cache hits {hit_rate:.0%}")
+        else:
+            self.throughput_label.setText("<b>Scan throughput:</b> idle")
+
+    def start_scan(self, quick=False):
+        if self.scanning:
+            self.scan_worker.stop()
+            self.scan_btn.setEnabled(False)
+            self.status_label.setText("<b>Status:</b> Stopping scan...")
+            return
+        self.status_label.setText("<b>Status:</b> Ranking files by risk..." if quick
+                                  else "<b>Status:</b> Scanning...")
+        self.scan_progress.setValue(0)
+        self.scan_progress.setMaximum(0)
+        self.scan_model.clear()
+        self.scan_btn.setText("Stop Scan")
+        self.quick_scan_btn.setEnabled(False)
+        self.scanning = True
+        self.scan_thread = QtCore.QThread()
+        self.scan_worker = ScanWorker("/", quick=quick, time_budget=self.quick_budget.value() * 60)
+        self.scan_worker.moveToThread(self.scan_thread)
+        self.scan_thread.started.connect(self.scan_worker.run)
+        self.scan_worker.batch.connect(self.scan_model.add_batch)
+        self.scan_worker.progress.connect(self.scan_progressed)
+        self.scan_worker.finished.connect(self.scan_finished)
+        self.scan_worker.finished.connect(self.scan_thread.quit)
+        self.scan_thread.finished.connect(self.scan_thread_done)
+        self.scan_thread.start()
+
+    def scan_progressed(self, done, discovered, walk_finished):
+        # Until the walk finishes the total is a lower bound, so the bar
+        # stays in busy mode and the label says so.
+        if walk_finished:
+            self.scan_progress.setMaximum(max(discovered, 1))
+            self.scan_progress.setValue(done)
+            self.status_label.setText(f"<b>Status:</b> Scanning... {done} of {discovered} files")
+        else:
+            self.status_label.setText(f"<b>Status:</b> Scanning... {done} of {discovered}+ files")
+
+    # The worker and thread are only released once the thread has exited.
+    def scan_thread_done(self):
+        self.scan_worker = None
+        self.scan_thread = None
+
+    def scan_finished(self, threats, summary):
+        self.scanning = False
+        self.scan_btn.setText("Start Scan")
+        self.scan_btn.setEnabled(True)
+        self.quick_scan_btn.setEnabled(True)
+        self.scan_progress.setMaximum(100)
+        self.scan_progress.setValue(100 if summary.get("complete") else 0)
+        coverage = summary.get("coverage")
+        if "error" in summary:
+            self.status_label.setText(f"<b>Status:</b> Scan failed: {summary['error']}")
+        elif coverage:
+            self.scan_progress.setValue(round(coverage["risk_covered"] * 100))
+            self.status_label.setText(f"<b>Status:</b> Quick scan done. {len(threats)} threats quarantined; "
+                                      f"{coverage['files']} of {coverage['candidates']} files, "
+                                      f"{coverage['risk_covered']:.0%} of the risk covered.")
+        elif summary.get("complete"):
+            self.status_label.setText(f"<b>Status:</b> Scan Complete. {len(threats)} threats quarantined.")
+        else:
+            self.status_label.setText(f"<b>Status:</b> Scan stopped. {len(threats)} threats quarantined.")
+
+    def clean_quarantine(self):
+        clean_quarantine()
+        self.status_label.setText("<b>Status:</b> Quarantine Cleaned")
+        self.update_quarantine_list()
+
+    def update_quarantine_list(self):
+        total = count_quarantine()
+        if total:
+            lines = [format_item(item) for item in list_quarantine(QUARANTINE_PAGE_SIZE)]
+            if total > len(lines):
+                lines.append(f"... and {total - len(lines)} older items")
+            self.quarantine_list.setPlainText("\n".join(lines))
+        else:
+            self.quarantine_list.setPlainText("Quarantine is empty.")
+
+def launch_ui():
+    app = QtWidgets.QApplication([])
+    window = MainWindow()
+    window.show()
+    app.exec_()
+    close_process_scanner()
+
@@ -0,0 +1,129 @@
+# hash_cache.py
+# Persistent cache of file digests keyed on inode metadata, so files that
+# have not changed since the last scan are judged without being opened.
+import json
+import os
+import sqlite3
+import threading
+import time
+
+HASH_CACHE_FILE = os.path.expanduser("~/.cache/antigus/hash_cache.db")
+# Entries kept before the least recently seen ones are evicted.
+DEFAULT_MAX_ENTRIES = 2000000
+# Writes are grouped into one transaction every this many changes.
+COMMIT_EVERY = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_hashes (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ctime_ns INTEGER NOT NULL,
+    digests TEXT NOT NULL,
+    last_seen INTEGER NOT NULL,
+    PRIMARY KEY (dev, ino)
+);
+CREATE INDEX IF NOT EXISTS file_hashes_last_seen ON file_hashes (last_seen);
+"""
+
+
+def cache_key(st):
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+
+class HashCache:
+
+    def __init__(self, path=HASH_CACHE_FILE, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        self._seen = []
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One connection shared by the walker and verdict threads, guarded
+        # by self._lock. WAL keeps committed entries safe across crashes.
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._count = self._db.execute("SELECT COUNT(*) FROM file_hashes").fetchone()[0]
+
+    # Example: Look up the digests for a stat result.
+    # Returns None unless every requested algorithm is cached for exactly
+    # this (dev, inode, size, mtime, ctime).
+    def get(self, st, algorithms):
+        dev, ino, size, mtime_ns, ctime_ns = cache_key(st)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size, mtime_ns, ctime_ns, digests FROM file_hashes WHERE dev=? AND ino=?",
+                (dev, ino)).fetchone()
+            if row and row[:3] == (size, mtime_ns, ctime_ns):
+                digests = json.loads(row[3])
+                if all(name in digests for name in algorithms):
+                    self.hits += 1
+                    self._seen.append((dev, ino))
+                    self._note_write()
+                    return {name: digests[name] for name in algorithms}
+            self.misses += 1
+            return None
+
+    def put(self, st, digests):
+        if not digests:
+            return
+        dev, ino, size, mtime_ns, ctime_ns = cache_key(st)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (dev, ino, size, mtime_ns, ctime_ns, json.dumps(digests), int(time.time())))
+            # Replacements are counted too; _evict recounts exactly.
+            self._count += 1
+            self._note_write()
+
+    def _note_write(self):
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self._commit()
+
+    # Caller holds self._lock.
+    def _commit(self):
+        if self._seen:
+            now = int(time.time())
+            self._db.executemany("UPDATE file_hashes SET last_seen=? WHERE dev=? AND ino=?",
+                                 [(now, dev, ino) for dev, ino in self._seen])
+            self._seen = []
+        self._db.commit()
+        self._pending = 0
+        if self._count >= self.max_entries:
+            self._evict()
+
+    # Drop the least recently seen tenth of the cache once it is full.
+    def _evict(self):
+        excess = self._db.execute("SELECT COUNT(*) FROM file_hashes").fetchone()[0] - self.max_entries * 9 // 10
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM file_hashes WHERE rowid IN "
+                "(SELECT rowid FROM file_hashes ORDER BY last_seen LIMIT ?)", (excess,))
+            self._db.commit()
+        self._count = self._db.execute("SELECT COUNT(*) FROM file_hashes").fetchone()[0]
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._db.close()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self._count,
+        }
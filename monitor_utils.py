@@ -1,13 +1,180 @@
 # monitor_utils.py
 # Utility functions for monitoring system changes
+#
+# Resource usage is sampled by one background thread into fixed-size ring
+# buffers (flat arrays of doubles, not lists of dicts), with 1 minute and
+# 1 hour averages rolled up as samples come in. The GUI and the CLI read
+# snapshots of these, so drawing a trend never makes a syscall on the UI
+# thread.
+import threading
+import time
+from array import array
+
 import psutil
 
+FIELDS = ("cpu_percent", "memory_percent", "disk_percent")
+SAMPLE_INTERVAL = 1.0
+# Disk usage changes slowly; statvfs it every this many seconds.
+DISK_INTERVAL = 30.0
+DISK_PATH = "/"
+# Raw samples kept (an hour at one per second), then 1 minute averages for
+# a day and 1 hour averages for a week.
+RAW_CAPACITY = 3600
+MINUTE_CAPACITY = 24 * 60
+HOUR_CAPACITY = 7 * 24
+RESOLUTIONS = ("raw", "1m", "1h")
+
 def list_processes():
     return [(p.pid, p.name()) for p in psutil.process_iter()]
 
+
+# Fixed-size history of (time, value, value, ...) rows stored in one array;
+# the oldest rows are overwritten once it is full.
+class RingBuffer:
+
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.width = width + 1    # the timestamp comes first
+        self._data = array("d", bytes(8 * capacity * self.width))
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, values):
+        start = self._next * self.width
+        self._data[start] = timestamp
+        self._data[start + 1:start + self.width] = array("d", values)
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    # Rows oldest first, optionally only the last n.
+    def rows(self, n=None):
+        n = self._count if n is None else min(n, self._count)
+        first = (self._next - n) % self.capacity
+        w = self.width
+        out = []
+        for i in range(n):
+            start = ((first + i) % self.capacity) * w
+            out.append(tuple(self._data[start:start + w]))
+        return out
+
+
+# Averages samples over fixed periods into a coarser ring buffer.
+class Rollup:
+
+    def __init__(self, period, capacity, width):
+        self.period = period
+        self.buffer = RingBuffer(capacity, width)
+        self._bucket = None
+        self._sums = array("d", bytes(8 * width))
+        self._count = 0
+
+    def add(self, timestamp, values):
+        bucket = int(timestamp // self.period)
+        if bucket != self._bucket:
+            self.flush()
+            self._bucket = bucket
+        for i, v in enumerate(values):
+            self._sums[i] += v
+        self._count += 1
+
+    def flush(self):
+        if self._count:
+            self.buffer.append(self._bucket * self.period, [s / self._count for s in self._sums])
+        self._sums = array("d", bytes(8 * len(self._sums)))
+        self._count = 0
+
+
+class ResourceSampler:
+
+    def __init__(self, interval=SAMPLE_INTERVAL, disk_path=DISK_PATH, disk_interval=DISK_INTERVAL):
+        self.interval = interval
+        self.disk_path = disk_path
+        self.disk_interval = disk_interval
+        self._lock = threading.Lock()
+        self._buffers = {
+            "raw": RingBuffer(RAW_CAPACITY, len(FIELDS)),
+            "1m": Rollup(60, MINUTE_CAPACITY, len(FIELDS)),
+            "1h": Rollup(3600, HOUR_CAPACITY, len(FIELDS)),
+        }
+        self._latest = None
+        self._disk = 0.0
+        self._disk_checked = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _disk_percent(self, now):
+        if now - self._disk_checked >= self.disk_interval:
+            self._disk_checked = now
+            try:
+                self._disk = psutil.disk_usage(self.disk_path).percent
+            except OSError:
+                pass
+        return self._disk
+
+    def sample(self):
+        now = time.time()
+        # cpu_percent(None) is the usage since the previous call, which
+        # this thread makes once per interval.
+        values = (psutil.cpu_percent(None), psutil.virtual_memory().percent, self._disk_percent(now))
+        with self._lock:
+            self._buffers["raw"].append(now, values)
+            self._buffers["1m"].add(now, values)
+            self._buffers["1h"].add(now, values)
+            self._latest = dict(zip(FIELDS, values), time=now)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        # The first CPU figure needs a baseline; wait briefly for it once.
+        psutil.cpu_percent(None)
+        time.sleep(0.1)
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name="antigus-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    # Example: {"cpu_percent": 3.5, "memory_percent": 41.2, "disk_percent": 19.0, "time": ...}
+    def latest(self):
+        with self._lock:
+            return dict(self._latest) if self._latest else None
+
+    # Example: History at "raw" (per sample), "1m" or "1h" resolution, oldest
+    # first: {"time": [...], "cpu_percent": [...], ...}. The 1m and 1h
+    # series only hold periods that have ended.
+    def history(self, resolution="raw", count=None):
+        with self._lock:
+            buffer = self._buffers[resolution]
+            rows = (buffer if resolution == "raw" else buffer.buffer).rows(count)
+        columns = list(zip(*rows)) if rows else [()] * (len(FIELDS) + 1)
+        out = {"time": list(columns[0])}
+        for i, name in enumerate(FIELDS):
+            out[name] = list(columns[i + 1])
+        return out
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+# Example: The shared sampler, started on first use.
+def get_sampler():
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = ResourceSampler().start()
+        return _sampler
+
+
 def get_resource_usage():
-    return {
-        'cpu_percent': psutil.cpu_percent(),
-        'memory_percent': psutil.virtual_memory().percent,
-        'disk_percent': psutil.disk_usage('/').percent
-    }
+    usage = get_sampler().latest()
+    return {name: usage[name] for name in FIELDS}
@@ -0,0 +1,97 @@
+# prefilter.py
+# Cheap checks run before the signature store: files whose size no
+# signature has are never opened, and digests go through an in-memory
+# Bloom filter before the on-disk lookup.
+import math
+
+
+class BloomFilter:
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(1, capacity)
+        self.bits = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._array = bytearray((self.bits + 7) // 8)
+
+    # Digests are already uniformly distributed, so the bit positions are
+    # taken straight from their bytes (double hashing).
+    def _positions(self, digest):
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, digest):
+        for pos in self._positions(digest):
+            self._array[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, digest):
+        array = self._array
+        for pos in self._positions(digest):
+            if not array[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class ScanPrefilter:
+
+    def __init__(self, store, error_rate=0.001):
+        self.store = store
+        self.sizes = store.known_sizes()
+        self.bloom = BloomFilter(len(store), error_rate)
+        for digest in store.iter_digests():
+            self.bloom.add(digest)
+        # Updated by the walker thread.
+        self.files = 0
+        self.skipped = 0
+        self.bytes_skipped = 0
+        # Skipped files whose first bytes were still read, to find archives.
+        self.sniffed = 0
+        # Updated by the verdict thread.
+        self.lookups = 0
+        self.bloom_passed = 0
+        self.false_positives = 0
+
+    # Example: Decide from the stat() size alone whether a file needs hashing
+    def should_hash(self, size):
+        self.files += 1
+        if self.sizes is None or size in self.sizes:
+            return True
+        self.skipped += 1
+        self.bytes_skipped += size
+        return False
+
+    # Same contract as scanner_utils.match_digests, but only digests that
+    # pass the Bloom filter touch the store.
+    def match(self, digests):
+        if not digests:
+            return None
+        for h in digests.values():
+            self.lookups += 1
+            raw = bytes.fromhex(h)
+            if raw not in self.bloom:
+                continue
+            self.bloom_passed += 1
+            if self.store.contains_digest(raw):
+                return h
+            self.false_positives += 1
+        return None
+
+    def report(self):
+        negatives = self.lookups - (self.bloom_passed - self.false_positives)
+        return {
+            "files": self.files,
+            "skipped_by_size": self.skipped,
+            "skip_ratio": self.skipped / self.files if self.files else 0.0,
+            "bytes_skipped": self.bytes_skipped,
+            "sniffed_for_archives": self.sniffed,
+            "bloom_lookups": self.lookups,
+            "bloom_false_positives": self.false_positives,
+            "bloom_false_positive_rate": self.false_positives / negatives if negatives else 0.0,
+        }
+
+
+# Example: Build a prefilter for a signature store, or None for plain lists
+def build_prefilter(bad_hashes):
+    if not hasattr(bad_hashes, "iter_digests") or not len(bad_hashes):
+        return None
+    return ScanPrefilter(bad_hashes)
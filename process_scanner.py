@@ -0,0 +1,222 @@
+# process_scanner.py
+# Incremental process scanner. Each pass lists the running PIDs, examines
+# only the ones that appeared since the last pass, matches their names and
+# command lines against every pattern at once (Aho-Corasick) and checks the
+# binary behind /proc/<pid>/exe against the signatures, hashing each
+# executable once for as long as it is unchanged.
+import os
+import threading
+import time
+
+from aho_corasick import AhoCorasick
+from scanner_utils import DEFAULT_ALGORITHMS, file_digests, match_digests
+
+PROCESS_PATTERNS_FILE = "antigus_process_patterns.txt"
+# One pattern per line; "name:" limits it to process names and "cmdline:"
+# to command lines, anything else is matched against both.
+DEFAULT_PATTERNS = [
+    "name:hack", "name:crack", "name:keygen", "name:inject", "name:miner",
+    "name:steal", "name:spy", "name:rat", "name:trojan", "name:suspicious",
+    "cmdline:stratum+tcp://", "cmdline:xmrig", "cmdline:/dev/tcp/",
+]
+SCOPES = ("name", "cmdline")
+# Executables whose digests are remembered in memory, keyed on inode data.
+EXE_MEMO_SIZE = 4096
+WATCH_INTERVAL = 0.5
+
+_PROC = "/proc"
+
+
+# Example: Read process patterns from a definitions file, or the defaults
+def load_process_patterns(path=PROCESS_PATTERNS_FILE):
+    try:
+        with open(path) as f:
+            patterns = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    except OSError:
+        return list(DEFAULT_PATTERNS)
+    return patterns or list(DEFAULT_PATTERNS)
+
+
+def _parse_pattern(line):
+    scope, sep, text = line.partition(":")
+    if sep and scope in SCOPES:
+        return scope, text
+    return None, line
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class ProcessScanner:
+
+    def __init__(self, patterns=None, bad_hashes=None, cache=None, algorithms=None):
+        patterns = load_process_patterns() if patterns is None else patterns
+        parsed = [_parse_pattern(p) for p in patterns]
+        # One automaton for both fields; each hit carries its scope.
+        self.matcher = AhoCorasick([text for _, text in parsed], values=parsed)
+        self.bad_hashes = bad_hashes if bad_hashes is not None else []
+        self.cache = cache
+        self.algorithms = algorithms or getattr(self.bad_hashes, "algorithms", DEFAULT_ALGORITHMS)
+        # (pid, start time) of every process seen, so a PID the kernel has
+        # handed to a new process counts as new.
+        self._known = set()
+        # Findings for processes that are still running, by (pid, start time).
+        self.active = {}
+        self._exe_memo = {}
+        self._users = {}
+        self._lock = threading.Lock()
+        self.passes = 0
+        self.examined = 0
+        self.hashed = 0
+        self.last_pass_seconds = 0.0
+
+    # Example: {(1, 4), (812, 95120), ...} -- each running process as its
+    # PID and start time (clock ticks since boot, field 22 of
+    # /proc/<pid>/stat; psutil's create_time elsewhere).
+    def _processes(self):
+        if not os.path.isdir(_PROC):
+            import psutil
+            return {(p.pid, p.info["create_time"]) for p in psutil.process_iter(["create_time"])}
+        processes = set()
+        for name in os.listdir(_PROC):
+            if not name.isdigit():
+                continue
+            try:
+                stat = _read(f"{_PROC}/{name}/stat")
+            except OSError:
+                continue   # exited since the listing
+            # The name in parentheses may hold spaces; fields resume after it.
+            processes.add((int(name), int(stat[stat.rindex(b")") + 2:].split()[19])))
+        return processes
+
+    def _username(self, uid):
+        name = self._users.get(uid)
+        if name is None:
+            try:
+                import pwd
+                name = pwd.getpwuid(uid).pw_name
+            except (ImportError, KeyError):
+                name = str(uid)
+            self._users[uid] = name
+        return name
+
+    def _info(self, pid):
+        base = f"{_PROC}/{pid}"
+        if not os.path.isdir(base):
+            import psutil
+            p = psutil.Process(pid)
+            return {"pid": pid, "name": p.name(), "cmdline": " ".join(p.cmdline()),
+                    "exe": p.exe() or None, "exe_path": p.exe() or None, "username": p.username()}
+        name = _read(f"{base}/comm").decode(errors="replace").strip()
+        cmdline = _read(f"{base}/cmdline").replace(b"\0", b" ").decode(errors="replace").strip()
+        try:
+            exe = os.readlink(f"{base}/exe")
+        except OSError:
+            exe = None   # kernel threads, or no permission
+        return {"pid": pid, "name": name, "cmdline": cmdline, "exe": exe,
+                "exe_path": f"{base}/exe" if exe else None,
+                "username": self._username(os.stat(base).st_uid)}
+
+    # Digests of a process's binary. /proc/<pid>/exe is opened rather than
+    # the path, so deleted or replaced binaries are still read.
+    def _exe_digests(self, exe_path):
+        try:
+            st = os.stat(exe_path)
+        except OSError:
+            return None
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        digests = self._exe_memo.get(key)
+        if digests is not None:
+            return digests
+        if self.cache is not None:
+            digests = self.cache.get(st, self.algorithms)
+        if digests is None:
+            digests = file_digests(exe_path, self.algorithms)
+            self.hashed += 1
+            if digests and self.cache is not None:
+                self.cache.put(st, digests)
+        if digests:
+            if len(self._exe_memo) >= EXE_MEMO_SIZE:
+                self._exe_memo.clear()
+            self._exe_memo[key] = digests
+        return digests
+
+    def examine(self, pid):
+        info = self._info(pid)
+        patterns = []
+        for scope, field in (("name", info["name"]), ("cmdline", info["cmdline"])):
+            for hit_scope, text in self.matcher.search(field):
+                if hit_scope in (None, scope) and text not in patterns:
+                    patterns.append(text)
+        info["patterns"] = patterns
+        info["digest"] = None
+        if info["exe_path"] and self.bad_hashes:
+            info["digest"] = match_digests(self._exe_digests(info["exe_path"]), self.bad_hashes)
+        del info["exe_path"]
+        return info
+
+    # Example: One pass; returns findings for processes started since the
+    # previous pass (every process on the first pass). Each finding is a
+    # dict with pid, name, cmdline, exe, username, patterns and digest.
+    def scan(self, rescan=False):
+        with self._lock:
+            started = time.perf_counter()
+            hashed = self.hashed
+            processes = self._processes()
+            new = processes if rescan else processes - self._known
+            for key in self._known - processes:
+                self.active.pop(key, None)
+            self._known = processes
+            findings = []
+            for key in sorted(new):
+                try:
+                    info = self.examine(key[0])
+                except (OSError, ValueError):
+                    continue   # exited while being examined
+                except Exception:
+                    continue   # psutil.NoSuchProcess, AccessDenied
+                self.examined += 1
+                if info["patterns"] or info["digest"]:
+                    findings.append(info)
+                    self.active[key] = info
+            if self.cache is not None and self.hashed != hashed:
+                self.cache.flush()
+            self.passes += 1
+            self.last_pass_seconds = time.perf_counter() - started
+            return findings
+
+    # Example: Suspicious processes still running, after a pass that only
+    # looks at the new ones.
+    def running_findings(self):
+        self.scan()
+        return [self.active[key] for key in sorted(self.active)]
+
+    # Example: Poll until stop_event is set, calling on_finding(info) for
+    # each suspicious new process.
+    def watch(self, on_finding, stop_event, interval=WATCH_INTERVAL):
+        while not stop_event.is_set():
+            for info in self.scan():
+                on_finding(info)
+            stop_event.wait(interval)
+
+    # Closes the hash cache the scanner was given.
+    def close(self):
+        with self._lock:
+            if self.cache is not None:
+                self.cache.close()
+                self.cache = None
+
+    def stats(self):
+        return {"passes": self.passes, "tracked": len(self._known), "examined": self.examined,
+                "executables_hashed": self.hashed, "last_pass_seconds": round(self.last_pass_seconds, 4)}
+
+
+# Example: One line per finding, as shown by the CLI and the GUI.
+def format_finding(info):
+    reasons = [f"pattern {p!r}" for p in info["patterns"]]
+    if info["digest"]:
+        reasons.append(f"binary matches {info['digest']}")
+    return (f"- {info['name']} (PID: {info['pid']}, User: {info['username']}"
+            f"{', Exe: ' + info['exe'] if info['exe'] else ''}): {', '.join(reasons)}")
@@ -1,49 +1,355 @@
 # quarantine.py
 # Functions for managing quarantined files
+#
+# Quarantined files are kept in a content-addressed vault: each distinct
+# content is stored once, gzip-compressed, under objects/<sha256>, and a
+# SQLite catalog records every quarantined path with its owner, mode, time
+# and digest. Listing, restore and purge go through indexed queries, so
+# they stay instant with hundreds of thousands of items.
+import errno
+import hashlib
 import os
-import shutil
+import sqlite3
+import stat
+import threading
+import time
+import zlib
+
+from scan_metrics import METRICS
+from scanner_utils import CHUNK_SIZE
 
 QUARANTINE_DIR = os.path.expanduser("~/linuxguardian_quarantine")
+CATALOG_NAME = "catalog.db"
+# Items shown per page by the list functions.
+QUARANTINE_PAGE_SIZE = 50
+COMPRESS_LEVEL = 6
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL,
+    original_path TEXT NOT NULL,
+    uid INTEGER,
+    gid INTEGER,
+    mode INTEGER,
+    size INTEGER NOT NULL,
+    quarantined_at REAL NOT NULL,
+    signature TEXT
+);
+CREATE INDEX IF NOT EXISTS items_digest ON items (digest);
+CREATE INDEX IF NOT EXISTS items_time ON items (quarantined_at);
+CREATE INDEX IF NOT EXISTS items_path ON items (original_path);
+"""
+_COLUMNS = ("id", "digest", "path", "uid", "gid", "mode", "size", "time", "signature")
+# The catalog's PRAGMA user_version once files left by earlier versions
+# have been imported.
+_LEGACY_IMPORTED = 1
+
+
+class QuarantineVault:
+
+    def __init__(self, directory=QUARANTINE_DIR):
+        self.directory = directory
+        self.objects = os.path.join(directory, "objects")
+        self.staging = os.path.join(directory, "staging")
+        os.makedirs(self.objects, mode=0o700, exist_ok=True)
+        os.makedirs(self.staging, mode=0o700, exist_ok=True)
+        # Shared by the scan verdict thread and the monitor workers.
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, CATALOG_NAME), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        if self._db.execute("PRAGMA user_version").fetchone()[0] < _LEGACY_IMPORTED:
+            self._import_legacy()
+
+    def object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest)
+
+    # Files moved in by name by earlier versions sit at the top level. Runs
+    # once per vault; the catalog records that it has.
+    def _import_legacy(self):
+        with os.scandir(self.directory) as it:
+            legacy = [e.path for e in it if e.is_file(follow_symlinks=False)
+                      and not e.name.startswith(CATALOG_NAME)]
+        for path in legacy:
+            try:
+                self.add(path)
+            except OSError as e:
+                print(f"Could not import {path} into the quarantine catalog: {e}")
+        with self._lock:
+            self._db.execute(f"PRAGMA user_version = {_LEGACY_IMPORTED}")
+            self._db.commit()
+
+    # Stream the open file f into a compressed temporary object while
+    # hashing it. Returns (digest, size, temp path).
+    def _store(self, f):
+        tmp = os.path.join(self.staging, f"obj-{os.getpid()}-{threading.get_ident()}-{time.monotonic_ns()}")
+        hasher = hashlib.sha256()
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+        size = 0
+        buf = bytearray(CHUNK_SIZE)
+        try:
+            with open(tmp, "wb") as out:
+                while True:
+                    n = f.readinto(buf)
+                    if not n:
+                        break
+                    with memoryview(buf)[:n] as block:
+                        hasher.update(block)
+                        out.write(compressor.compress(block))
+                    size += n
+                out.write(compressor.flush())
+                out.flush()
+                os.fsync(out.fileno())
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return hasher.hexdigest(), size, tmp
+
+    # Example: Quarantine one file; returns its catalog id.
+    # The file is opened (never through a symlink) and checked to be a
+    # regular file first, so what cannot be quarantined stays where it is.
+    # On the vault's device it is then renamed into staging, which takes it
+    # away from its original path atomically; across devices it is copied
+    # in a streaming pass and then unlinked. If storing it or cataloging it
+    # fails, it is renamed back.
+    def add(self, path, signature=None):
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0) | getattr(os, "O_NONBLOCK", 0))
+        with os.fdopen(fd, "rb") as f:
+            st = os.fstat(fd)
+            if not stat.S_ISREG(st.st_mode):
+                raise OSError(errno.EINVAL, "not a regular file", path)
+            staged = os.path.join(self.staging, f"in-{os.getpid()}-{threading.get_ident()}-{time.monotonic_ns()}")
+            try:
+                os.rename(path, staged)
+                src = staged
+            except OSError:
+                src = None   # another device (EXDEV) or no rename permission
+            obj = None
+            try:
+                moved = os.lstat(src) if src else st
+                if (moved.st_dev, moved.st_ino) != (st.st_dev, st.st_ino):
+                    # Replaced between the open and the rename.
+                    raise OSError(errno.EAGAIN, "file changed while being quarantined", path)
+                digest, size, tmp = self._store(f)
+                with self._lock:
+                    if os.path.exists(self.object_path(digest)):
+                        os.remove(tmp)   # this content is already in the vault
+                    else:
+                        obj = self.object_path(digest)
+                        os.makedirs(os.path.dirname(obj), mode=0o700, exist_ok=True)
+                        os.chmod(tmp, 0o400)
+                        os.replace(tmp, obj)
+                    try:
+                        cur = self._db.execute(
+                            "INSERT INTO items (digest, original_path, uid, gid, mode, size, quarantined_at, "
+                            "signature) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (digest, os.path.abspath(path), st.st_uid, st.st_gid, st.st_mode & 0o7777,
+                             size, time.time(), signature))
+                        self._db.commit()
+                    except BaseException:
+                        self._db.rollback()
+                        raise
+            except BaseException:
+                if obj:
+                    os.remove(obj)
+                if src:
+                    os.rename(src, path)
+                raise
+        os.remove(src or path)
+        return cur.lastrowid
+
+    # Example: One page of items, newest first. Pass the last id of a page
+    # as before to get the next one.
+    def list(self, limit=QUARANTINE_PAGE_SIZE, before=None):
+        query = "SELECT id, digest, original_path, uid, gid, mode, size, quarantined_at, signature FROM items"
+        args = ()
+        if before is not None:
+            query += " WHERE id < ?"
+            args = (before,)
+        query += " ORDER BY id DESC LIMIT ?"
+        with self._lock:
+            rows = self._db.execute(query, args + (limit,)).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def get(self, item_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, digest, original_path, uid, gid, mode, size, quarantined_at, signature "
+                "FROM items WHERE id = ?", (item_id,)).fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def find(self, path, limit=QUARANTINE_PAGE_SIZE):
+        with self._lock:
+            ids = self._db.execute("SELECT id FROM items WHERE original_path = ? ORDER BY id DESC LIMIT ?",
+                                   (os.path.abspath(path), limit)).fetchall()
+        return [self.get(i) for (i,) in ids]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    # Remove catalog rows; objects no other row refers to are deleted.
+    # Caller holds self._lock.
+    def _drop(self, items):
+        self._db.executemany("DELETE FROM items WHERE id = ?", [(i["id"],) for i in items])
+        for digest in {i["digest"] for i in items}:
+            if not self._db.execute("SELECT 1 FROM items WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+                try:
+                    os.remove(self.object_path(digest))
+                except FileNotFoundError:
+                    pass
+        self._db.commit()
+
+    # Example: Put an item back (at its original path unless restore_path is
+    # given) with its mode and, when permitted, its owner. An existing file
+    # at the destination is only replaced with overwrite=True; otherwise
+    # FileExistsError is raised and the item stays in the vault.
+    def restore(self, item_id, restore_path=None, overwrite=False):
+        item = self.get(item_id)
+        if item is None:
+            raise KeyError(item_id)
+        dest = restore_path or item["path"]
+        if os.path.isdir(dest):
+            dest = os.path.join(dest, os.path.basename(item["path"]))
+        if not overwrite and os.path.lexists(dest):
+            raise FileExistsError(errno.EEXIST, "destination exists", dest)
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        tmp = f"{dest}.antigus-restore"
+        decompressor = zlib.decompressobj(31)
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            with open(self.object_path(item["digest"]), "rb") as f, open(fd, "wb") as out:
+                while True:
+                    block = f.read(CHUNK_SIZE)
+                    if not block:
+                        break
+                    out.write(decompressor.decompress(block))
+                out.write(decompressor.flush())
+            os.chmod(tmp, item["mode"] or 0o600)
+            try:
+                os.chown(tmp, item["uid"], item["gid"])
+            except (OSError, TypeError):
+                pass
+            if overwrite:
+                os.replace(tmp, dest)
+            else:
+                # link() fails if dest has appeared since the check above.
+                try:
+                    os.link(tmp, dest)
+                except FileExistsError:
+                    raise
+                except OSError:
+                    os.rename(tmp, dest)   # no hard links on this filesystem
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        with self._lock:
+            self._drop([item])
+        return dest
+
+    def delete(self, item_id):
+        item = self.get(item_id)
+        if item is None:
+            raise KeyError(item_id)
+        with self._lock:
+            self._drop([item])
+
+    # Example: Delete everything quarantined before older_than (a timestamp;
+    # None for all), a batch at a time. Returns the number of items removed.
+    def purge(self, older_than=None, batch=1000):
+        removed = 0
+        while True:
+            with self._lock:
+                if older_than is None:
+                    rows = self._db.execute("SELECT id, digest FROM items ORDER BY id LIMIT ?",
+                                            (batch,)).fetchall()
+                else:
+                    rows = self._db.execute("SELECT id, digest FROM items WHERE quarantined_at < ? "
+                                            "ORDER BY quarantined_at LIMIT ?", (older_than, batch)).fetchall()
+                if not rows:
+                    return removed
+                self._drop([{"id": i, "digest": d} for i, d in rows])
+            removed += len(rows)
+
+    def stats(self):
+        with self._lock:
+            items, objects, size = self._db.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT digest), COALESCE(SUM(size), 0) FROM items").fetchone()
+        return {"items": items, "objects": objects, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_vault = None
+_vault_lock = threading.Lock()
+
+def get_vault():
+    global _vault
+    with _vault_lock:
+        if _vault is None or _vault.directory != QUARANTINE_DIR:
+            _vault = QuarantineVault(QUARANTINE_DIR)
+        return _vault
 
 def configure_quarantine_dir(custom_path=None):
     global QUARANTINE_DIR
     if custom_path:
         QUARANTINE_DIR = os.path.expanduser(custom_path)
-    if not os.path.exists(QUARANTINE_DIR):
-        os.makedirs(QUARANTINE_DIR)
+    get_vault()
     print(f"Quarantine directory set to: {QUARANTINE_DIR}")
 
-def quarantine_file(path):
+def quarantine_file(path, signature=None):
+    started = time.perf_counter()
     try:
-        base = os.path.basename(path)
-        dest = os.path.join(QUARANTINE_DIR, base)
-        shutil.move(path, dest)
+        item_id = get_vault().add(path, signature)
+        METRICS.observe("quarantine", time.perf_counter() - started)
+        METRICS.add("quarantined")
         print(f"File {path} moved to quarantine.")
+        return item_id
     except Exception as e:
+        METRICS.add("quarantine_errors")
         print(f"Failed to quarantine {path}: {e}")
+        return None
 
-def restore_file(filename, restore_path):
-    src = os.path.join(QUARANTINE_DIR, filename)
+def restore_file(item_id, restore_path=None, overwrite=False):
     try:
-        shutil.move(src, restore_path)
-        print(f"File {filename} restored to {restore_path}.")
+        dest = get_vault().restore(int(item_id), restore_path, overwrite)
+        print(f"Item {item_id} restored to {dest}.")
+        return dest
     except Exception as e:
-        print(f"Failed to restore {filename}: {e}")
+        print(f"Failed to restore {item_id}: {e}")
+        return None
 
-def delete_quarantined_file(filename):
-    path = os.path.join(QUARANTINE_DIR, filename)
+def delete_quarantined_file(item_id):
     try:
-        os.remove(path)
-        print(f"File {filename} deleted from quarantine.")
+        get_vault().delete(int(item_id))
+        print(f"Item {item_id} deleted from quarantine.")
     except Exception as e:
-        print(f"Failed to delete {filename}: {e}")
+        print(f"Failed to delete {item_id}: {e}")
+
+def purge_quarantine(older_than=None):
+    return get_vault().purge(older_than)
+
+# Example: One page of quarantined items (dicts), newest first
+def list_quarantine(limit=QUARANTINE_PAGE_SIZE, before=None):
+    return get_vault().list(limit, before)
+
+def count_quarantine():
+    return len(get_vault())
+
+def format_item(item):
+    return (f"[{item['id']}] {item['path']}  ({item['size']} bytes, "
+            f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(item['time']))}, sha256 {item['digest'][:16]})")
 
-def list_quarantine():
-    files = os.listdir(QUARANTINE_DIR)
-    print("Quarantined files:")
-    for f in files:
-        print(f"- {f}")
-    return files
+def print_quarantine(limit=QUARANTINE_PAGE_SIZE, before=None):
+    items = list_quarantine(limit, before)
+    print(f"Quarantined files ({count_quarantine()} total):")
+    for item in items:
+        print(f"- {format_item(item)}")
+    return items
 
 if __name__ == "__main__":
     print("Linux Guardian Quarantine Utility")
@@ -51,18 +357,28 @@ if __name__ == "__main__":
     print("2. Restore a file")
     print("3. Delete a file")
     print("4. Set quarantine directory")
+    print("5. Purge quarantine")
     choice = input("Select an option: ")
     if choice == "1":
-        list_quarantine()
+        before = None
+        while True:
+            items = print_quarantine(before=before)
+            if len(items) < QUARANTINE_PAGE_SIZE or input("More? [y/N] ").strip().lower() != "y":
+                break
+            before = items[-1]["id"]
     elif choice == "2":
-        fname = input("Enter filename to restore: ")
-        rpath = input("Enter restore path: ")
-        restore_file(fname, rpath)
+        item_id = input("Enter item id to restore: ")
+        rpath = input("Enter restore path (blank for the original path): ").strip()
+        restore_file(item_id, rpath or None)
     elif choice == "3":
-        fname = input("Enter filename to delete: ")
-        delete_quarantined_file(fname)
+        item_id = input("Enter item id to delete: ")
+        delete_quarantined_file(item_id)
     elif choice == "4":
         newdir = input("Enter new quarantine directory: ")
         configure_quarantine_dir(newdir)
+    elif choice == "5":
+        days = input("Purge items older than how many days (blank for all)? ").strip()
+        cutoff = time.time() - float(days) * 86400 if days else None
+        print(f"{purge_quarantine(cutoff)} items purged.")
     else:
         print("Invalid option.")
@@ -0,0 +1,349 @@
+# quick_scan.py
+# Risk-ranked quick scan. Every candidate file is scored from metadata
+# alone: where it lives (autostart and cron locations, download and temp
+# directories, world-writable directories), how recently it changed, its
+# permission bits and, for the files that already score, its first bytes
+# (ELF, PE and scripts). The scan then takes the files highest risk first
+# until a wall-clock or byte budget runs out, so a scan cut short by a
+# maintenance window has still covered /tmp and ~/Downloads before the bulk
+# of /usr.
+#
+# The candidate walk visits the high-risk roots first and then the rest of
+# the tree. With a time budget, ranking (the walk, then sniffing) gets
+# WALK_SHARE of it, four fifths of that for the walk; files the walk had
+# not reached by then are not candidates, and coverage() says it was cut.
+#
+# Example:
+#   python antigus_cli.py scan / --quick --time-budget 600
+import glob
+import heapq
+import itertools
+import os
+import stat
+import time
+
+from content_signatures import detect_filetype
+from scan_pipeline import walk_entries
+
+QUICK_SCAN_TIME_BUDGET = 300    # seconds, None for no limit
+QUICK_SCAN_BYTE_BUDGET = None   # bytes read, None for no limit
+# Share of the time budget the candidate walk may use.
+WALK_SHARE = 0.25
+# Only this many of the candidates that already score are sniffed for
+# their file type, highest first.
+SNIFF_LIMIT = 20000
+# Fewer files in flight than a full scan, so little work is left running
+# past the time budget.
+QUICK_SCAN_QUEUE_DEPTH = 32
+# Candidates kept for the scan, highest ranked first; the walk of a large
+# tree counts the rest in coverage() without holding on to them.
+QUICK_SCAN_MAX_CANDIDATES = 100000
+
+TEMP_DIRS = ["/tmp", "/var/tmp", "/dev/shm"]
+# Relative to each home directory.
+HOME_DOWNLOAD_DIRS = ["Downloads", "Desktop"]
+HOME_AUTOSTART_PATHS = [".config/autostart", ".config/systemd/user", ".local/bin", ".bashrc",
+                        ".bash_profile", ".profile", ".zshrc", ".xinitrc", ".xprofile"]
+AUTOSTART_PATHS = ["/etc/crontab", "/etc/cron.d", "/etc/cron.hourly", "/etc/cron.daily",
+                   "/etc/cron.weekly", "/etc/cron.monthly", "/var/spool/cron", "/etc/anacrontab",
+                   "/etc/systemd/system", "/run/systemd/system", "/etc/init.d", "/etc/rc.local",
+                   "/etc/profile", "/etc/profile.d", "/etc/xdg/autostart", "/etc/ld.so.preload",
+                   "/etc/update-motd.d"]
+
+# Each reason a file is considered risky, with its weight. Scores add up;
+# ties go to the smaller file.
+RISK_WEIGHTS = {
+    "autostart": 8,          # runs at boot, login or from cron
+    "world_writable": 6,     # in a directory anyone can write to, e.g. /tmp
+    "downloads": 5,
+    "setuid": 5,
+    "executable_format": 4,  # ELF or PE by its magic bytes
+    "modified_1d": 4,
+    "modified_7d": 2,
+    "exec_bits": 3,
+    "script": 2,             # starts with #!
+    "hidden": 1,
+}
+_BITS = {reason: 1 << i for i, reason in enumerate(RISK_WEIGHTS)}
+
+
+def _within(path, root):
+    return path == root or path.startswith(root.rstrip("/") + "/")
+
+
+def home_dirs():
+    homes = {os.path.expanduser("~"), "/root"}
+    homes.update(glob.glob("/home/*"))
+    return sorted(h for h in homes if os.path.isdir(h))
+
+
+# Example: (autostart paths, download dirs, temp dirs) that exist on this host.
+def risk_locations():
+    homes = home_dirs()
+    autostart = AUTOSTART_PATHS + [os.path.join(h, p) for h in homes for p in HOME_AUTOSTART_PATHS]
+    downloads = [os.path.join(h, d) for h in homes for d in HOME_DOWNLOAD_DIRS]
+    exists = os.path.lexists
+    return ([p for p in autostart if exists(p)], [p for p in downloads if exists(p)],
+            [p for p in TEMP_DIRS if exists(p)])
+
+
+# Example: reasons(mask) -> ["world_writable", "exec_bits"]
+def reasons(mask):
+    return [reason for reason, bit in _BITS.items() if mask & bit]
+
+
+def _score(mask):
+    return sum(RISK_WEIGHTS[reason] for reason, bit in _BITS.items() if mask & bit)
+
+
+# Stands in for the os.DirEntry of a file named directly, such as
+# /etc/crontab.
+class _PathEntry:
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._stat = None
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+
+# Keeps the main walk out of the roots already walked, on top of the
+# scan's own exclusions.
+class _SkipWalked:
+
+    def __init__(self, walked, exclusions=None):
+        self.walked = walked
+        self.exclusions = exclusions
+
+    def skip_dir(self, entry):
+        return entry.path in self.walked or (self.exclusions is not None and self.exclusions.skip_dir(entry))
+
+    def skip_file(self, entry):
+        return entry.path in self.walked or (self.exclusions is not None and self.exclusions.skip_file(entry))
+
+
+# Ranks the files under path and hands them out, highest risk first, within
+# the budgets. Usage:
+#   plan = QuickScan("/", time_budget=600)
+#   plan.rank(exclusions)                      # walk and score
+#   scan_tree(..., entries=plan.entries())     # scan in order
+#   plan.coverage()
+class QuickScan:
+
+    def __init__(self, path="/", time_budget=QUICK_SCAN_TIME_BUDGET, byte_budget=QUICK_SCAN_BYTE_BUDGET,
+                 stop_event=None, now=None, max_candidates=QUICK_SCAN_MAX_CANDIDATES):
+        self.path = os.path.abspath(path)
+        self.time_budget = time_budget
+        self.byte_budget = byte_budget
+        self.stop_event = stop_event
+        self.started = time.monotonic()
+        self.deadline = self.started + time_budget if time_budget else None
+        self.now = time.time() if now is None else now
+        self.max_candidates = max_candidates
+        # [score, size, path, reasons mask, entry, scanned], sorted by
+        # rank() to highest score, then smallest file, first. While walking
+        # it is a heap of (score, -size, seq, candidate) with the lowest
+        # ranked on top, cut back to max_candidates as it goes.
+        self.candidates = []
+        self._seq = itertools.count()
+        # Candidates cut by max_candidates: how many, their bytes and score,
+        # a count per reasons mask and the highest scoring of them.
+        self.dropped = 0
+        self.dropped_bytes = 0
+        self.dropped_score = 0
+        self._dropped_reasons = {}
+        self._dropped_best = None
+        self.walk_complete = True
+        self.rank_seconds = 0.0
+        self.given = 0
+        self.bytes_given = 0
+        self.score_given = 0
+        self.skipped_by_size = 0
+        self.stopped_by = None
+        self._dir = None
+        self._dir_mask = 0
+
+    def _roots(self):
+        autostart, downloads, temp = risk_locations()
+        self._autostart = autostart
+        self._autostart_files = set(autostart)
+        self._downloads = downloads
+        roots = [p for p in autostart + temp + downloads if _within(p, self.path)]
+        return list(dict.fromkeys(roots))
+
+    # Risk bits that come from where a file is; worked out once per
+    # directory, since the walk yields a directory's files together.
+    def _location(self, fpath):
+        directory = os.path.dirname(fpath)
+        if directory != self._dir:
+            mask = 0
+            if any(_within(directory, p) for p in self._autostart):
+                mask |= _BITS["autostart"]
+            if any(_within(directory, p) for p in self._downloads):
+                mask |= _BITS["downloads"]
+            try:
+                if os.stat(directory).st_mode & stat.S_IWOTH:
+                    mask |= _BITS["world_writable"]
+            except OSError:
+                pass
+            self._dir = directory
+            self._dir_mask = mask
+        if fpath in self._autostart_files:
+            return self._dir_mask | _BITS["autostart"]
+        return self._dir_mask
+
+    def _add(self, entry):
+        try:
+            st = entry.stat()
+        except OSError:
+            return
+        mask = self._location(entry.path)
+        age = self.now - st.st_mtime
+        if age < 86400:
+            mask |= _BITS["modified_1d"]
+        elif age < 7 * 86400:
+            mask |= _BITS["modified_7d"]
+        if st.st_mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH):
+            mask |= _BITS["exec_bits"]
+        if st.st_mode & (stat.S_ISUID | stat.S_ISGID):
+            mask |= _BITS["setuid"]
+        if entry.name.startswith(".") and mask:
+            mask |= _BITS["hidden"]
+        score = _score(mask)
+        item = (score, -st.st_size, next(self._seq), [score, st.st_size, entry.path, mask, entry, False])
+        if len(self.candidates) < self.max_candidates:
+            heapq.heappush(self.candidates, item)
+            return
+        item = heapq.heappushpop(self.candidates, item)
+        score, size, path, mask = item[3][:4]
+        self.dropped += 1
+        self.dropped_bytes += size
+        self.dropped_score += score
+        self._dropped_reasons[mask] = self._dropped_reasons.get(mask, 0) + 1
+        if score and (self._dropped_best is None or score > self._dropped_best[0]):
+            self._dropped_best = (score, path, mask)
+
+    # True once the stop event is set or share of the ranking time is used.
+    def _out_of_time(self, share=1.0):
+        if self.stop_event is not None and self.stop_event.is_set():
+            return True
+        return (self.deadline is not None
+                and time.monotonic() > self.started + self.time_budget * WALK_SHARE * share)
+
+    def _walk(self, root, skip):
+        if os.path.isdir(root) and not os.path.islink(root):
+            entries = walk_entries(root, exclusions=skip)
+        elif os.path.isfile(root):
+            entries = [_PathEntry(root)]
+        else:
+            return True
+        for entry in entries:
+            if self._out_of_time(0.8):
+                return False
+            self._add(entry)
+        return True
+
+    # Reads the first bytes of the top candidates that already score.
+    def _sniff(self):
+        sniffed = 0
+        for candidate in self.candidates:
+            if not candidate[0] or sniffed >= SNIFF_LIMIT or self._out_of_time():
+                break
+            sniffed += 1
+            try:
+                with open(candidate[2], "rb") as f:
+                    filetype = detect_filetype(f.read(4))
+            except OSError:
+                continue
+            if filetype in ("elf", "pe"):
+                candidate[3] |= _BITS["executable_format"]
+            elif filetype == "script":
+                candidate[3] |= _BITS["script"]
+            candidate[0] = _score(candidate[3])
+
+    def _sort(self):
+        self.candidates.sort(key=lambda c: (-c[0], c[1]))
+
+    # Walks the high-risk roots, then the rest of path, and ranks every file
+    # found. exclusions is a scan_exclusions.ScanExclusions, already
+    # started on path, or None.
+    def rank(self, exclusions=None):
+        roots = self._roots()
+        walked = set(roots)
+        skip = _SkipWalked(walked, exclusions)
+        for root in dict.fromkeys(roots + [self.path]):
+            if not self._walk(root, skip):
+                self.walk_complete = False
+                break
+        self.candidates = [item[3] for item in self.candidates]
+        self._sort()
+        self._sniff()
+        self._sort()
+        self.rank_seconds = time.monotonic() - self.started
+        return self
+
+    # Example: for entry in plan.entries(): ... DirEntry-like objects in
+    # rank order, until a budget is spent. A file larger than what is left
+    # of the byte budget is passed over for smaller ones; stopped_by is
+    # "bytes" only if one of those had a score.
+    def entries(self):
+        left_out = False
+        for candidate in self.candidates:
+            score, size, _, _, entry, _ = candidate
+            if self.stop_event is not None and self.stop_event.is_set():
+                self.stopped_by = "stopped"
+                return
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.stopped_by = "time"
+                return
+            if self.byte_budget is not None and self.bytes_given + size > self.byte_budget:
+                self.skipped_by_size += 1
+                left_out = left_out or score > 0
+                continue
+            candidate[5] = True
+            self.given += 1
+            self.bytes_given += size
+            self.score_given += score
+            yield entry
+        if left_out:
+            self.stopped_by = "bytes"
+        elif self._dropped_best is not None:
+            self.stopped_by = "limit"
+
+    # Example: {"candidates": 5120, "files": 812, "risk_covered": 0.91, ...}
+    # risk_covered is the share of the candidates' total score that was
+    # scanned; by_reason counts scanned and found candidates per reason.
+    # Candidates cut by max_candidates count as not scanned.
+    def coverage(self):
+        count = len(self.candidates) + self.dropped
+        total_bytes = sum(c[1] for c in self.candidates) + self.dropped_bytes
+        total_score = sum(c[0] for c in self.candidates) + self.dropped_score
+        by_reason = {reason: [0, 0] for reason in RISK_WEIGHTS}
+        for _, _, _, mask, _, scanned in self.candidates:
+            for reason in reasons(mask):
+                by_reason[reason][0] += scanned
+                by_reason[reason][1] += 1
+        for mask, n in self._dropped_reasons.items():
+            for reason in reasons(mask):
+                by_reason[reason][1] += n
+        unscanned = next((c[:4] for c in self.candidates if c[0] and not c[5]), None)
+        if unscanned is None and self._dropped_best is not None:
+            score, path, mask = self._dropped_best
+            unscanned = [score, None, path, mask]
+        return {"candidates": count, "candidate_bytes": total_bytes,
+                "files": self.given, "bytes": self.bytes_given,
+                "file_coverage": round(self.given / count, 4) if count else 1.0,
+                "byte_coverage": round(self.bytes_given / total_bytes, 4) if total_bytes else 1.0,
+                "risk_covered": round(self.score_given / total_score, 4) if total_score else 1.0,
+                "by_reason": {reason: {"scanned": done, "candidates": total}
+                              for reason, (done, total) in by_reason.items() if total},
+                "highest_unscanned": {"path": unscanned[2], "score": unscanned[0],
+                                      "reasons": reasons(unscanned[3])} if unscanned else None,
+                "stopped_by": self.stopped_by, "walk_complete": self.walk_complete,
+                "candidates_dropped": self.dropped,
+                "rank_seconds": round(self.rank_seconds, 3), "time_budget": self.time_budget,
+                "byte_budget": self.byte_budget}
@@ -0,0 +1,368 @@
+# realtime_monitor.py
+# Event-driven on-access monitor. Watches directory trees with inotify (or
+# fanotify when running as root), coalesces bursts of writes to the same
+# file and hands each file to a bounded worker pool once it has been
+# closed after writing and left alone for a short debounce period.
+import collections
+import ctypes
+import errno
+import os
+import queue
+import select
+import struct
+import threading
+import time
+
+# inotify
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+               | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+_IN_EVENT = struct.Struct("iIII")
+
+# fanotify
+FAN_CLOEXEC = 0x01
+FAN_NONBLOCK = 0x02
+FAN_CLASS_NOTIF = 0x00
+FAN_MARK_ADD = 0x01
+FAN_MARK_MOUNT = 0x10
+FAN_MODIFY = 0x02
+FAN_CLOSE_WRITE = 0x08
+FAN_Q_OVERFLOW = 0x4000
+FAN_NOFD = -1
+AT_FDCWD = -100
+_FAN_EVENT = struct.Struct("IBBHQii")
+
+DEFAULT_DEBOUNCE = 0.5
+DEFAULT_WORKERS = 2
+# Files waiting in the worker queue; beyond this, files wait in the
+# pending table where repeated events for them keep coalescing.
+DEFAULT_QUEUE_DEPTH = 1024
+# Distinct files tracked at once; beyond this, events are dropped and their
+# directories are remembered for a rescan.
+DEFAULT_MAX_PENDING = 100000
+# Files written but never closed are forgotten after this many seconds.
+STALE_AFTER = 60.0
+
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _libc.fanotify_mark.argtypes = [ctypes.c_int, ctypes.c_uint, ctypes.c_uint64,
+                                        ctypes.c_int, ctypes.c_char_p]
+    return _libc
+
+
+def _check(ret):
+    if ret < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return ret
+
+
+class _InotifySource:
+
+    def __init__(self, roots, on_event):
+        self._libc = _load_libc()
+        self.fd = _check(self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+        self._on_event = on_event
+        self._dirs = {}
+        for root in roots:
+            self.add_tree(root)
+
+    # Files already present in a directory that appeared after the monitor
+    # started were written before it could be watched, so they are reported
+    # as closed straight away.
+    def add_tree(self, root, report_files=False):
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            if not self._add_watch(directory):
+                continue
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif report_files and entry.is_file(follow_symlinks=False):
+                            self._on_event("closed", entry.path)
+            except OSError:
+                continue
+
+    def _add_watch(self, directory):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                print(f"[Monitor] inotify watch limit reached, not watching {directory}")
+            return False
+        self._dirs[wd] = directory
+        return True
+
+    def read(self):
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _IN_EVENT.unpack_from(data, offset)
+            offset += _IN_EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self._on_event("overflow", None)
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_tree(path, report_files=True)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._on_event("closed", path)
+            elif mask & (IN_MODIFY | IN_CREATE):
+                self._on_event("modified", path)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _FanotifySource:
+
+    def __init__(self, roots, on_event):
+        self._libc = _load_libc()
+        flags = FAN_CLASS_NOTIF | FAN_CLOEXEC | FAN_NONBLOCK
+        self.fd = _check(self._libc.fanotify_init(flags, os.O_RDONLY | getattr(os, "O_LARGEFILE", 0)))
+        self._on_event = on_event
+        self._roots = tuple(os.path.join(os.path.abspath(r), "") for r in roots)
+        for root in roots:
+            _check(self._libc.fanotify_mark(self.fd, FAN_MARK_ADD | FAN_MARK_MOUNT,
+                                            FAN_MODIFY | FAN_CLOSE_WRITE, AT_FDCWD, os.fsencode(root)))
+
+    def read(self):
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + _FAN_EVENT.size <= len(data):
+            event_len, _, _, _, mask, fd, _ = _FAN_EVENT.unpack_from(data, offset)
+            offset += event_len
+            if mask & FAN_Q_OVERFLOW or fd == FAN_NOFD:
+                self._on_event("overflow", None)
+                continue
+            try:
+                path = os.readlink(f"/proc/self/fd/{fd}")
+            except OSError:
+                continue
+            finally:
+                os.close(fd)
+            # Marks cover whole mounts; keep only the configured trees.
+            if not path.startswith(self._roots) and path + os.sep not in self._roots:
+                continue
+            self._on_event("closed" if mask & FAN_CLOSE_WRITE else "modified", path)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class RealtimeMonitor:
+
+    def __init__(self, paths, on_file, workers=DEFAULT_WORKERS, debounce=DEFAULT_DEBOUNCE,
+                 queue_depth=DEFAULT_QUEUE_DEPTH, max_pending=DEFAULT_MAX_PENDING,
+                 use_fanotify=None, exclusions=None):
+        self.paths = [os.path.abspath(p) for p in paths]
+        self.on_file = on_file
+        # A scan_exclusions.ScanExclusions; events for excluded paths (such
+        # as the quarantine vault) are ignored.
+        self.exclusions = exclusions
+        self.workers = workers
+        self.debounce = debounce
+        self.max_pending = max_pending
+        self.use_fanotify = os.geteuid() == 0 if use_fanotify is None else use_fanotify
+        # path -> [time of last event, closed after writing], oldest event
+        # first. Every event moves its file to the end, so this is also
+        # debounce-deadline order and _dispatch only looks at the front.
+        self._pending = collections.OrderedDict()
+        # path -> time of last event, for files past the debounce period that
+        # are still open for writing; oldest first, forgotten when stale.
+        self._open = collections.OrderedDict()
+        self._work = queue.Queue(maxsize=queue_depth)
+        self._overflow_dirs = set()
+        self._stop = threading.Event()
+        self._threads = []
+        self._source = None
+        self.backend = None
+        self.events = 0
+        self.coalesced = 0
+        self.dispatched = 0
+        self.checked = 0
+        self.dropped = 0
+        self.excluded = 0
+        self.overflows = 0
+        self.max_lag = 0.0
+        self._lag_total = 0.0
+        self._rate_events = 0
+        self._rate_started = time.monotonic()
+        self.events_per_sec = 0.0
+
+    def _open_source(self):
+        if self.use_fanotify:
+            try:
+                self.backend = "fanotify"
+                return _FanotifySource(self.paths, self._on_event)
+            except OSError as e:
+                print(f"[Monitor] fanotify unavailable ({e}), falling back to inotify")
+        self.backend = "inotify"
+        return _InotifySource(self.paths, self._on_event)
+
+    def _on_event(self, kind, path):
+        self.events += 1
+        self._rate_events += 1
+        if kind == "overflow":
+            self.overflows += 1
+            self._overflow_dirs.update(self.paths)
+            return
+        if self.exclusions is not None and self.exclusions.excludes_path(path):
+            self.excluded += 1
+            return
+        now = time.monotonic()
+        entry = self._pending.get(path)
+        if entry is not None:
+            self.coalesced += 1
+            entry[0] = now
+            entry[1] = kind == "closed"
+            self._pending.move_to_end(path)
+        elif self._open.pop(path, None) is not None:
+            self.coalesced += 1
+            self._pending[path] = [now, kind == "closed"]
+        elif len(self._pending) + len(self._open) < self.max_pending:
+            self._pending[path] = [now, kind == "closed"]
+        else:
+            self.dropped += 1
+            self._overflow_dirs.add(os.path.dirname(path))
+
+    # Move files that were closed and then left alone for the debounce
+    # period into the worker queue, oldest first, while it has room; files
+    # still open move aside to wait for their close. Only the due front of
+    # the table is touched, so a tick costs what it dispatches however many
+    # files are pending. Returns True when the queue filled up with files
+    # still waiting.
+    def _dispatch(self):
+        backlog = False
+        now = time.monotonic()
+        pending = self._pending
+        while pending:
+            path = next(iter(pending))
+            last, closed = pending[path]
+            if now - last < self.debounce:
+                break
+            if not closed:
+                del pending[path]
+                self._open[path] = last
+                continue
+            try:
+                self._work.put_nowait((path, now))
+            except queue.Full:
+                backlog = True
+                break
+            del pending[path]
+            self.dispatched += 1
+        while self._open:
+            path = next(iter(self._open))
+            if now - self._open[path] < STALE_AFTER:
+                break
+            del self._open[path]
+        elapsed = now - self._rate_started
+        if elapsed >= 1.0:
+            self.events_per_sec = self._rate_events / elapsed
+            self._rate_events = 0
+            self._rate_started = now
+        return backlog
+
+    def _reader(self):
+        fd = self._source.fd
+        backlog = False
+        while not self._stop.is_set():
+            # Poll quickly while workers are draining a full queue.
+            timeout = 0.01 if backlog else min(self.debounce, 0.25)
+            ready, _, _ = select.select([fd], [], [], timeout)
+            if ready:
+                self._source.read()
+            backlog = self._dispatch()
+
+    def _worker(self):
+        while True:
+            item = self._work.get()
+            if item is None:
+                break
+            path, queued = item
+            lag = time.monotonic() - queued
+            self.checked += 1
+            self._lag_total += lag
+            self.max_lag = max(self.max_lag, lag)
+            try:
+                self.on_file(path)
+            except Exception as e:
+                print(f"[Monitor] Failed to check {path}: {e}")
+
+    def start(self):
+        self._source = self._open_source()
+        self._threads = [threading.Thread(target=self._reader, name="antigus-monitor", daemon=True)]
+        for i in range(self.workers):
+            self._threads.append(threading.Thread(target=self._worker, name=f"antigus-monitor-{i}",
+                                                  daemon=True))
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        self._stop.set()
+        self._threads[0].join()
+        for _ in range(self.workers):
+            self._work.put(None)
+        for t in self._threads[1:]:
+            t.join()
+        self._source.close()
+
+    # Directories whose events were lost (kernel queue overflow or too many
+    # pending files); callers should rescan them.
+    def take_overflow_dirs(self):
+        dirs, self._overflow_dirs = self._overflow_dirs, set()
+        return dirs
+
+    def stats(self):
+        return {
+            "backend": self.backend,
+            "events": self.events,
+            "events_per_sec": round(self.events_per_sec, 1),
+            "coalesced": self.coalesced,
+            "dispatched": self.dispatched,
+            "checked": self.checked,
+            "dropped": self.dropped,
+            "excluded": self.excluded,
+            "overflows": self.overflows,
+            "pending": len(self._pending) + len(self._open),
+            "queued": self._work.qsize(),
+            "avg_queue_lag": self._lag_total / self.checked if self.checked else 0.0,
+            "max_queue_lag": self.max_lag,
+        }
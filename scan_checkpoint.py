@@ -0,0 +1,99 @@
+# scan_checkpoint.py
+# Periodic checkpoints of a running scan, so an interrupted full scan can
+# pick up where it stopped instead of starting over.
+#
+# A checkpoint is only taken at a directory boundary in walk order, after
+# every file before it has been judged. It stores the walker's stack of
+# directories not yet listed (the frontier), so on resume finished
+# subtrees are never visited again. Each root has its own checkpoint file,
+# so scans of different trees running at once (daemon jobs) keep apart.
+import hashlib
+import json
+import os
+import threading
+import time
+
+CHECKPOINT_DIR = os.path.expanduser("~/.cache/antigus/checkpoints")
+CHECKPOINT_INTERVAL = 5.0
+
+
+# Example: Where the checkpoint of a scan of root is kept.
+def checkpoint_path(root, checkpoint_dir=CHECKPOINT_DIR):
+    key = hashlib.sha1(os.fsencode(root)).hexdigest()[:12]
+    return os.path.join(checkpoint_dir, f"scan-{key}.json")
+
+
+def save_checkpoint(state, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# Example: Load the checkpoint for a scan of root, or None if there is none
+def load_checkpoint(root, path=None):
+    path = path or checkpoint_path(root)
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get("root") != root:
+        return None
+    return state
+
+
+def clear_checkpoint(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class ScanCheckpointer:
+
+    def __init__(self, root, path=None, interval=CHECKPOINT_INTERVAL, resume=False):
+        self.root = root
+        self.path = path or checkpoint_path(root)
+        self.interval = interval
+        self.state = load_checkpoint(root, self.path) if resume else None
+        self.started = self.state["started"] if self.state else time.time()
+        self._next = time.monotonic() + interval
+        self.saved = 0
+
+    # Where the walk starts: the saved frontier, or just the root.
+    def frontier(self):
+        return list(self.state["frontier"]) if self.state else [self.root]
+
+    # Threats found before the interruption, as [path, digest] pairs.
+    def threats(self):
+        return [tuple(t) for t in self.state["threats"]] if self.state else []
+
+    def files_done(self):
+        return self.state["files"] if self.state else 0
+
+    # Called by the walker at every directory boundary.
+    def due(self):
+        now = time.monotonic()
+        if now < self._next:
+            return False
+        self._next = now + self.interval
+        return True
+
+    # Called by the verdict stage once everything before the boundary is done.
+    def save(self, frontier, files, threats):
+        save_checkpoint({
+            "root": self.root,
+            "started": self.started,
+            "time": time.time(),
+            "frontier": frontier,
+            "files": files,
+            "threats": threats,
+        }, self.path)
+        self.saved += 1
+
+    def finish(self):
+        clear_checkpoint(self.path)
@@ -0,0 +1,366 @@
+# scan_daemon.py
+# Resident scan service. It keeps the signatures, the hash cache and the
+# hashing pool loaded between scans and takes jobs over a unix socket,
+# one JSON object per line in each direction:
+#
+#   -> {"op": "scan", "path": "/home", "files": false}
+#   <- {"event": "accepted", "job": 3, "path": "/home", "joined": false}
+#   <- {"event": "progress", "job": 3, "done": 120, "discovered": 400, "walk_finished": false,
+#       "files_per_sec": 950.0, "bytes_per_sec": 41000000.0, "cache_hit_rate": 0.8}
+#   <- {"event": "results", "job": 3, "items": [["/home/x", "<digest>"], ...]}
+#   <- {"event": "done", "job": 3, "threats": [...], "summary": {...}}
+#
+# results carry threats only, unless the request asked for "files": true.
+# The rates in progress events (and in status) are the daemon's, over
+# all of its running jobs.
+# A scan of a path that a running job already covers (the same tree or a
+# subtree of it) joins that job instead of walking the tree again. A job
+# stops when its last client disconnects; jobs the daemon starts itself
+# (scan_every) always run to the end.
+#
+# Other ops: {"op": "status"}, {"op": "cancel", "job": N} (stops it for
+# every client), {"op": "reload"} (re-read definitions) and {"op": "ping"}.
+#
+# DaemonClient is the blocking client the CLI and the GUI use.
+import asyncio
+import collections
+import json
+import os
+import socket
+import threading
+
+from scan_metrics import METRICS
+from scan_pipeline import ScanProgress
+
+DAEMON_SOCKET = os.path.expanduser("~/.cache/antigus/daemon.sock")
+# Seconds between progress and result batches sent to clients.
+PROGRESS_INTERVAL = 0.25
+# Longest request line accepted.
+MAX_REQUEST = 64 * 1024
+
+
+# True if path is root or inside it; archive members count as their archive.
+def _within(path, root):
+    path = path.split("!/", 1)[0]
+    return path == root or path.startswith(root.rstrip("/") + "/")
+
+
+def _encode(message):
+    return json.dumps(message, default=str).encode() + b"\n"
+
+
+class ScanJob:
+
+    # owned_by_daemon is set for the jobs the daemon starts itself
+    # (scan_every); those are never stopped for want of clients.
+    def __init__(self, job_id, path, owned_by_daemon=False):
+        self.id = job_id
+        self.path = path
+        self.owned_by_daemon = owned_by_daemon
+        self.stop_event = threading.Event()
+        self.progress = ScanProgress()
+        # (path, matched) pairs from the scan thread, sent on the next tick.
+        self.pending = collections.deque()
+        self.subscribers = []
+        self.finished = False
+
+    def covers(self, path):
+        return not self.finished and not self.stop_event.is_set() and _within(path, self.path)
+
+    def info(self):
+        p = self.progress
+        return {"job": self.id, "path": self.path, "clients": len(self.subscribers), "done": p.done,
+                "discovered": p.discovered, "walk_finished": p.walk_finished,
+                "owned_by_daemon": self.owned_by_daemon}
+
+
+class _Subscriber:
+
+    def __init__(self, writer, prefix, files):
+        self.writer = writer
+        self.prefix = prefix    # None for the whole job
+        self.files = files
+        self.closed = False
+        self.finished = asyncio.Event()
+
+    def wants(self, fpath, matched):
+        if not matched and not self.files:
+            return False
+        return self.prefix is None or _within(fpath, self.prefix)
+
+    async def send(self, message):
+        if self.closed:
+            return
+        try:
+            self.writer.write(_encode(message))
+            await self.writer.drain()
+        except (ConnectionError, OSError):
+            self.closed = True
+
+
+class ScanDaemon:
+
+    def __init__(self, path=DAEMON_SOCKET, scan_every=None, scan_paths=("/",)):
+        self.path = path
+        self.scan_every = scan_every    # hours between scheduled scans, or None
+        self.scan_paths = list(scan_paths)
+        self.jobs = {}
+        self.pool = None
+        self.cache = None
+        self.jobs_started = 0
+        self.jobs_joined = 0
+        self._next_id = 1
+        self._store_mtime = None
+        self._loop = None
+        self._server = None
+
+    # Signatures, hash cache and hashing pool, kept for the daemon's lifetime.
+    def load(self):
+        from concurrent.futures import ThreadPoolExecutor
+        import arfetanti
+        from scan_scheduler import apply_idle_priority
+        self.reload()
+        self.cache = arfetanti.open_hash_cache()
+        self.pool = ThreadPoolExecutor(max_workers=max(1, arfetanti.SCAN_WORKERS),
+                                       thread_name_prefix="antigus-hash",
+                                       initializer=apply_idle_priority if arfetanti.SCAN_IDLE_PRIORITY else None)
+
+    def reload(self):
+        import arfetanti
+        from signature_store import SIGNATURE_STORE_FILE
+        arfetanti.load_local_definitions()
+        self._store_mtime = self._mtime(SIGNATURE_STORE_FILE)
+        return len(arfetanti.BAD_HASHES)
+
+    def _mtime(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    # Picks up definitions compiled by "antigus update" since the last job.
+    def _refresh_definitions(self):
+        from signature_store import SIGNATURE_STORE_FILE
+        if self._mtime(SIGNATURE_STORE_FILE) != self._store_mtime:
+            self.reload()
+
+    def start_job(self, path, owned_by_daemon=False):
+        self._refresh_definitions()
+        job = ScanJob(self._next_id, path, owned_by_daemon)
+        self._next_id += 1
+        self.jobs[job.id] = job
+        self.jobs_started += 1
+        threading.Thread(target=self._run_job, args=(job,), name=f"antigus-job-{job.id}", daemon=True).start()
+        return job
+
+    def _run_job(self, job):
+        import arfetanti
+        def on_result(fpath, matched):
+            job.pending.append((fpath, matched))
+        try:
+            threats, summary = arfetanti.run_scan(job.path, on_result, stop_event=job.stop_event,
+                                                  progress=job.progress, cache=self.cache, executor=self.pool)
+        except Exception as e:
+            threats, summary = [], {"error": str(e)}
+        asyncio.run_coroutine_threadsafe(self._finish(job, threats, summary), self._loop)
+
+    async def _flush(self, job):
+        items = []
+        while job.pending:
+            items.append(job.pending.popleft())
+        progress = job.info()
+        del progress["clients"], progress["path"], progress["owned_by_daemon"]
+        progress.update(self._rates())
+        for sub in list(job.subscribers):
+            wanted = [item for item in items if sub.wants(*item)]
+            if wanted:
+                await sub.send({"event": "results", "job": job.id, "items": wanted})
+            await sub.send({"event": "progress", **progress})
+
+    def _rates(self):
+        files_per_sec, bytes_per_sec = METRICS.throughput()
+        return {"files_per_sec": round(files_per_sec, 1), "bytes_per_sec": round(bytes_per_sec),
+                "cache_hit_rate": round(METRICS.cache_hit_rate(), 4)}
+
+    async def _finish(self, job, threats, summary):
+        await self._flush(job)
+        job.finished = True
+        self.jobs.pop(job.id, None)
+        for sub in job.subscribers:
+            mine = threats if sub.prefix is None else [t for t in threats if _within(t, sub.prefix)]
+            await sub.send({"event": "done", "job": job.id, "threats": mine, "summary": summary})
+            sub.finished.set()
+
+    async def _ticker(self):
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            for job in list(self.jobs.values()):
+                await self._flush(job)
+
+    async def _scheduled_scans(self):
+        while True:
+            for path in self.scan_paths:
+                path = os.path.realpath(path)
+                if not any(job.covers(path) for job in self.jobs.values()):
+                    self.start_job(path, owned_by_daemon=True)
+            await asyncio.sleep(self.scan_every * 3600)
+
+    def _detach(self, job, sub):
+        if sub in job.subscribers:
+            job.subscribers.remove(sub)
+        if not job.subscribers and not job.finished and not job.owned_by_daemon:
+            job.stop_event.set()
+
+    async def _scan(self, request, reader, writer):
+        path = os.path.realpath(request.get("path") or "/")
+        job = next((j for j in self.jobs.values() if j.covers(path)), None)
+        joined = job is not None
+        if joined:
+            self.jobs_joined += 1
+        else:
+            job = self.start_job(path)
+        sub = _Subscriber(writer, None if path == job.path else path, bool(request.get("files")))
+        job.subscribers.append(sub)
+        await sub.send({"event": "accepted", "job": job.id, "path": path, "job_path": job.path,
+                        "joined": joined})
+        # Wait for the job to end, or for the client to hang up.
+        finished = asyncio.ensure_future(sub.finished.wait())
+        hangup = asyncio.ensure_future(reader.read(1))
+        await asyncio.wait({finished, hangup}, return_when=asyncio.FIRST_COMPLETED)
+        if not finished.done():
+            finished.cancel()
+            self._detach(job, sub)
+        hangup.cancel()
+
+    async def _handle(self, reader, writer):
+        try:
+            line = await reader.readline()
+            try:
+                request = json.loads(line)
+            except ValueError:
+                request = {}
+            op = request.get("op")
+            if op == "scan":
+                await self._scan(request, reader, writer)
+                return
+            if op == "ping":
+                reply = {"event": "pong", "pid": os.getpid()}
+            elif op == "status":
+                reply = {"event": "status", "jobs": [job.info() for job in self.jobs.values()],
+                         "jobs_started": self.jobs_started, "jobs_joined": self.jobs_joined,
+                         "scans_running": METRICS.scans_running, **self._rates(),
+                         "cache": self.cache.stats() if self.cache else None}
+            elif op == "cancel":
+                job = self.jobs.get(request.get("job"))
+                if job:
+                    job.stop_event.set()
+                reply = {"event": "cancelled" if job else "error", "job": request.get("job")}
+            elif op == "reload":
+                reply = {"event": "reloaded", "signatures": self.reload()}
+            else:
+                reply = {"event": "error", "error": f"unknown op {op!r}"}
+            writer.write(_encode(reply))
+            await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if os.path.exists(self.path):
+            if daemon_running(self.path):
+                raise RuntimeError(f"A scan daemon is already listening on {self.path}")
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path, limit=MAX_REQUEST)
+        os.chmod(self.path, 0o600)
+        tasks = [asyncio.ensure_future(self._ticker())]
+        if self.scan_every:
+            tasks.append(asyncio.ensure_future(self._scheduled_scans()))
+        print(f"Scan daemon listening on {self.path}")
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            for job in self.jobs.values():
+                job.stop_event.set()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def run(self):
+        if self.pool is None:
+            self.load()
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self.pool:
+                self.pool.shutdown(wait=True, cancel_futures=True)
+            if self.cache:
+                self.cache.close()
+
+
+# Blocking client; each request uses its own connection.
+class DaemonClient:
+
+    def __init__(self, path=DAEMON_SOCKET, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._sock = None
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        sock.settimeout(None)
+        self._sock = sock
+        return sock
+
+    # Example: for event in client.request("scan", path="/home"): ...
+    # Yields every reply until the server closes the connection.
+    def request(self, op, **params):
+        sock = self._connect()
+        try:
+            sock.sendall(_encode(dict(params, op=op)))
+            with sock.makefile("rb") as f:
+                for line in f:
+                    yield json.loads(line)
+        except (OSError, ValueError):
+            return    # closed by close(), or the daemon went away
+        finally:
+            sock.close()
+            self._sock = None
+
+    def call(self, op, **params):
+        for reply in self.request(op, **params):
+            return reply
+        return None
+
+    def scan(self, path, files=False):
+        return self.request("scan", path=os.path.abspath(path), files=files)
+
+    # Hang up on a running request (from another thread), which detaches
+    # from its scan.
+    def close(self):
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+# Example: True if a daemon answers on path.
+def daemon_running(path=DAEMON_SOCKET):
+    if not os.path.exists(path):
+        return False
+    try:
+        return (DaemonClient(path, timeout=1.0).call("ping") or {}).get("event") == "pong"
+    except OSError:
+        return False
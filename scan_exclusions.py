@@ -0,0 +1,217 @@
+# scan_exclusions.py
+# Decides what the walker may enter before it touches it: gitignore-style
+# patterns compiled into a single regex, a denylist of pseudo, network and
+# FUSE filesystems read from /proc/self/mountinfo, an optional
+# same-filesystem mode, and (dev, inode) dedup for bind mounts and hard
+# links. Excluded directories are dropped on their name alone, so nothing
+# below them is ever listed or stat'ed.
+#
+# Patterns are matched against absolute paths:
+#   /proc          anchored: exactly this path (and so everything below it)
+#   *.iso          no slash: any file or directory with this name, any depth
+#   cache/*.tmp    inner slash: matches under any directory
+#   build/         trailing slash: directories only
+#   **  *  ?  [a-z]  as in gitignore;  !pattern re-includes (last match wins)
+import os
+import re
+
+# Pseudo filesystems that hang or return endless data, plus network and
+# FUSE filesystems ("fuse" covers every fuse.* subtype).
+DEFAULT_FS_DENYLIST = frozenset({
+    "proc", "sysfs", "devtmpfs", "devpts", "cgroup", "cgroup2", "pstore", "bpf",
+    "tracefs", "debugfs", "securityfs", "configfs", "fusectl", "mqueue", "hugetlbfs",
+    "autofs", "binfmt_misc", "efivarfs", "rpc_pipefs", "nsfs",
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "ncpfs", "afs", "ceph", "glusterfs", "9p",
+    "fuse",
+})
+MOUNTINFO = "/proc/self/mountinfo"
+
+
+def _translate(pattern):
+    i, n, out = 0, len(pattern), []
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            body = pattern[i + 1:end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append(f"[{body}]")
+            i = end + 1
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "".join(out)
+
+
+# Example: Compile patterns into one regex. Returns (regex, negated flags)
+# or (None, None) when there are no patterns.
+def compile_patterns(patterns):
+    alternatives, negated = [], []
+    for pattern in patterns:
+        pattern = pattern.strip()
+        if not pattern or pattern.startswith("#"):
+            continue
+        neg = pattern.startswith("!")
+        if neg:
+            pattern = pattern[1:]
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        if not pattern:
+            continue
+        if pattern.startswith("/"):
+            head = "^/"
+        elif "/" in pattern:
+            head = "^(?:.*/)?"
+        else:
+            head = "^.*/"
+        tail = "/$" if dir_only else "/?$"
+        alternatives.append(head + _translate(pattern.lstrip("/")) + tail)
+        negated.append(neg)
+    if not alternatives:
+        return None, None
+    # Alternatives are tried in order, so listing them last-first makes the
+    # last matching pattern win, as in gitignore.
+    count = len(alternatives)
+    combined = "|".join(f"(?P<p{count - 1 - i}>{rx})" for i, rx in enumerate(reversed(alternatives)))
+    return re.compile(combined, re.DOTALL), negated
+
+
+def _unescape(field):
+    return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), field)
+
+
+# Example: Read mount points as a list of (mount point, fstype, st_dev)
+def read_mounts(path=MOUNTINFO):
+    mounts = []
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                sep = fields.index("-")
+                major, minor = fields[2].split(":")
+                mounts.append((_unescape(fields[4]), fields[sep + 1],
+                               os.makedev(int(major), int(minor))))
+    except (OSError, ValueError):
+        pass
+    return mounts
+
+
+def _denied(fstype, denylist):
+    return fstype in denylist or ("fuse" in denylist and fstype.startswith("fuse."))
+
+
+class ScanExclusions:
+
+    def __init__(self, patterns=(), one_filesystem=False, fs_denylist=DEFAULT_FS_DENYLIST,
+                 follow_symlinks=False, mountinfo=MOUNTINFO):
+        self.regex, self.negated = compile_patterns(patterns)
+        self.one_filesystem = one_filesystem
+        self.fs_denylist = frozenset(fs_denylist)
+        self.follow_symlinks = follow_symlinks
+        self.mountinfo = mountinfo
+        self.root_dev = None
+        self.mount_points = set()
+        self.skip_mounts = set()
+        self._seen_mounts = set()
+        self._seen_links = set()
+        self.dirs_skipped = 0
+        self.files_skipped = 0
+        self.hardlinks_skipped = 0
+
+    # Example: Prepare for a walk starting at root
+    def start(self, root):
+        root = os.path.abspath(root)
+        st = os.stat(root)
+        self.root_dev = st.st_dev
+        self._seen_mounts = {(st.st_dev, st.st_ino)}
+        self._seen_links = set()
+        self.mount_points = set()
+        self.skip_mounts = set()
+        for mount_point, fstype, dev in read_mounts(self.mountinfo):
+            if mount_point == root or not mount_point.startswith(root.rstrip("/") + "/"):
+                continue
+            self.mount_points.add(mount_point)
+            if _denied(fstype, self.fs_denylist) or (self.one_filesystem and dev != self.root_dev):
+                self.skip_mounts.add(mount_point)
+
+    def _pattern_excluded(self, path, is_dir):
+        if self.regex is None:
+            return False
+        m = self.regex.match(path + "/" if is_dir else path)
+        if m is None:
+            return False
+        return not self.negated[int(m.lastgroup[1:])]
+
+    # Example: Decide whether to enter a directory (a DirEntry); nothing
+    # is stat'ed unless the directory is a mount point or one_filesystem is on.
+    def skip_dir(self, entry):
+        path = entry.path
+        if path in self.skip_mounts or self._pattern_excluded(path, True):
+            self.dirs_skipped += 1
+            return True
+        if path in self.mount_points or self.one_filesystem:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                return True
+            if self.one_filesystem and st.st_dev != self.root_dev:
+                self.dirs_skipped += 1
+                return True
+            if path in self.mount_points:
+                key = (st.st_dev, st.st_ino)
+                # A bind mount of a tree that is already being walked.
+                if key in self._seen_mounts:
+                    self.dirs_skipped += 1
+                    return True
+                self._seen_mounts.add(key)
+        return False
+
+    def skip_file(self, entry):
+        if not self.follow_symlinks and entry.is_symlink():
+            self.files_skipped += 1
+            return True
+        if self._pattern_excluded(entry.path, False):
+            self.files_skipped += 1
+            return True
+        return False
+
+    # Example: True if a path met outside a walk (a monitor event) is
+    # excluded by a pattern, either itself or through a parent directory.
+    def excludes_path(self, path, is_dir=False):
+        path = os.path.abspath(path)
+        if self._pattern_excluded(path, is_dir):
+            return True
+        parent = os.path.dirname(path)
+        while parent != os.path.dirname(parent):
+            if self._pattern_excluded(parent, True):
+                return True
+            parent = os.path.dirname(parent)
+        return False
+
+    # Hard links: only the first path of a multiply-linked file is scanned.
+    def skip_stat(self, st):
+        if st.st_nlink < 2:
+            return False
+        key = (st.st_dev, st.st_ino)
+        if key in self._seen_links:
+            self.hardlinks_skipped += 1
+            return True
+        self._seen_links.add(key)
+        return False
+
+    def stats(self):
+        return {"dirs_skipped": self.dirs_skipped, "files_skipped": self.files_skipped,
+                "hardlinks_skipped": self.hardlinks_skipped}
@@ -0,0 +1,122 @@
+# scan_journal.py
+# Structured record of each scan: one JSON object per line, written in
+# batches. Clean files are only counted unless the journal is verbose, so
+# the journal of a full-disk scan is as small as its list of threats.
+import glob
+import json
+import os
+import threading
+import time
+
+JOURNAL_DIR = os.path.expanduser("~/.cache/antigus/journal")
+# Journals kept in JOURNAL_DIR; older ones are deleted.
+KEEP_JOURNALS = 20
+
+VERBOSITY_THREATS = 0   # threats, scheduler decisions and the summary
+VERBOSITY_FILES = 1     # also one line per scanned file
+
+BATCH_SIZE = 512
+FLUSH_INTERVAL = 2.0
+
+
+class ScanJournal:
+
+    def __init__(self, root, journal_dir=JOURNAL_DIR, verbosity=VERBOSITY_THREATS):
+        os.makedirs(journal_dir, exist_ok=True)
+        self.started = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        self.path = os.path.join(journal_dir, f"scan-{stamp}-{os.getpid()}.jsonl")
+        self.verbosity = verbosity
+        self.files = 0
+        self.threats = 0
+        self._batch = []
+        self._last_flush = time.monotonic()
+        # The verdict stage and the scan scheduler both write events.
+        self._lock = threading.Lock()
+        self._f = open(self.path, "w", buffering=1024 * 1024)
+        self._write({"event": "start", "root": root, "time": self.started})
+
+    def _write(self, record):
+        line = json.dumps(record)
+        with self._lock:
+            self._batch.append(line)
+            if len(self._batch) >= BATCH_SIZE or time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+                self._flush()
+
+    # Caller holds self._lock.
+    def _flush(self):
+        if self._batch:
+            self._f.write("\n".join(self._batch) + "\n")
+            self._batch = []
+        self._f.flush()
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    # Example: Record the verdict for one file (matched is the digest or None)
+    def file(self, path, matched):
+        self.files += 1
+        if matched:
+            self.threats += 1
+            self._write({"event": "threat", "path": path, "digest": matched, "time": time.time()})
+        elif self.verbosity >= VERBOSITY_FILES:
+            self._write({"event": "file", "path": path})
+
+    # Any other structured event, e.g. scheduler decisions.
+    def event(self, kind, **fields):
+        fields["event"] = kind
+        fields.setdefault("time", time.time())
+        self._write(fields)
+
+    # Write the summary line and close; extra fields (cache and prefilter
+    # stats, ...) are stored in the summary as given.
+    def close(self, **extra):
+        summary = {"event": "summary", "files": self.files, "threats": self.threats,
+                   "duration": round(time.time() - self.started, 3)}
+        summary.update(extra)
+        self._write(summary)
+        self.flush()
+        self._f.close()
+        _prune(os.path.dirname(self.path))
+
+
+def _journals(journal_dir):
+    return sorted(glob.glob(os.path.join(journal_dir, "scan-*.jsonl")), key=os.path.getmtime)
+
+
+def _prune(journal_dir, keep=KEEP_JOURNALS):
+    for path in _journals(journal_dir)[:-keep]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Example: Path of the most recent journal, or None
+def latest_journal(journal_dir=JOURNAL_DIR):
+    journals = _journals(journal_dir)
+    return journals[-1] if journals else None
+
+
+# Example: Read a journal back as {"start": {...}, "threats": [...], "summary": {...}}
+# A journal without a summary belongs to a scan that did not finish.
+def read_journal(path):
+    result = {"start": None, "threats": [], "summary": None, "events": []}
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            kind = record.get("event")
+            if kind == "threat":
+                result["threats"].append(record)
+            elif kind == "start":
+                result["start"] = record
+            elif kind == "summary":
+                result["summary"] = record
+            elif kind != "file":
+                result["events"].append(record)
+    return result
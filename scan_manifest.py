@@ -0,0 +1,283 @@
+# scan_manifest.py
+# Compact record of what a scan saw: for every file its path, size, mtime
+# and digests, stored column by column in one binary file. When new
+# definitions arrive, rematch() joins them against the manifests instead of
+# reading the disks again, and since a manifest carries the name of the
+# host it came from, manifests copied in from other machines can be swept
+# for a new IOC from this one.
+#
+# Layout (little endian):
+#   header   magic, column count, row count
+#   columns  name, record size (0 for a blob), length, offset
+#   meta     JSON: host, root, algorithms, created
+#   dirs     the directory paths, NUL separated
+#   names    the file names, NUL separated, one per row
+#   dir_id   uint32 per row, index into dirs
+#   size     uint64 per row
+#   mtime    int64 nanoseconds per row
+#   sha256, sha1, md5   raw digests per row, all zero when not computed
+#
+# Example:
+#   python antigus_cli.py scan /home --manifest
+#   python antigus_cli.py rematch --definitions new_iocs.txt ~/manifests/
+import glob
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import time
+from array import array
+
+from scanner_utils import DIGEST_SIZES
+
+MANIFEST_DIR = os.path.expanduser("~/.cache/antigus/manifests")
+MANIFEST_SUFFIX = ".agm"
+# Digests recorded for every file, whatever the current definitions use, so
+# later feeds of any of these kinds can be matched.
+MANIFEST_ALGORITHMS = ("sha256", "md5", "sha1")
+
+MAGIC = b"AGMAN\x00\x01\x00"
+# magic, column count, row count
+_HEADER = struct.Struct("<8sIQ")
+# name, record size, length in bytes, offset
+_COLUMN = struct.Struct("<8sIQQ")
+_DIR_ID = struct.Struct("<I")
+_SIZE = struct.Struct("<Q")
+_MTIME = struct.Struct("<q")
+# Write buffer of each spilled column.
+SPILL_BUFFER = 256 * 1024
+_DIGEST_BYTES = {algorithm: length // 2 for length, algorithm in DIGEST_SIZES.items()}
+
+
+# Example: Where the manifest of a scan of root on this host is kept. Each
+# new scan of the same root replaces it.
+def manifest_path(root, manifest_dir=MANIFEST_DIR, host=None):
+    host = host or os.uname().nodename
+    key = hashlib.sha1(os.fsencode(root)).hexdigest()[:12]
+    return os.path.join(manifest_dir, f"{host}-{key}{MANIFEST_SUFFIX}")
+
+
+# Example: Every manifest under the given files and directories, e.g. the
+# local ones plus a directory of manifests collected from other hosts.
+def find_manifests(paths=(MANIFEST_DIR,)):
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found += sorted(glob.glob(os.path.join(glob.escape(path), "**", f"*{MANIFEST_SUFFIX}"),
+                                      recursive=True))
+        elif os.path.exists(path):
+            found.append(path)
+    return found
+
+
+# Collects rows during a scan and writes the manifest on close(). Each
+# per-row column is spilled to its own anonymous temporary file next to
+# the manifest as rows come in, so a scan of millions of files keeps only
+# the directory table in memory. Called from the verdict stage only, so it
+# needs no lock.
+class ManifestWriter:
+
+    def __init__(self, path, root, algorithms=MANIFEST_ALGORITHMS, host=None):
+        self.path = path
+        self.root = root
+        self.host = host or os.uname().nodename
+        self.algorithms = tuple(algorithms)
+        self.rows = 0
+        self._dirs = {}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._spill = {}
+        try:
+            for name in ("names", "dir_id", "size", "mtime") + self.algorithms:
+                self._spill[name] = tempfile.TemporaryFile(dir=os.path.dirname(path) or ".",
+                                                           buffering=SPILL_BUFFER)
+        except OSError:
+            self.discard()
+            raise
+
+    def __len__(self):
+        return self.rows
+
+    # digests as returned by file_digests; st may be None if the file was
+    # never stat'ed.
+    def add(self, fpath, st, digests):
+        directory, name = os.path.split(os.fsencode(fpath))
+        dir_id = self._dirs.setdefault(directory, len(self._dirs))
+        spill = self._spill
+        spill["names"].write(b"\0" + name if self.rows else name)
+        spill["dir_id"].write(_DIR_ID.pack(dir_id))
+        spill["size"].write(_SIZE.pack(st.st_size if st is not None else 0))
+        spill["mtime"].write(_MTIME.pack(st.st_mtime_ns if st is not None else 0))
+        for algorithm in self.algorithms:
+            h = digests.get(algorithm)
+            spill[algorithm].write(bytes.fromhex(h) if h else bytes(_DIGEST_BYTES[algorithm]))
+        self.rows += 1
+
+    # Drops the spilled columns without writing a manifest, e.g. for a scan
+    # that did not complete.
+    def discard(self):
+        for f in self._spill.values():
+            f.close()
+        self._spill = {}
+
+    def close(self):
+        try:
+            meta = json.dumps({"host": self.host, "root": self.root, "algorithms": self.algorithms,
+                               "created": time.time()}).encode()
+            # name, record size, and the bytes or the spill file holding them
+            columns = [("meta", 0, meta), ("dirs", 0, b"\0".join(self._dirs)),
+                       ("names", 0, self._spill["names"]), ("dir_id", 4, self._spill["dir_id"]),
+                       ("size", 8, self._spill["size"]), ("mtime", 8, self._spill["mtime"])]
+            columns += [(algorithm, _DIGEST_BYTES[algorithm], self._spill[algorithm])
+                        for algorithm in self.algorithms]
+            lengths = [len(data) if isinstance(data, bytes) else data.tell() for _, _, data in columns]
+            offset = _HEADER.size + _COLUMN.size * len(columns)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(_HEADER.pack(MAGIC, len(columns), self.rows))
+                for (name, record_size, _), length in zip(columns, lengths):
+                    f.write(_COLUMN.pack(name.encode(), record_size, length, offset))
+                    offset += length
+                for _, _, data in columns:
+                    if isinstance(data, bytes):
+                        f.write(data)
+                    else:
+                        data.seek(0)
+                        shutil.copyfileobj(data, f, SPILL_BUFFER)
+            os.replace(tmp, self.path)
+        finally:
+            self.discard()
+        return self.path
+
+
+class Manifest:
+
+    def __init__(self, path):
+        self.path = path
+        self._columns = {}
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, self.rows = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an Antigus manifest")
+        for i in range(count):
+            name, record_size, length, offset = _COLUMN.unpack_from(self._map, _HEADER.size + i * _COLUMN.size)
+            self._columns[name.rstrip(b"\0").decode()] = (record_size, offset, length)
+        self.meta = json.loads(bytes(self.column("meta")))
+        self.host = self.meta["host"]
+        self.root = self.meta["root"]
+        self.algorithms = tuple(a for a in self.meta["algorithms"] if a in self._columns)
+        self._paths = None
+
+    def __len__(self):
+        return self.rows
+
+    # Example: The raw bytes of a column, without copying it.
+    def column(self, name):
+        _, offset, length = self._columns[name]
+        return memoryview(self._map)[offset:offset + length]
+
+    def _numbers(self, name, typecode):
+        values = array(typecode)
+        values.frombytes(self.column(name))
+        return values
+
+    # Only split out when a row is looked up, e.g. for a hit.
+    def file_path(self, row):
+        if self._paths is None:
+            dirs = bytes(self.column("dirs")).split(b"\0")
+            names = bytes(self.column("names")).split(b"\0")
+            self._paths = (dirs, names, self._numbers("dir_id", "I"))
+        dirs, names, dir_ids = self._paths
+        return os.fsdecode(os.path.join(dirs[dir_ids[row]], names[row]))
+
+    # Example: {"path": ..., "size": ..., "mtime": ..., "sha256": ..., ...}
+    def row(self, row):
+        size_offset = self._columns["size"][1] + row * 8
+        mtime_offset = self._columns["mtime"][1] + row * 8
+        out = {"path": self.file_path(row),
+               "size": struct.unpack_from("<Q", self._map, size_offset)[0],
+               "mtime": struct.unpack_from("<q", self._map, mtime_offset)[0] / 1e9}
+        for algorithm in self.algorithms:
+            n = _DIGEST_BYTES[algorithm]
+            digest = bytes(self.column(algorithm)[row * n:(row + 1) * n])
+            out[algorithm] = digest.hex() if any(digest) else None
+        return out
+
+    def close(self):
+        self._map.close()
+
+
+# {record size: set of raw digests} from definitions lines or hex digests.
+def _digest_sets(definitions):
+    from signature_store import parse_definition
+    sets = {}
+    for line in definitions:
+        parsed = parse_definition(line)
+        if parsed:
+            sets.setdefault(len(parsed[1]), set()).add(parsed[1])
+    return sets
+
+
+# Rows of one digest column found in the definitions.
+def _match_column(column, record_size, rows, store, wanted):
+    hits = []
+    if wanted is None:
+        # A store much larger than the manifest: look each row up in it.
+        empty = bytes(record_size)
+        for row in range(rows):
+            digest = bytes(column[row * record_size:(row + 1) * record_size])
+            if digest != empty and store.contains_digest(digest):
+                hits.append(row)
+        return hits
+    data = bytes(column)
+    for row in range(rows):
+        if data[row * record_size:(row + 1) * record_size] in wanted:
+            hits.append(row)
+    return hits
+
+
+# Example: Match manifests against a signature_store.SignatureStore (or any
+# iterable of definitions lines) without touching the files they describe.
+# Returns one dict per hit: the manifest row plus "host", "manifest",
+# "algorithm" and "digest". A file matched by several digests is reported
+# once.
+def rematch(manifests, store):
+    from signature_store import SignatureStore
+    if isinstance(store, SignatureStore):
+        sections = store.sections()
+        sets = {}
+    else:
+        sections = {}
+        sets = _digest_sets(store)
+    hits = []
+    for path in manifests:
+        try:
+            manifest = Manifest(path)
+        except (OSError, ValueError) as e:
+            print(f"Skipping manifest {path}: {e}")
+            continue
+        try:
+            seen = set()
+            for algorithm in manifest.algorithms:
+                record_size = _DIGEST_BYTES[algorithm]
+                wanted = sets.get(record_size)
+                if record_size in sections:
+                    # Load the smaller side into a set.
+                    if sections[record_size] <= manifest.rows * 4:
+                        wanted = sets[record_size] = set(store.iter_section(record_size))
+                        del sections[record_size]
+                elif wanted is None:
+                    continue
+                for row in _match_column(manifest.column(algorithm), record_size, manifest.rows, store, wanted):
+                    if row in seen:
+                        continue
+                    seen.add(row)
+                    hit = manifest.row(row)
+                    hit.update(host=manifest.host, manifest=path, algorithm=algorithm, digest=hit[algorithm])
+                    hits.append(hit)
+        finally:
+            manifest.close()
+    return hits
@@ -0,0 +1,415 @@
+# scan_metrics.py
+# Always-on scan instrumentation. The scan stages (walk, stat, open, read,
+# hash, lookup, quarantine) record their latencies into fixed-bucket
+# histograms, and counters track files, bytes read, cache hits and threats.
+# Recording is a few perf_counter calls and one short lock per file or
+# directory. The metrics are exposed in the Prometheus text format, written
+# to a file (for node_exporter's textfile collector) or served on a unix
+# socket, and SamplingProfiler can be switched on for deeper looks.
+#
+# Example: curl --unix-socket ~/.cache/antigus/metrics.sock http://localhost/metrics
+#
+# Metrics live in this process; hashing done in a process pool
+# (use_processes=True) only shows up in the walk and verdict stages.
+import bisect
+import collections
+import os
+import sys
+import threading
+import time
+
+STAGES = ("walk", "stat", "open", "read", "hash", "lookup", "quarantine")
+COUNTERS = ("dirs_walked", "files_walked", "files_hashed", "bytes_read", "read_errors",
+            "cache_hits", "cache_misses", "prefilter_skipped", "files_scanned", "threats",
+            "quarantined", "quarantine_errors", "scans")
+# Upper bounds of the latency histogram buckets, in seconds.
+BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+METRICS_FILE = os.path.expanduser("~/.cache/antigus/metrics.prom")
+METRICS_SOCKET = os.path.expanduser("~/.cache/antigus/metrics.sock")
+# Seconds between rewrites of the metrics file while a scan runs.
+METRICS_FILE_INTERVAL = 10.0
+# Live throughput is averaged over this many seconds.
+THROUGHPUT_WINDOW = 5.0
+PROFILE_INTERVAL = 0.005
+
+_PREFIX = "antigus"
+
+
+class Histogram:
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)    # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class ScanMetrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = dict.fromkeys(COUNTERS, 0)
+            self.histograms = {stage: Histogram() for stage in STAGES}
+            self.scans_running = 0
+            self.last_scan_seconds = None
+            self._scan_started = None
+            self._marks = collections.deque()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.histograms[stage].observe(seconds)
+
+    def add(self, counter, n=1):
+        with self._lock:
+            self.counters[counter] += n
+
+    # One directory listed by the walker.
+    def record_dir(self, seconds, files):
+        with self._lock:
+            self.histograms["walk"].observe(seconds)
+            self.counters["dirs_walked"] += 1
+            self.counters["files_walked"] += files
+
+    # One file read by scanner_utils.file_digests; hash includes the
+    # content-signature sinks fed from the same read.
+    def record_file(self, open_seconds, read_seconds, hash_seconds, nbytes):
+        with self._lock:
+            h = self.histograms
+            h["open"].observe(open_seconds)
+            h["read"].observe(read_seconds)
+            h["hash"].observe(hash_seconds)
+            self.counters["files_hashed"] += 1
+            self.counters["bytes_read"] += nbytes
+
+    # One file judged by the verdict stage.
+    def record_verdict(self, lookup_seconds, threat):
+        with self._lock:
+            self.histograms["lookup"].observe(lookup_seconds)
+            self.counters["files_scanned"] += 1
+            if threat:
+                self.counters["threats"] += 1
+
+    def scan_started(self):
+        with self._lock:
+            self.scans_running += 1
+            self.counters["scans"] += 1
+            self._scan_started = time.monotonic()
+            # So the first throughput() of a scan has a sample to go from.
+            self._marks.append((self._scan_started, self.counters["files_scanned"],
+                                self.counters["bytes_read"]))
+
+    def scan_finished(self):
+        with self._lock:
+            self.scans_running = max(0, self.scans_running - 1)
+            if self._scan_started is not None:
+                self.last_scan_seconds = time.monotonic() - self._scan_started
+
+    # Example: (files per second, bytes per second) over the last
+    # THROUGHPUT_WINDOW seconds. Each call is also a sample, so call it at
+    # a steady rate (e.g. from a dashboard timer).
+    def throughput(self, window=THROUGHPUT_WINDOW):
+        now = time.monotonic()
+        with self._lock:
+            files, nbytes = self.counters["files_scanned"], self.counters["bytes_read"]
+            marks = self._marks
+            marks.append((now, files, nbytes))
+            while len(marks) > 2 and now - marks[1][0] >= window:
+                marks.popleft()
+            then, files_then, bytes_then = marks[0]
+        elapsed = now - then
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return (files - files_then) / elapsed, (nbytes - bytes_then) / elapsed
+
+    def cache_hit_rate(self):
+        c = self.counters
+        lookups = c["cache_hits"] + c["cache_misses"]
+        return c["cache_hits"] / lookups if lookups else 0.0
+
+    # Example: A consistent copy of everything, for reports and dashboards.
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "stages": {stage: {"count": h.count, "seconds": round(h.sum, 6)}
+                           for stage, h in self.histograms.items()},
+                "scans_running": self.scans_running,
+                "last_scan_seconds": self.last_scan_seconds,
+            }
+
+    # Example: The metrics in the Prometheus text exposition format.
+    def render(self):
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {stage: (list(h.counts), h.sum, h.count) for stage, h in self.histograms.items()}
+            running, last = self.scans_running, self.last_scan_seconds
+        files_per_sec, bytes_per_sec = self.throughput() if running else (0.0, 0.0)
+        lines = []
+        for name in COUNTERS:
+            lines.append(f"# TYPE {_PREFIX}_{name}_total counter")
+            lines.append(f"{_PREFIX}_{name}_total {counters[name]}")
+        metric = f"{_PREFIX}_scan_stage_seconds"
+        lines.append(f"# HELP {metric} Time spent per scan stage, per file or directory.")
+        lines.append(f"# TYPE {metric} histogram")
+        for stage, (counts, total, count) in histograms.items():
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {count}')
+        lookups = counters["cache_hits"] + counters["cache_misses"]
+        gauges = {
+            "scans_running": running,
+            "cache_hit_ratio": round(counters["cache_hits"] / lookups, 4) if lookups else 0,
+            "last_scan_seconds": round(last, 3) if last is not None else 0,
+            "files_per_second": round(files_per_sec, 1),
+            "bytes_per_second": round(bytes_per_sec),
+        }
+        for name, value in gauges.items():
+            lines.append(f"# TYPE {_PREFIX}_{name} gauge")
+            lines.append(f"{_PREFIX}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# The process-wide metrics every instrumented module records into.
+METRICS = ScanMetrics()
+
+
+# Example: What happened between two snapshots, e.g. during one scan:
+# {"counters": {...}, "stage_seconds": {"walk": 0.4, "read": 3.1, ...}}
+def delta(before, after):
+    return {
+        "counters": {name: after["counters"][name] - before["counters"][name] for name in COUNTERS},
+        "stage_seconds": {stage: round(after["stages"][stage]["seconds"] - before["stages"][stage]["seconds"], 3)
+                          for stage in STAGES},
+    }
+
+
+# Example: Write the metrics to path, atomically so a collector never
+# reads half a file.
+def write_textfile(path=METRICS_FILE, metrics=METRICS):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(metrics.render())
+    os.replace(tmp, path)
+
+
+# Example: parse_metrics(render()) -> {"files_scanned_total": 812.0,
+# "scans_running": 1.0, ...}: the counters and gauges, without the prefix;
+# histograms are left out.
+def parse_metrics(text):
+    values = {}
+    for line in text.splitlines():
+        if line.startswith("#") or "{" in line or not line.startswith(_PREFIX + "_"):
+            continue
+        name, _, value = line.partition(" ")
+        try:
+            values[name[len(_PREFIX) + 1:]] = float(value)
+        except ValueError:
+            continue
+    return values
+
+
+# Example: The metrics another process (the scan daemon, a CLI scan)
+# exports: scraped from its socket, else read from its textfile, as
+# parse_metrics gives them plus "age", the seconds since they were
+# current. None when neither is there.
+def read_metrics(socket_path=METRICS_SOCKET, file_path=METRICS_FILE, timeout=1.0):
+    if socket_path:
+        import socket
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(timeout)
+                sock.connect(socket_path)
+                sock.sendall(b"GET /metrics HTTP/1.0\r\n\r\n")
+                chunks = []
+                while True:
+                    data = sock.recv(65536)
+                    if not data:
+                        break
+                    chunks.append(data)
+            values = parse_metrics(b"".join(chunks).partition(b"\r\n\r\n")[2].decode())
+            values["age"] = 0.0
+            return values
+        except OSError:
+            pass
+    if file_path:
+        try:
+            with open(file_path) as f:
+                text = f.read()
+            age = time.time() - os.path.getmtime(file_path)
+        except OSError:
+            return None
+        values = parse_metrics(text)
+        values["age"] = max(0.0, age)
+        return values
+    return None
+
+
+# Rewrites the metrics file every interval seconds until stopped, and once
+# more on stop.
+class TextfileWriter:
+
+    def __init__(self, path=METRICS_FILE, interval=METRICS_FILE_INTERVAL, metrics=METRICS):
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            write_textfile(self.path, self.metrics)
+        except OSError as e:
+            print(f"Could not write metrics to {self.path}: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="antigus-metrics-file", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.write()
+
+
+# Serves the metrics on a unix socket, one HTTP/1.0 response per
+# connection, so Prometheus (through a socket proxy) or curl can scrape it.
+class MetricsServer:
+
+    def __init__(self, path=METRICS_SOCKET, metrics=METRICS):
+        self.path = path
+        self.metrics = metrics
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        import socket
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self._sock.listen(8)
+        self._thread = threading.Thread(target=self._serve, name="antigus-metrics", daemon=True)
+        self._thread.start()
+        return self
+
+    def _serve(self):
+        import socket
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return    # closed by stop()
+            with conn:
+                try:
+                    conn.settimeout(1.0)
+                    try:
+                        conn.recv(4096)     # the request line, if any; always answered
+                    except socket.timeout:
+                        pass
+                    body = self.metrics.render().encode()
+                    conn.sendall(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                                 + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+                except OSError:
+                    continue
+
+    def stop(self):
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+        if self._thread:
+            self._thread.join()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+# Example: Start serving the metrics on path, once per process.
+def serve_metrics(path=METRICS_SOCKET):
+    global _server
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = MetricsServer(path).start()
+            except OSError as e:
+                print(f"Metrics socket unavailable: {e}")
+        return _server
+
+
+# Samples the stack of every thread each interval seconds and counts them,
+# for a look at where a slow scan spends its time. folded() gives the
+# "frame;frame;frame count" lines flame graph tools read.
+class SamplingProfiler:
+
+    def __init__(self, interval=PROFILE_INTERVAL, thread_prefix="antigus"):
+        self.interval = interval
+        self.thread_prefix = thread_prefix
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, "")
+                if ident == own or name.startswith("antigus-metrics"):
+                    continue
+                if self.thread_prefix and not name.startswith(self.thread_prefix) and name != "MainThread":
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(name)
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        return self
+
+    def folded(self):
+        return [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+
+    def write(self, path):
+        with open(path, "w") as f:
+            f.write("\n".join(self.folded()) + "\n")
@@ -0,0 +1,386 @@
+# scan_pipeline.py
+# Pipelined scanner: a directory walker feeds a bounded queue, a pool of
+# workers hashes the files and a single verdict stage checks the digests
+# and quarantines threats.
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scan_metrics import METRICS
+from scan_scheduler import lower_io_priority
+from scanner_utils import DEFAULT_ALGORITHMS, IO_BUFFERED, IO_CACHE_FRIENDLY, file_digests, match_digests
+from similarity_hash import format_match
+
+# hashlib releases the GIL while hashing, so threads scale across cores.
+DEFAULT_WORKERS = os.cpu_count() or 1
+# Maximum number of files handed out by the walker but not yet judged.
+DEFAULT_QUEUE_DEPTH = 256
+
+_DONE = object()
+_CHECKPOINT = object()
+
+
+# Counters a caller can poll while a scan runs, e.g. to draw a progress bar.
+class ScanProgress:
+
+    def __init__(self):
+        self.discovered = 0      # files found by the walker so far
+        self.done = 0            # files judged so far
+        self.walk_finished = False
+
+
+# Example: Walk a tree with os.scandir, yielding a DirEntry for each regular
+# file in the same top-down order as os.walk. Symlinked directories are not
+# followed and fifos, sockets and devices are skipped since opening them can
+# block. stack, if given, is the list of directories still to visit and is
+# updated in place; on_dir_done(stack) runs after each directory's files have
+# all been yielded. With a scan_exclusions.ScanExclusions, excluded
+# directories are dropped before they are listed or stat'ed. by_inode
+# yields each directory's files (and visits its subdirectories) in inode
+# order, which on most filesystems is close to the order of their data on
+# disk, so a spinning disk seeks less; scandir has the inode numbers, so
+# it costs no extra calls.
+def walk_entries(path, stack=None, on_dir_done=None, exclusions=None, by_inode=False):
+    stack = [path] if stack is None else stack
+    while stack:
+        directory = stack.pop()
+        started = time.perf_counter()
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        subdirs = []
+        files = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if exclusions is None or not exclusions.skip_dir(entry):
+                        subdirs.append(entry)
+                elif entry.is_file():
+                    if exclusions is None or not exclusions.skip_file(entry):
+                        files.append(entry)
+            except OSError:
+                continue
+        if by_inode:
+            files.sort(key=_inode)
+            subdirs.sort(key=_inode)
+        METRICS.record_dir(time.perf_counter() - started, len(files))
+        yield from files
+        stack.extend(entry.path for entry in reversed(subdirs))
+        if on_dir_done:
+            on_dir_done(stack)
+
+
+def _inode(entry):
+    return entry.inode()
+
+
+def walk_files(path):
+    for entry in walk_entries(path):
+        yield entry.path
+
+
+# Example: Hash one file. With a content_signatures.ContentMatcher the file
+# is matched in the same read, and the names of the content signatures it
+# matched are stored under content.key ("" for none) next to the digests,
+# so the hash cache keeps both verdicts. With an
+# archive_scanner.ArchiveScanner, the members of archives are scanned too and
+# those that matched are stored under archives.key (None for non-archives).
+# With a similarity_hash.SimilarityIndex, the file's similarity digest is
+# computed in the same read and stored under similarity.key. io_mode is
+# one of scanner_utils.IO_MODES. The archive magic is sniffed in the same
+# read too, so only archives are opened a second time. archives_only is
+# for files the size prefilter ruled out: their digests cannot match, so
+# only their first bytes are read, and an archive's members are scanned.
+def hash_file(fpath, algorithms=DEFAULT_ALGORITHMS, content=None, archives=None, similarity=None,
+              io_mode=IO_BUFFERED, archives_only=False):
+    if archives_only:
+        kind = archives.sniff(fpath, io_mode)
+        return {archives.key: archives.scan(fpath, kind, io_mode)} if kind else {}
+    sketch = similarity.session() if similarity is not None else None
+    sniff = archives.session() if archives is not None else None
+    sinks = tuple(sink for sink in (sketch, sniff) if sink is not None)
+    if content is None:
+        digests = file_digests(fpath, algorithms, sinks, io_mode)
+    else:
+        digests, matches = content.scan_file(fpath, algorithms, sinks, io_mode)
+        if digests is not None:
+            digests[content.key] = ",".join(name for name, _ in matches)
+    if sketch is not None and digests is not None:
+        digests[similarity.key] = sketch.finish()
+    if sniff is not None and digests is not None:
+        kind = sniff.kind()
+        digests[archives.key] = archives.scan(fpath, kind, io_mode) if kind else None
+    return digests
+
+
+# Split a result from hash_file into (digests, content match or None).
+def split_content_verdict(digests, content):
+    if content is None or not digests or content.key not in digests:
+        return digests, None
+    names = digests[content.key]
+    digests = {name: h for name, h in digests.items() if name != content.key}
+    return digests, f"content:{names.split(',')[0]}" if names else None
+
+
+# Split a result from hash_file into (digests, similarity match or None),
+# the match as "similar:<signature name>:<score>".
+def split_similarity_verdict(digests, similarity):
+    if similarity is None or not digests or similarity.key not in digests:
+        return digests, None
+    best = similarity.match(digests[similarity.key])
+    digests = {name: h for name, h in digests.items() if name != similarity.key}
+    return digests, format_match(*best) if best else None
+
+
+# Split a result from hash_file into (digests, [[member, matched], ...]).
+def split_archive_verdict(digests, archives):
+    if archives is None or not digests or archives.key not in digests:
+        return digests, []
+    members = digests[archives.key] or []
+    return {name: h for name, h in digests.items() if name != archives.key}, members
+
+
+def _make_executor(workers, use_processes, initializer=None):
+    if workers <= 0:
+        return None
+    if use_processes:
+        from concurrent.futures import ProcessPoolExecutor
+        return ProcessPoolExecutor(max_workers=workers, initializer=initializer)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="antigus-hash",
+                              initializer=initializer)
+
+
+def _put(q, item, abort):
+    while not abort.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+# stop ends the walk early; abort is set when the verdict stage has gone away
+# and nothing will drain the queue any more.
+# stat_all stats every file even with no cache, prefilter, scheduler or
+# exclusions to use it, e.g. for the manifest's size and mtime columns.
+def _walker(path, q, executor, algorithms, cache, prefilter, checkpoint, scheduler, exclusions,
+            content, archives, similarity, entries, io_mode, progress, stop, abort, errors, stat_all=False):
+    if scheduler and scheduler.initializer:
+        scheduler.initializer()
+    stack = checkpoint.frontier() if checkpoint else [path]
+    cached = algorithms + tuple(extra.key for extra in (content, archives, similarity) if extra is not None)
+    def dir_done(stack):
+        # Everything queued so far precedes this marker, so when the verdict
+        # stage reaches it the remaining work is exactly this stack.
+        if checkpoint.due():
+            _put(q, (_CHECKPOINT, list(stack)), abort)
+    if entries is None:
+        entries = walk_entries(path, stack, dir_done if checkpoint else None, exclusions,
+                               by_inode=io_mode == IO_CACHE_FRIENDLY)
+    try:
+        for entry in entries:
+            if stop.is_set():
+                break
+            fpath = entry.path
+            st = digests = future = None
+            archives_only = False
+            if (stat_all or cache is not None or prefilter is not None or scheduler is not None
+                    or exclusions is not None):
+                started = time.perf_counter()
+                try:
+                    st = entry.stat()
+                except OSError:
+                    pass
+                METRICS.observe("stat", time.perf_counter() - started)
+            if exclusions is not None and st is not None and exclusions.skip_stat(st):
+                continue
+            progress.discovered += 1
+            if st is not None:
+                if (prefilter is not None and content is None and similarity is None
+                        and not prefilter.should_hash(st.st_size)):
+                    METRICS.add("prefilter_skipped")
+                    if archives is None:
+                        # No signature has this size: an empty result, never opened.
+                        digests = {}
+                    else:
+                        # Still an archive's members could match: only the
+                        # magic is read, and the file unpacked if it has it.
+                        archives_only = True
+                        prefilter.sniffed += 1
+                elif cache is not None:
+                    digests = cache.get(st, cached)
+                    # Archives are always unpacked again: their members are
+                    # judged against the current signatures.
+                    if digests and archives is not None and digests[archives.key] is not None:
+                        digests = None
+                    METRICS.add("cache_misses" if digests is None else "cache_hits")
+            if digests is None and executor:
+                if scheduler and not scheduler.acquire(st.st_size if st else 0, stop, abort):
+                    break
+                future = executor.submit(hash_file, fpath, algorithms, content, archives, similarity, io_mode,
+                                         archives_only)
+                if scheduler:
+                    future.add_done_callback(scheduler.release)
+            if not _put(q, (fpath, st, digests, future, archives_only), abort):
+                if future:
+                    future.cancel()
+                break
+    except Exception as e:
+        errors.append(e)
+    finally:
+        progress.walk_finished = True
+        _put(q, _DONE, abort)
+
+
+# Example: Scan a tree and return the list of threats, in walk order.
+# workers=0 hashes inline on the verdict thread (the serial path); any other
+# value gives the same results, just faster. on_result(path, matched_hash)
+# is called from the calling thread for every file, before quarantine.
+# Setting stop_event ends the scan early. With a hash_cache.HashCache,
+# unchanged files are judged from their cached digests without being opened.
+# A prefilter.ScanPrefilter skips files no signature can match by size.
+# Pass a ScanProgress to follow the scan from another thread. With a
+# scan_checkpoint.ScanCheckpointer the scan is checkpointed as it goes (and
+# resumed if the checkpointer loaded a previous state); the checkpoint is
+# removed once the scan completes. A scan_scheduler.ScanScheduler (sized
+# for the same number of workers) throttles hashing to the host's load.
+# scan_exclusions.ScanExclusions keeps the walk out of excluded paths,
+# pseudo and network filesystems, and scans each hard-linked file once.
+# With a content_signatures.ContentMatcher, files are also matched against
+# byte patterns in the same read; such threats are reported as
+# "content:<signature name>" instead of a digest. An
+# archive_scanner.ArchiveScanner adds threats found inside archives under
+# their composite paths (a.zip!/dir/b.exe); the archive itself is
+# quarantined. A similarity_hash.SimilarityIndex reports files close to a
+# known sample as "similar:<signature name>:<score>". A long-lived executor
+# (e.g. scan_daemon's pool) can be passed in to hash on instead of starting
+# one per scan; it is left running. A
+# scan_manifest.ManifestWriter gets a row for every file hashed; its digests
+# are computed for every file, so the size prefilter does not skip any.
+# With archives on, files the prefilter skips are still sniffed for the
+# archive magic (one small read) and unpacked if they are archives.
+# entries, an iterable of os.DirEntry-like objects (path and stat()), is
+# scanned in the order given instead of walking path, e.g. a
+# quick_scan.QuickScan's ranking; it cannot be checkpointed. With io_mode
+# IO_CACHE_FRIENDLY files are read around the page cache (see
+# scanner_utils) and each directory is walked in inode order.
+def scan_tree(path, bad_hashes, workers=DEFAULT_WORKERS, queue_depth=DEFAULT_QUEUE_DEPTH,
+              use_processes=False, quarantine=True, on_result=None, stop_event=None,
+              cache=None, prefilter=None, progress=None, checkpoint=None, scheduler=None,
+              exclusions=None, content=None, archives=None, executor=None, manifest=None,
+              similarity=None, entries=None, io_mode=IO_BUFFERED):
+    from quarantine import quarantine_file
+
+    # Exclusions, mount points and checkpoints all hold absolute paths.
+    path = os.path.abspath(path)
+    algorithms = tuple(getattr(bad_hashes, "algorithms", DEFAULT_ALGORITHMS))
+    if manifest is not None:
+        algorithms += tuple(a for a in manifest.algorithms if a not in algorithms)
+    stop = stop_event or threading.Event()
+    progress = progress or ScanProgress()
+    abort = threading.Event()
+    q = queue.Queue(maxsize=max(1, queue_depth))
+    errors = []
+    # [path, matched digest] pairs, carried over from a resumed checkpoint.
+    found = checkpoint.threats() if checkpoint else []
+    threats = [fpath for fpath, _ in found]
+    if checkpoint:
+        progress.done += checkpoint.files_done()
+        progress.discovered += checkpoint.files_done()
+    if exclusions is not None:
+        exclusions.start(path)
+    shared_executor = executor is not None
+    if not shared_executor:
+        executor = _make_executor(workers, use_processes, scheduler.initializer if scheduler else None)
+    # A manifest wants every file's digests, so the walker skips none by size.
+    walk_prefilter = prefilter if manifest is None else None
+    walker = threading.Thread(target=_walker, args=(path, q, executor, algorithms, cache, walk_prefilter,
+                                    checkpoint, scheduler, exclusions, content, archives, similarity, entries,
+                                    io_mode, progress, stop, abort, errors, manifest is not None),
+                              name="antigus-walker", daemon=True)
+    # The verdict stage runs on the caller's thread, and with workers=0 it
+    # does the hashing too: it gets the idle I/O class for the scan only.
+    restore_io = lower_io_priority() if scheduler and scheduler.idle_priority else None
+    METRICS.scan_started()
+    walker.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                break
+            if item[0] is _CHECKPOINT:
+                checkpoint.save(item[1], progress.done, found)
+                continue
+            fpath, st, digests, future, archives_only = item
+            if digests is None:
+                if future is not None:
+                    try:
+                        digests = future.result()
+                    except Exception:
+                        digests = None
+                elif scheduler:
+                    scheduler.acquire(st.st_size if st else 0)
+                    try:
+                        digests = hash_file(fpath, algorithms, content, archives, similarity, io_mode,
+                                            archives_only)
+                    finally:
+                        scheduler.release()
+                else:
+                    digests = hash_file(fpath, algorithms, content, archives, similarity, io_mode,
+                                        archives_only)
+                if cache is not None and st is not None and digests and not archives_only:
+                    cache.put(st, digests)
+            digests, content_match = split_content_verdict(digests, content)
+            digests, similar_match = split_similarity_verdict(digests, similarity)
+            digests, members = split_archive_verdict(digests, archives)
+            if manifest is not None and digests:
+                manifest.add(fpath, st, digests)
+            started = time.perf_counter()
+            if prefilter is not None:
+                matched = prefilter.match(digests)
+            else:
+                matched = match_digests(digests, bad_hashes)
+            matched = matched or content_match or similar_match
+            METRICS.record_verdict(time.perf_counter() - started, matched or members)
+            progress.done += 1
+            if on_result:
+                on_result(fpath, matched)
+                for member, member_match in members:
+                    on_result(member, member_match)
+            if matched:
+                threats.append(fpath)
+                found.append([fpath, matched])
+            for member, member_match in members:
+                threats.append(member)
+                found.append([member, member_match])
+            if quarantine and (matched or members):
+                quarantine_file(fpath, matched or members[0][1])
+    finally:
+        METRICS.scan_finished()
+        if restore_io:
+            restore_io()
+        abort.set()
+        walker.join()
+        if shared_executor:
+            # Drop this scan's queued work without stopping the pool.
+            while True:
+                try:
+                    item = q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _DONE and item[0] is not _CHECKPOINT and item[3] is not None:
+                    item[3].cancel()
+        elif executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+        if cache is not None:
+            cache.flush()
+    if errors:
+        raise errors[0]
+    if checkpoint and not stop.is_set():
+        checkpoint.finish()
+    return threats
@@ -0,0 +1,263 @@
+# scan_scheduler.py
+# Keeps scans from hurting the rest of the host: hashing concurrency grows
+# and shrinks with host CPU and disk load, the scan pauses when the host is
+# busy, and optional CPU and bytes-per-second budgets are enforced. Every
+# change of plan is written to the scan journal.
+import os
+import threading
+import time
+
+# CPU percent used by the rest of the host above which the scan backs off,
+# and above which it pauses.
+BUSY_CPU = 70.0
+PAUSE_CPU = 95.0
+# Share of time the disks were busy with other processes' I/O (0-1) above
+# which the scan backs off, and above which it pauses.
+BUSY_DISK = 0.6
+PAUSE_DISK = 0.95
+PAUSE_MEMORY = 95.0
+SAMPLE_INTERVAL = 1.0
+# Smallest share of each interval a scan throttled to its CPU budget gets
+# to run; the rest of the interval it rests.
+MIN_DUTY = 0.05
+
+
+# ioprio_set and ioprio_get syscall numbers; other platforms go through psutil.
+_IOPRIO_SET = {"x86_64": 251, "aarch64": 30, "i686": 289, "i386": 289, "armv7l": 315}
+_IOPRIO_GET = {"x86_64": 252, "aarch64": 31, "i686": 290, "i386": 290, "armv7l": 316}
+_IOPRIO_IDLE = 3 << 13     # IOPRIO_CLASS_IDLE, level 0
+_IOPRIO_WHO_PROCESS = 1
+
+
+# The raw syscall for the calling thread, which spares every scan from
+# importing psutil just for this; None where it is not available.
+def _ioprio_syscall(numbers, *args):
+    number = numbers.get(os.uname().machine) if hasattr(os, "uname") else None
+    if number is None or not os.path.exists("/proc/self"):
+        return None
+    import ctypes
+    libc = ctypes.CDLL(None, use_errno=True)
+    return libc.syscall(number, _IOPRIO_WHO_PROCESS, threading.get_native_id(), *args)
+
+
+def _ioprio_idle():
+    return _ioprio_syscall(_IOPRIO_SET, _IOPRIO_IDLE) == 0
+
+
+# Example: Lower the calling thread's CPU and I/O priority to idle.
+# On Linux both are per-thread, so this runs in each scan thread.
+def apply_idle_priority():
+    try:
+        os.nice(19)
+    except OSError:
+        pass
+    try:
+        if not _ioprio_idle():
+            import psutil
+            psutil.Process(threading.get_native_id()).ionice(psutil.IOPRIO_CLASS_IDLE)
+    except Exception:
+        pass
+
+
+# Example: restore = lower_io_priority() ... restore()
+# Sets the calling thread's I/O class to idle and returns a function that
+# puts its previous class back, or None if it was left alone. For threads
+# that outlive the scan, like the caller's thread the serial path hashes
+# on; the CPU priority is not lowered there, as it could not be raised
+# back without privileges.
+def lower_io_priority():
+    previous = _ioprio_syscall(_IOPRIO_GET)
+    if previous is None or previous < 0 or not _ioprio_idle():
+        return None
+    return lambda: _ioprio_syscall(_IOPRIO_SET, previous)
+
+
+class ScanScheduler:
+
+    def __init__(self, max_workers, min_workers=1, cpu_budget=None, bytes_per_sec=None,
+                 adaptive=True, idle_priority=True, journal=None, interval=SAMPLE_INTERVAL):
+        self.max_workers = max(1, max_workers)
+        self.min_workers = max(1, min(min_workers, self.max_workers))
+        # Percent of one core the scan process may use, e.g. 50 or 200.
+        self.cpu_budget = cpu_budget
+        self.bytes_per_sec = bytes_per_sec
+        self.adaptive = adaptive
+        self.idle_priority = idle_priority
+        self.journal = journal
+        self.interval = interval
+        self.target = self.max_workers
+        self.paused = False
+        # Share of each interval the scan runs for when one worker is still
+        # over the CPU budget; it rests for the remainder.
+        self.duty = 1.0
+        self.resting = False
+        self.in_flight = 0
+        self.paused_seconds = 0.0
+        self.decisions = 0
+        self._tokens = float(bytes_per_sec or 0)
+        self._refilled = time.monotonic()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last = None
+
+    def start(self):
+        if self.adaptive or self.cpu_budget:
+            self._thread = threading.Thread(target=self._run, name="antigus-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self.paused = self.resting = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+
+    # Initializer for scan threads and worker processes (picklable).
+    @property
+    def initializer(self):
+        return apply_idle_priority if self.idle_priority else None
+
+    # Example: Wait for a hashing slot (and, with a byte budget, for size
+    # bytes of allowance). Returns False if any of the given threading.Events
+    # is set while waiting.
+    def acquire(self, size, *stop):
+        with self._cond:
+            waited = None
+            while self.paused or self.resting or self.in_flight >= self.target:
+                if any(e.is_set() for e in stop):
+                    return False
+                if (self.paused or self.resting) and waited is None:
+                    waited = time.monotonic()
+                self._cond.wait(0.1)
+            if waited is not None:
+                self.paused_seconds += time.monotonic() - waited
+            self.in_flight += 1
+        if self.bytes_per_sec:
+            self._throttle(size, stop)
+        return True
+
+    def release(self, *_):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    # Token bucket holding at most one second of allowance.
+    def _throttle(self, size, stop):
+        with self._cond:
+            now = time.monotonic()
+            self._tokens = min(self.bytes_per_sec, self._tokens + (now - self._refilled) * self.bytes_per_sec)
+            self._refilled = now
+            self._tokens -= size
+            debt = -self._tokens
+        if debt > 0:
+            deadline = time.monotonic() + debt / self.bytes_per_sec
+            while time.monotonic() < deadline and not any(e.is_set() for e in stop):
+                time.sleep(min(0.1, deadline - time.monotonic()))
+
+    # Host readings with the scan's own CPU and I/O taken out, so the scan
+    # does not back off from load it causes itself.
+    def _sample(self, psutil, usage_fn, proc):
+        now = time.monotonic()
+        usage = usage_fn()
+        disk = psutil.disk_io_counters()
+        try:
+            own = proc.io_counters()
+            own_io = own.read_bytes + own.write_bytes
+        except Exception:
+            own_io = 0
+        sample = {"time": now, "cpu": usage["cpu_percent"], "memory": usage["memory_percent"],
+                  "busy_ms": getattr(disk, "busy_time", None) if disk else None,
+                  "io_bytes": disk.read_bytes + disk.write_bytes if disk else 0,
+                  "own_io": own_io, "proc_cpu": sum(os.times()[:2])}
+        last, self._last = self._last, sample
+        if last is None:
+            return None
+        elapsed = max(now - last["time"], 1e-6)
+        sample["scan_cpu"] = (sample["proc_cpu"] - last["proc_cpu"]) / elapsed * 100
+        sample["other_cpu"] = max(0.0, sample["cpu"] - sample["scan_cpu"] / (os.cpu_count() or 1))
+        sample["io_rate"] = (sample["io_bytes"] - last["io_bytes"]) / elapsed
+        other_io = max(0.0, sample["io_rate"] - (own_io - last["own_io"]) / elapsed)
+        sample["disk_busy"] = None
+        if sample["busy_ms"] is not None and last["busy_ms"] is not None:
+            busy = min(1.0, (sample["busy_ms"] - last["busy_ms"]) / 1000.0 / elapsed)
+            # Share of the disk's busy time owed to other processes.
+            sample["disk_busy"] = busy * (other_io / sample["io_rate"]) if sample["io_rate"] else busy
+        return sample
+
+    def _decide(self, s):
+        disk_busy = s["disk_busy"] or 0.0
+        cpu = s["other_cpu"]
+        if self.adaptive and (cpu >= PAUSE_CPU or disk_busy >= PAUSE_DISK or s["memory"] >= PAUSE_MEMORY):
+            return "pause", self.min_workers
+        if self.cpu_budget and s["scan_cpu"] > self.cpu_budget:
+            if self.target > self.min_workers:
+                return "shrink", self.target - 1
+            # Fewer workers would not help: rest for part of each interval.
+            return "throttle", self.target
+        if self.adaptive and (cpu >= BUSY_CPU or disk_busy >= BUSY_DISK):
+            return "shrink", max(self.min_workers, self.target - 1)
+        if self.cpu_budget and s["scan_cpu"] > self.cpu_budget * 0.8:
+            return "hold", self.target
+        if self.duty < 1.0:
+            return "unthrottle", self.target
+        return "grow", min(self.max_workers, self.target + 1)
+
+    # Run for duty of the interval, then rest for the remainder. Returns
+    # True once stopped.
+    def _wait_interval(self):
+        if self.duty >= 1.0:
+            return self._stop.wait(self.interval)
+        if self._stop.wait(self.interval * self.duty):
+            return True
+        with self._cond:
+            self.resting = True
+        stopped = self._stop.wait(self.interval * (1.0 - self.duty))
+        with self._cond:
+            self.resting = False
+            self._cond.notify_all()
+        return stopped
+
+    def _run(self):
+        # Scans shorter than one interval never load psutil.
+        if self._stop.wait(self.interval):
+            return
+        try:
+            import psutil
+            from monitor_utils import get_resource_usage
+        except ImportError:
+            print("psutil not installed; scan scheduling is limited to fixed budgets.")
+            return
+        proc = psutil.Process()
+        while not self._wait_interval():
+            sample = self._sample(psutil, get_resource_usage, proc)
+            if sample is None:
+                continue
+            action, target = self._decide(sample)
+            paused = action == "pause"
+            duty = self.duty
+            if action == "throttle":
+                # scan_cpu is measured over whole intervals, rests included.
+                duty = max(MIN_DUTY, duty * self.cpu_budget / sample["scan_cpu"])
+            elif action == "unthrottle":
+                duty = min(1.0, duty * 1.25)
+            if target == self.target and paused == self.paused and duty == self.duty:
+                continue
+            with self._cond:
+                self.target = target
+                self.paused = paused
+                self.duty = duty
+                self._cond.notify_all()
+            self.decisions += 1
+            if self.journal:
+                self.journal.event("scheduler", action=action, workers=target, duty=round(duty, 3),
+                                   host_cpu=sample["cpu"], other_cpu=round(sample["other_cpu"], 1),
+                                   memory=sample["memory"],
+                                   disk_busy=sample["disk_busy"], io_rate=round(sample["io_rate"]),
+                                   scan_cpu=round(sample["scan_cpu"], 1))
+
+    def stats(self):
+        return {"workers": self.target, "paused": self.paused, "duty": round(self.duty, 3),
+                "decisions": self.decisions,
+                "paused_seconds": round(self.paused_seconds, 3)}
@@ -1,18 +1,257 @@
 # scanner_utils.py
 # Utility functions for file scanning and threat detection
+import errno
 import hashlib
+import mmap
+import os
+import time
 
-# Example: Calculate SHA256 hash of a file
+from scan_metrics import METRICS
 
-def file_hash(path):
+# Files are read in fixed-size blocks into one reused buffer, so memory use
+# stays flat no matter how large the file is.
+CHUNK_SIZE = 1024 * 1024
+# Files at least this large are hashed through mmap instead of read().
+MMAP_THRESHOLD = 64 * 1024 * 1024
+# Digests computed in a single pass; feeds publish any one of these.
+DEFAULT_ALGORITHMS = ("sha256", "md5", "sha1")
+# Hex digest length -> algorithm, used to tell which feed a hash came from.
+DIGEST_SIZES = {64: "sha256", 40: "sha1", 32: "md5"}
+
+# How files are read. IO_BUFFERED goes through the page cache like any
+# other program, so a full scan evicts the working set of whatever else
+# runs on the host. IO_CACHE_FRIENDLY leaves the cache as it found it:
+# files of DIRECT_THRESHOLD and up are read with O_DIRECT where the
+# filesystem allows it, the others with fadvise SEQUENTIAL and NOREUSE,
+# READAHEAD bytes requested ahead of each read and the pages behind it
+# dropped with DONTNEED. A file whose first block was already cached is
+# in use by someone else, so its pages are left alone.
+IO_BUFFERED = "buffered"
+IO_CACHE_FRIENDLY = "cache-friendly"
+IO_MODES = (IO_BUFFERED, IO_CACHE_FRIENDLY)
+DIRECT_THRESHOLD = 1024 * 1024
+READAHEAD = 4 * 1024 * 1024
+# Without fadvise (e.g. on Windows) every mode reads like IO_BUFFERED.
+_fadvise = getattr(os, "posix_fadvise", None)
+_O_DIRECT = getattr(os, "O_DIRECT", 0)
+# libc's mincore, loaded on first use; False where there is none.
+_mincore = None
+# st_dev of the filesystems that refused O_DIRECT; not tried there again.
+_NO_DIRECT = set()
+
+
+def new_hashers(algorithms=DEFAULT_ALGORITHMS):
+    return {name: hashlib.new(name) for name in algorithms}
+
+
+# Feed every block of an open binary file to each hasher, reusing one buffer.
+# sinks are extra consumers of the same blocks (see file_digests). If
+# timings is a [read seconds, hash seconds] list, the time spent in each is
+# added to it. buf, if given, is the buffer to read into instead.
+def hash_stream(f, hashers, chunk_size=CHUNK_SIZE, sinks=(), timings=None, buf=None):
+    updaters = [h.update for h in hashers.values()] + [s.update for s in sinks]
+    buf = bytearray(chunk_size) if buf is None else buf
+    view = memoryview(buf)
+    total = 0
+    clock = time.perf_counter
+    reading = hashing = 0.0
+    while True:
+        started = clock()
+        n = f.readinto(buf)
+        read = clock()
+        reading += read - started
+        if not n:
+            break
+        block = view[:n]
+        for update in updaters:
+            update(block)
+        hashing += clock() - read
+        total += n
+    if timings is not None:
+        timings[0] += reading
+        timings[1] += hashing
+    return total
+
+
+def _hash_mmap(f, hashers, size, chunk_size=CHUNK_SIZE, sinks=()):
+    updaters = [h.update for h in hashers.values()] + [s.update for s in sinks]
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        view = memoryview(m)
+        try:
+            for start in range(0, size, chunk_size):
+                with view[start:start + chunk_size] as block:
+                    for update in updaters:
+                        update(block)
+        finally:
+            view.release()
+    return size
+
+
+# Switches O_DIRECT on or off for an open file; False if it can't be.
+def _set_direct(fd, st, on):
+    if not _O_DIRECT or (on and st.st_dev in _NO_DIRECT):
+        return False
+    import fcntl
     try:
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | _O_DIRECT if on else flags & ~_O_DIRECT)
+        return True
+    except OSError:
+        _NO_DIRECT.add(st.st_dev)
+        return False
+
+
+# The file object hash_stream reads in IO_CACHE_FRIENDLY mode. Direct reads
+# need a page-aligned buffer; file_digests passes one.
+class _UncachedReader:
+
+    def __init__(self, fd, st):
+        self.fd = fd
+        self.st = st
+        self.offset = 0
+        self.direct = st.st_size >= DIRECT_THRESHOLD and _set_direct(fd, st, True)
+        self.drop = None    # decided by the first buffered read
+        if not self.direct:
+            self._advise()
+
+    def _advise(self):
+        _fadvise(self.fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        _fadvise(self.fd, 0, 0, os.POSIX_FADV_NOREUSE)
+
+    def _first_read(self, buf):
+        # A file cached before the scan came is used by someone: keep its pages.
+        self.drop = not page_cached(self.fd)
+        return os.preadv(self.fd, [buf], 0)
+
+    def readinto(self, buf):
+        fd, offset = self.fd, self.offset
+        if self.direct:
+            try:
+                n = os.preadv(fd, [buf], offset)
+            except OSError as e:
+                if offset or e.errno != errno.EINVAL:
+                    raise
+                # Refused after all, e.g. over the alignment: read buffered.
+                _NO_DIRECT.add(self.st.st_dev)
+                _set_direct(fd, self.st, False)
+                self.direct = False
+                self._advise()
+                return self.readinto(buf)
+        elif self.drop is None:
+            n = self._first_read(buf)
+        else:
+            n = os.preadv(fd, [buf], offset)
+        if n and self.drop:
+            _fadvise(fd, offset, n, os.POSIX_FADV_DONTNEED)
+            if n == len(buf):
+                _fadvise(fd, offset + n, READAHEAD, os.POSIX_FADV_WILLNEED)
+        elif not n and self.drop:
+            # Pages still under readahead I/O when their range was dropped
+            # stay behind; at the end of the file they have all been read.
+            _fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        self.offset += n
+        return n
+
+
+def _load_mincore():
+    global _mincore
+    if _mincore is None:
+        try:
+            import ctypes
+            _mincore = ctypes.CDLL(None, use_errno=True).mincore
+        except (ImportError, OSError, AttributeError, TypeError):
+            _mincore = False
+    return _mincore
+
+
+# Example: True if the first page of an open file is in the page cache.
+# mincore on a mapping of it tells without reading anything; a read, even
+# with RWF_NOWAIT, starts readahead and so caches the file it asks about.
+# False where that can't be told, and for empty files.
+def page_cached(fd):
+    mincore = _load_mincore()
+    if not mincore:
+        return False
+    import ctypes
+    try:
+        # A private mapping is writable, which ctypes needs for its address,
+        # and nothing is faulted in until it is touched.
+        m = mmap.mmap(fd, mmap.PAGESIZE, access=mmap.ACCESS_COPY)
+    except (OSError, ValueError):
+        return False
+    try:
+        page = ctypes.c_char.from_buffer(m)
+        vec = ctypes.c_ubyte()
+        try:
+            ok = mincore(ctypes.c_void_p(ctypes.addressof(page)), ctypes.c_size_t(mmap.PAGESIZE),
+                         ctypes.byref(vec)) == 0
+        finally:
+            del page
+        return ok and bool(vec.value & 1)
+    finally:
+        m.close()
+
+
+# Drops the cached pages of an open file, readahead included.
+def drop_cache(fd):
+    if _fadvise is not None:
+        _fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+# Example: Calculate several digests of a file in one streaming pass
+# Returns {"sha256": hex, "md5": hex, ...} or None if the file can't be read.
+# Each sink gets start(size) and then every block the hashers see, so other
+# checks (content signatures) share this single read of the file. Blocks
+# are views of a reused buffer and only valid during the call.
+# Open, read and hash times go to scan_metrics; mmap'd files fault their
+# pages in while being hashed, so all of their time counts as hash.
+# io_mode is one of IO_MODES.
+def file_digests(path, algorithms=DEFAULT_ALGORITHMS, sinks=(), io_mode=IO_BUFFERED):
+    try:
+        hashers = new_hashers(algorithms)
+        started = time.perf_counter()
         with open(path, 'rb') as f:
-            return hashlib.sha256(f.read()).hexdigest()
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            opened = time.perf_counter()
+            for sink in sinks:
+                sink.start(size)
+            timings = [0.0, 0.0]
+            if io_mode == IO_CACHE_FRIENDLY and _fadvise is not None:
+                reader = _UncachedReader(f.fileno(), st)
+                # An anonymous mapping is page aligned, as O_DIRECT needs.
+                buf = mmap.mmap(-1, CHUNK_SIZE) if reader.direct else None
+                total = hash_stream(reader, hashers, sinks=sinks, timings=timings, buf=buf)
+            elif size >= MMAP_THRESHOLD:
+                total = _hash_mmap(f, hashers, size, sinks=sinks)
+                timings[1] = time.perf_counter() - opened
+            else:
+                total = hash_stream(f, hashers, sinks=sinks, timings=timings)
+        METRICS.record_file(opened - started, timings[0], timings[1], total)
+        return {name: h.hexdigest() for name, h in hashers.items()}
     except Exception:
+        METRICS.add("read_errors")
         return None
 
+
+# Example: Calculate SHA256 hash of a file
+
+def file_hash(path):
+    digests = file_digests(path, ("sha256",))
+    return digests["sha256"] if digests else None
+
+
+# Return the first digest found in bad_hashes, or None.
+def match_digests(digests, bad_hashes):
+    if not digests:
+        return None
+    for h in digests.values():
+        if h in bad_hashes:
+            return h
+    return None
+
+
 # Example: Check file against a list of known bad hashes
 
 def is_malicious(path, bad_hashes):
-    h = file_hash(path)
-    return h in bad_hashes if h else False
+    return match_digests(file_digests(path), bad_hashes) is not None
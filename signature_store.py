@@ -0,0 +1,230 @@
+# signature_store.py
+# Compact on-disk store of known-bad digests: packed binary records, sorted
+# per algorithm and memory-mapped read-only, so it loads instantly and every
+# scanner process shares the same pages.
+import mmap
+import os
+import struct
+
+from scanner_utils import DIGEST_SIZES
+
+SIGNATURE_STORE_FILE = "antigus_signatures.bin"
+
+MAGIC = b"AGSIG\x00\x01\x00"
+# magic, section count
+_HEADER = struct.Struct("<8sI")
+# name, record size, record count, offset of the section's prefix index
+_SECTION = struct.Struct("<8sIQQ")
+# Each section starts with a table of where every 2-byte digest prefix
+# begins, so a lookup only binary-searches a handful of records.
+_PREFIXES = 1 << 16
+_INDEX = struct.Struct(f"<{_PREFIXES + 1}I")
+_ORDER = ("sha256", "sha1", "md5")
+
+
+# Parse one definitions line into (algorithm, raw digest, size), or None.
+# Lines are "<hex digest>" optionally followed by the file size in bytes,
+# separated by whitespace or a colon: "<hex>:<size>" or "<hex> <size> name".
+def parse_definition(line):
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    fields = line.replace(":", " ", 1).split()
+    token = fields[0].lower()
+    algorithm = DIGEST_SIZES.get(len(token))
+    if not algorithm:
+        return None
+    try:
+        digest = bytes.fromhex(token)
+    except ValueError:
+        return None
+    size = int(fields[1]) if len(fields) > 1 and fields[1].isdigit() else None
+    return algorithm, digest, size
+
+
+def _write_store(path, sections, sizes=None):
+    names = [name for name in _ORDER if sections.get(name)]
+    offset = _HEADER.size + _SECTION.size * (len(names) + (sizes is not None))
+    table = []
+    for name in names:
+        table.append((name, offset))
+        offset += _INDEX.size + len(sections[name]) * len(next(iter(sections[name])))
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(names) + (sizes is not None)))
+        for name, section_offset in table:
+            records = sections[name]
+            f.write(_SECTION.pack(name.encode(), len(next(iter(records))), len(records), section_offset))
+        if sizes is not None:
+            # Sizes are a plain sorted array of uint64 with no prefix index.
+            f.write(_SECTION.pack(b"sizes", 8, len(sizes), offset))
+        for name, _ in table:
+            records = sorted(sections[name])
+            starts = [0] * (_PREFIXES + 1)
+            for digest in records:
+                starts[int.from_bytes(digest[:2], "big") + 1] += 1
+            for i in range(1, _PREFIXES + 1):
+                starts[i] += starts[i - 1]
+            f.write(_INDEX.pack(*starts))
+            f.write(b"".join(records))
+        if sizes is not None:
+            f.write(struct.pack(f"<{len(sizes)}Q", *sorted(sizes)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _add_records(sections, sizes, records):
+    for algorithm, digest, size in records:
+        sections.setdefault(algorithm, set()).add(digest)
+        if sizes is not None:
+            if size is None:
+                sizes = None
+            else:
+                sizes.add(size)
+    return sizes
+
+
+def _parse_lines(lines):
+    for line in lines:
+        parsed = parse_definition(line)
+        if parsed:
+            yield parsed
+
+
+# Example: Compile feed lines (as returned by fetch_definitions) into a store
+# file. The file is replaced atomically, so scanners never see half of it.
+# lines can be any iterable, including a streamed HTTP body.
+# File sizes are only kept when every signature has one, since a single
+# unsized signature could match a file of any size. With
+# require_records=True, lines without a single definition raise ValueError
+# and the file at path is left as it was.
+def compile_definitions(lines, path=SIGNATURE_STORE_FILE, require_records=False):
+    sections = {}
+    sizes = _add_records(sections, set(), _parse_lines(lines))
+    if require_records and not sections:
+        raise ValueError("no definitions in the feed")
+    _write_store(path, sections, sizes if sections else None)
+    return SignatureStore(path)
+
+
+# Example: Apply a definitions delta to an existing store and write the
+# result to path. added and removed are iterables of definitions lines.
+# Sizes of removed signatures are kept, which only makes the size
+# prefilter slightly less selective.
+def apply_delta(store, added, removed, path=SIGNATURE_STORE_FILE):
+    sections = {}
+    for size, (name, _, _) in store._sections.items():
+        sections[name] = set(bytes(d) for d in store.iter_section(size))
+    sizes = store.known_sizes()
+    sizes = _add_records(sections, sizes, _parse_lines(added))
+    for algorithm, digest, _ in _parse_lines(removed):
+        sections.get(algorithm, set()).discard(digest)
+    _write_store(path, sections, sizes if any(sections.values()) else None)
+    return SignatureStore(path)
+
+
+class SignatureStore:
+
+    def __init__(self, path=SIGNATURE_STORE_FILE):
+        self.path = path
+        self._sections = {}
+        self._sizes = None
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an Antigus signature store")
+        for i in range(count):
+            name, record_size, records, offset = _SECTION.unpack_from(
+                self._map, _HEADER.size + i * _SECTION.size)
+            name = name.rstrip(b"\0").decode()
+            if name == "sizes":
+                self._sizes = (records, offset)
+            else:
+                self._sections[record_size] = (name, records, offset)
+
+    # Digests the scanner needs to compute to check files against this store.
+    @property
+    def algorithms(self):
+        return tuple(name for name, _, _ in self._sections.values()) or ("sha256",)
+
+    # Set of file sizes every signature is known to have, or None when some
+    # signatures came without a size.
+    def known_sizes(self):
+        if self._sizes is None:
+            return None
+        records, offset = self._sizes
+        return set(struct.unpack_from(f"<{records}Q", self._map, offset))
+
+    # Example: {record size: signature count}, e.g. {32: 120000, 16: 800}.
+    def sections(self):
+        return {size: records for size, (_, records, _) in self._sections.items()}
+
+    def __len__(self):
+        return sum(records for _, records, _ in self._sections.values())
+
+    def contains_digest(self, digest):
+        section = self._sections.get(len(digest))
+        if not section:
+            return False
+        _, _, offset = section
+        size = len(digest)
+        prefix = int.from_bytes(digest[:2], "big")
+        lo, hi = struct.unpack_from("<2I", self._map, offset + prefix * 4)
+        base = offset + _INDEX.size
+        m = self._map
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = base + mid * size
+            record = m[start:start + size]
+            if record == digest:
+                return True
+            if record < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        return False
+
+    # Hex digests of any supported algorithm, as produced by file_digests.
+    def __contains__(self, hexdigest):
+        if not isinstance(hexdigest, str):
+            return False
+        try:
+            return self.contains_digest(bytes.fromhex(hexdigest))
+        except ValueError:
+            return False
+
+    def iter_section(self, record_size):
+        _, records, offset = self._sections[record_size]
+        base = offset + _INDEX.size
+        for i in range(records):
+            yield self._map[base + i * record_size:base + (i + 1) * record_size]
+
+    # Raw digests of every signature, section by section.
+    def iter_digests(self):
+        for size in self._sections:
+            yield from self.iter_section(size)
+
+    def __iter__(self):
+        for digest in self.iter_digests():
+            yield digest.hex()
+
+    # Worker processes reopen the file instead of copying the mapping.
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def close(self):
+        self._map.close()
+
+
+# Example: Open the compiled store, or return an empty list if there is none yet
+def load_definitions(path=SIGNATURE_STORE_FILE):
+    try:
+        return SignatureStore(path)
+    except Exception as e:
+        print(f"No usable signature store at {path}: {e}")
+        return []
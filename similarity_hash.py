@@ -0,0 +1,286 @@
+# similarity_hash.py
+# Similarity digests, so repacked or slightly modified variants of a known
+# sample are caught even though their SHA-256 differs.
+#
+# Digest: the file is cut into pieces at context-triggered points (the
+# boundaries depend only on the bytes around them, so an insertion or a
+# patch only changes the pieces it touches), and the pieces' CRC-32s are
+# summarised as a one-permutation MinHash: SKETCH_SIZE bins keyed by the low
+# bits of the hash, each keeping the smallest hash that fell into it. The
+# share of bins two digests agree on estimates the share of pieces the files
+# have in common, reported as a score from 0 to 100.
+#
+# Boundaries are found without a per-byte loop: each byte is mapped to 0 or
+# 1 with bytes.translate (the bytes most common in text and padding map to
+# 0) and the result is split on a run of _RUN ones, both in C. Pieces
+# average ~450 bytes in executables and ~140 in compressed or random data,
+# which runs at 110 and 60 MB/s here. The digest is a sink for
+# scanner_utils.file_digests, so it shares the read with the hashes and
+# content signatures.
+#
+# Index: the bins are grouped into bands of two (one 64-bit word of the
+# digest), and every band of every known-bad digest goes in a dict. A file's candidates are the
+# digests it shares a whole band with, so a lookup costs the same however
+# many signatures there are; only candidates are scored.
+#
+# Signatures, one per line, "Name:<digest>"; make them with
+#   python similarity_hash.py sample.exe ...
+import hashlib
+import os
+import struct
+import sys
+import zlib
+
+from scanner_utils import DEFAULT_ALGORITHMS, file_digests
+
+SIMILARITY_SIGNATURES_FILE = "antigus_similarity_signatures.txt"
+# Lowest score reported as a match. Unrelated files score under 5; a 40 KB
+# executable with a few dozen bytes patched or inserted scores 50 to 80.
+SIMILARITY_THRESHOLD = 50
+SKETCH_SIZE = 64
+# Files with fewer pieces than this get no digest: there is too little to
+# compare. Plain ASCII text has few boundaries, so small scripts are left
+# to content signatures.
+MIN_PIECES = 8
+# Larger files are not digested; samples are rarely this big.
+MAX_SIZE = 32 * 1024 * 1024
+# A piece is cut here if no boundary came up, e.g. in long runs of padding.
+MAX_PIECE = 64 * 1024
+
+_EMPTY = 0xFFFFFFFF
+_EMPTY_WORD = b"\xff" * 4
+_RUN = 3
+_SKETCH = struct.Struct(f">{SKETCH_SIZE}I")
+_COMMON = frozenset(b" \t\r\n\x00\xff0123456789etaoinsrhldcumfpgwybvkxjqzETAOINSRHLDCUMFPGWYBVKXJQZ"
+                    b"_.,;:()[]{}=\"'-/#<>")
+
+
+# About a quarter of the other byte values, picked by a fixed hash so that
+# digests stay comparable across versions and hosts.
+def _trigger_table():
+    ones = [b not in _COMMON and hashlib.sha256(b"antigus-ctph" + bytes([b])).digest()[0] < 72
+            for b in range(256)]
+    return bytes(ones)
+
+
+_TABLE = _trigger_table()
+_SEPARATOR = b"\x01" * _RUN
+
+
+# Builds the digest of one file from the blocks it is read in.
+class SimilaritySketch:
+
+    def __init__(self):
+        self.size = None
+        self.pieces = 0
+        self._mins = [_EMPTY] * SKETCH_SIZE
+        self._tail = b""
+        self._read = 0
+
+    def start(self, size):
+        self.size = size
+
+    def _piece(self, piece):
+        h = zlib.crc32(piece)
+        b = h % SKETCH_SIZE
+        if h < self._mins[b]:
+            self._mins[b] = h
+        self.pieces += 1
+
+    def update(self, block):
+        self._read += len(block)
+        if self._read > MAX_SIZE or (self.size is not None and self.size > MAX_SIZE):
+            return
+        data = self._tail + bytes(block) if self._tail else bytes(block)
+        parts = data.translate(_TABLE).split(_SEPARATOR)
+        # _piece, inlined: this loop runs once per piece.
+        mins = self._mins
+        crc32 = zlib.crc32
+        pos = 0
+        for part in parts[:-1]:
+            end = pos + len(part) + _RUN
+            h = crc32(data[pos:end])
+            b = h % SKETCH_SIZE
+            if h < mins[b]:
+                mins[b] = h
+            pos = end
+        self.pieces += len(parts) - 1
+        # The last part has no boundary yet; it continues in the next block.
+        while len(data) - pos > MAX_PIECE:
+            self._piece(data[pos:pos + MAX_PIECE])
+            pos += MAX_PIECE
+        self._tail = data[pos:]
+
+    # Example: The hex digest, or "" if the file was too small or too large.
+    def finish(self):
+        if self._tail:
+            self._piece(self._tail)
+            self._tail = b""
+        if self._read > MAX_SIZE or self.pieces < MIN_PIECES:
+            return ""
+        return _SKETCH.pack(*self._mins).hex()
+
+
+# The bins of a hex digest. They are compared, never decoded, so native
+# byte order is fine.
+def parse_digest(digest):
+    raw = bytes.fromhex(digest)
+    if len(raw) != _SKETCH.size:
+        raise ValueError(f"a digest is {_SKETCH.size * 2} hex digits")
+    return memoryview(raw).cast("I")
+
+
+# Example: similarity(a, b) -> 0..100, the estimated share of content the
+# two digests' files have in common.
+def similarity(a, b):
+    if isinstance(a, str):
+        a = parse_digest(a)
+    if isinstance(b, str):
+        b = parse_digest(b)
+    same = used = 0
+    for x, y in zip(a, b):
+        if x != _EMPTY or y != _EMPTY:
+            used += 1
+            same += x == y
+    return round(100 * same / used) if used else 0
+
+
+# [(band number, band), ...] for the bands without an empty bin.
+def _bands(values):
+    raw = values.obj
+    words = enumerate(values.cast("B").cast("Q"))
+    if _EMPTY_WORD not in raw:
+        return list(words)
+    return [(i, band) for i, band in words
+            if _EMPTY_WORD not in (raw[i * 8:i * 8 + 4], raw[i * 8 + 4:i * 8 + 8])]
+
+
+class SimilarityIndex:
+
+    # The key hash_file stores a file's digest under, next to the others.
+    key = "ctph"
+
+    def __init__(self, signatures, threshold=SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self.names = []
+        self.digests = []
+        # One dict per band number: band -> signature number, or a list of
+        # them once several share it; plain ints keep a large index cheap to
+        # build and out of the GC.
+        self.bands = [{} for _ in range(SKETCH_SIZE // 2)]
+        for name, digest in signatures:
+            values = parse_digest(digest)
+            n = len(self.names)
+            self.names.append(name)
+            self.digests.append(values)
+            for i, band in _bands(values):
+                bands = self.bands[i]
+                found = bands.get(band)
+                if found is None:
+                    bands[band] = n
+                elif isinstance(found, int):
+                    bands[band] = [found, n]
+                else:
+                    found.append(n)
+        self.lookups = 0
+        self.candidates = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def session(self):
+        return SimilaritySketch()
+
+    # Example: ("Emotet-A", 87) for the closest signature scoring at least
+    # the threshold, or None.
+    def match(self, digest):
+        if not digest:
+            return None
+        values = parse_digest(digest)
+        candidates = set()
+        for i, band in _bands(values):
+            found = self.bands[i].get(band)
+            if isinstance(found, int):
+                candidates.add(found)
+            elif found:
+                candidates.update(found)
+        self.lookups += 1
+        self.candidates += len(candidates)
+        best = None
+        for n in candidates:
+            score = similarity(values, self.digests[n])
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (self.names[n], score)
+        return best
+
+    def stats(self):
+        return {"signatures": len(self.names), "lookups": self.lookups,
+                "candidates_per_lookup": round(self.candidates / self.lookups, 2) if self.lookups else 0.0}
+
+
+# Example: The verdict string a similarity match is reported as, e.g.
+# "similar:Emotet-A:87", and back.
+def format_match(name, score):
+    return f"similar:{name}:{score}"
+
+
+def parse_match(matched):
+    if not isinstance(matched, str) or not matched.startswith("similar:"):
+        return None
+    name, _, score = matched[len("similar:"):].rpartition(":")
+    return {"signature": name, "score": int(score)} if score.isdigit() else None
+
+
+# Example: " (variant of Emotet-A, similarity 87)" for a similarity match,
+# "" for any other verdict; for threat messages.
+def describe_match(matched):
+    match = parse_match(matched)
+    return f" (variant of {match['signature']}, similarity {match['score']})" if match else ""
+
+
+# Example: Hash a file and compute its similarity digest in the same read.
+# Returns (digests, digest), or (None, None) if the file can't be read.
+def digest_file(path, algorithms=DEFAULT_ALGORITHMS):
+    sketch = SimilaritySketch()
+    digests = file_digests(path, algorithms, sinks=(sketch,))
+    if digests is None:
+        return None, None
+    return digests, sketch.finish()
+
+
+def parse_similarity_signature(line):
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    name, sep, digest = line.rpartition(":")
+    if not sep or not name:
+        raise ValueError("expected Name:digest")
+    parse_digest(digest)
+    return name, digest
+
+
+# Example: Load a SimilarityIndex from a signatures file; None if the file
+# is missing or defines no signatures. Bad lines are reported and skipped.
+def load_similarity_signatures(path=SIMILARITY_SIGNATURES_FILE, threshold=SIMILARITY_THRESHOLD):
+    if not os.path.exists(path):
+        return None
+    signatures = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            try:
+                sig = parse_similarity_signature(line)
+            except ValueError as e:
+                print(f"{path}:{number}: skipped similarity signature: {e}")
+                continue
+            if sig:
+                signatures.append(sig)
+    return SimilarityIndex(signatures, threshold) if signatures else None
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        _, digest = digest_file(path, ("sha256",))
+        if digest:
+            print(f"{os.path.basename(path)}:{digest}")
+        else:
+            print(f"{path}: too small, too large or unreadable", file=sys.stderr)
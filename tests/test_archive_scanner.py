@@ -0,0 +1,137 @@
+# ArchiveScanner on archives built in the test's temporary directory.
+import gzip
+import hashlib
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from archive_scanner import ArchiveScanner
+from content_signatures import ContentMatcher, parse_content_signature
+
+EVIL = b"not really malware, just a test sample\n" * 8
+BAD = {hashlib.sha256(EVIL).hexdigest()}
+
+
+def _zip(path, members):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+    return str(path)
+
+
+def _tar(path, members, mode="w:gz"):
+    with tarfile.open(path, mode) as t:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            t.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+def test_members_by_digest(tmp_path):
+    scanner = ArchiveScanner(BAD)
+    assert scanner.scan(_zip(tmp_path / "a.zip", {"ok.txt": b"fine", "dir/evil.exe": EVIL})) == [
+        [f"{tmp_path}/a.zip!/dir/evil.exe", BAD.copy().pop()]]
+    assert scanner.scan(_zip(tmp_path / "b.zip", {"ok.txt": b"fine"})) == []
+    (tmp_path / "plain.txt").write_bytes(EVIL)
+    assert scanner.scan(str(tmp_path / "plain.txt")) is None
+
+
+# Members have no file on disk to take their size from; EOF-anchored
+# signatures get it from the archive's own header.
+@pytest.mark.parametrize("build", ["zip", "tar.gz", "tar"])
+def test_eof_anchored_content_in_members(tmp_path, build):
+    matcher = ContentMatcher([parse_content_signature("Tail:*:EOF-3:58595a")])
+    members = {"hit.bin": b"hello XYZ", "miss.bin": b"XYZ hello"}
+    if build == "zip":
+        path = _zip(tmp_path / "a.zip", members)
+    else:
+        path = _tar(tmp_path / f"a.{build}", members, "w:gz" if build == "tar.gz" else "w")
+    assert ArchiveScanner(set(), matcher).scan(path) == [[f"{path}!/hit.bin", "content:Tail"]]
+
+
+
+class _Boom:
+
+    def start(self, size):
+        pass
+
+    def update(self, block):
+        if b"boom" in bytes(block):
+            raise TypeError("bad member")
+
+    def finish(self):
+        return None
+
+
+class _BoomIndex:
+
+    def session(self):
+        return _Boom()
+
+
+# One member that fails to scan is skipped; the others keep their verdicts.
+@pytest.mark.parametrize("build", ["zip", "tar.gz"])
+def test_failing_member_keeps_the_others(tmp_path, build):
+    members = {"a.bin": b"boom", "b.exe": EVIL}
+    if build == "zip":
+        path = _zip(tmp_path / "a.zip", members)
+    else:
+        path = _tar(tmp_path / "a.tar.gz", members)
+    found = ArchiveScanner(BAD, similarity=_BoomIndex()).scan(path)
+    assert found == [[f"{path}!/b.exe", BAD.copy().pop()]]
+
+
+def test_eof_anchored_content_in_gzip_stream(tmp_path):
+    # A bare .gz does not record a usable size, so the EOF anchor is skipped
+    # while the rest of the member is still judged.
+    matcher = ContentMatcher([parse_content_signature("Tail:*:EOF-3:58595a")])
+    path = tmp_path / "evil.bin.gz"
+    path.write_bytes(gzip.compress(EVIL + b"XYZ"))
+    assert ArchiveScanner(set(), matcher).scan(str(path)) == []
+    path.write_bytes(gzip.compress(EVIL))
+    assert ArchiveScanner(BAD, matcher).scan(str(path)) == [[f"{path}!/evil.bin", BAD.copy().pop()]]
+
+
+def _nest(depth):
+    data = EVIL
+    for level in range(depth):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w") as z:
+            z.writestr(f"level{level}.zip" if level else "evil.exe", data)
+        data = buf.getvalue()
+    return data
+
+
+def test_depth_limit(tmp_path):
+    path = tmp_path / "nested.zip"
+    path.write_bytes(_nest(3))
+    name = f"{path}!/level2.zip!/level1.zip!/evil.exe"
+    assert ArchiveScanner(BAD, max_depth=3).scan(str(path)) == [[name, BAD.copy().pop()]]
+    # One level short: the innermost zip is only hashed as a whole.
+    assert ArchiveScanner(BAD, max_depth=2).scan(str(path)) == []
+
+
+def test_byte_limit(tmp_path):
+    path = _zip(tmp_path / "big.zip", {"a.bin": b"\0" * 5000, "evil.exe": EVIL})
+    scanner = ArchiveScanner(BAD, max_bytes=4000)
+    assert scanner.scan(path) == []
+    assert scanner.stats()["limits_hit"] == 1
+    reported = ArchiveScanner(BAD, max_bytes=4000, limits_are_threats=True).scan(path)
+    assert reported[0][0] == f"{path}!/" and reported[0][1].startswith("heuristic:archive-limit:")
+
+
+def test_ratio_limit(tmp_path):
+    bomb = tmp_path / "bomb.gz"
+    bomb.write_bytes(gzip.compress(b"\0" * (4 * 1024 * 1024)))
+    scanner = ArchiveScanner(BAD, limits_are_threats=True)
+    assert scanner.scan(str(bomb))[0][1] == "heuristic:archive-limit:compression ratio over 100"
+
+
+def test_member_limit(tmp_path):
+    path = _zip(tmp_path / "many.zip", {f"m{i}": b"x" for i in range(5)})
+    scanner = ArchiveScanner(BAD, max_members=3)
+    assert scanner.scan(path) == []
+    assert scanner.stats() == {"archives": 1, "members": 4, "bytes_unpacked": 3, "limits_hit": 1}
@@ -0,0 +1,79 @@
+# ContentMatcher, fed the way scanner_utils.file_digests feeds it.
+import pytest
+
+import content_signatures
+from content_signatures import ContentMatcher, parse_content_signature
+
+SIGNATURES = [
+    "Anywhere:*:*:6d616c776172652d6d61726b6572",          # "malware-marker"
+    "Wild:*:*:deadbeefcafe??00{2-4}77",
+    "Head:elf:0:7f454c46",
+    "Tail:*:EOF-3:58595a",                                # "XYZ" as the last 3 bytes
+]
+
+
+def _matcher(lines=SIGNATURES):
+    return ContentMatcher([parse_content_signature(line) for line in lines])
+
+
+# Feed data in blocks of block_size, as the hashing read does.
+def _scan(matcher, data, block_size, size=True):
+    scan = matcher.session()
+    scan.start(len(data) if size else None)
+    for i in range(0, len(data), block_size):
+        scan.update(memoryview(data)[i:i + block_size])
+    return sorted(scan.finish())
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 7, 64, 4096])
+def test_matches_across_block_boundaries(block_size):
+    data = (b"\x7fELF" + b"." * 100 + b"malware-marker" + b"." * 50
+            + bytes.fromhex("deadbeefcafe1100aabbcc77") + b"." * 30 + b"XYZ")
+    assert _scan(_matcher(), data, block_size) == [
+        ("Anywhere", 104), ("Head", 0), ("Tail", len(data) - 3), ("Wild", 168)]
+
+
+@pytest.mark.parametrize("block_size", [1, 5, 4096])
+def test_eof_anchor_only_at_the_end(block_size):
+    assert _scan(_matcher(), b"XYZ" + b"." * 40, block_size) == []
+    assert _scan(_matcher(), b"." * 40 + b"XYZ", block_size) == [("Tail", 40)]
+
+
+# Without a size (a compressed stream) EOF anchors are skipped, the rest
+# still match.
+def test_unknown_size_skips_eof_anchors():
+    data = b"malware-marker" + b"." * 10 + b"XYZ"
+    assert _scan(_matcher(), data, 8, size=False) == [("Anywhere", 0)]
+
+
+def test_filetype_and_offset():
+    assert _scan(_matcher(), b"MZ\x7fELF", 4096) == []
+    shifted = _matcher(["Shift:*:4,2:414243"])
+    assert _scan(shifted, b"....ABC", 2) == [("Shift", 4)]
+    assert _scan(shifted, b"..ABC", 2) == []
+
+
+# Past FIND_LIMIT signatures, anchors go through the word set instead of
+# bytes.find; both paths must give the same matches.
+def test_word_set_matches_like_find(monkeypatch):
+    data = b"." * 5000 + b"malware-marker" + b"." * 3 + bytes.fromhex("deadbeefcafe1100aabb77")
+    expected = _scan(_matcher(), data, 1024)
+    monkeypatch.setattr(content_signatures, "FIND_LIMIT", 0)
+    assert _matcher().words
+    assert _scan(_matcher(), data, 1024) == expected
+
+
+def test_bad_definitions():
+    with pytest.raises(ValueError):
+        parse_content_signature("Short:*:*:4142")
+    with pytest.raises(ValueError):
+        parse_content_signature("Type:exe:*:41424344")
+    assert parse_content_signature("# comment") is None
+
+
+def test_scan_file(tmp_path):
+    path = tmp_path / "sample"
+    path.write_bytes(b"#!/bin/sh\n" + b"malware-marker" + b"\nXYZ")
+    digests, matches = _matcher().scan_file(str(path))
+    assert "sha256" in digests
+    assert sorted(matches) == [("Anywhere", 10), ("Tail", 25)]
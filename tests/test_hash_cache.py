@@ -0,0 +1,57 @@
+# HashCache keyed on inode metadata.
+import os
+
+from hash_cache import HashCache
+
+DIGESTS = {"sha256": "a" * 64, "md5": "b" * 32}
+
+
+def test_hit_needs_every_algorithm(tmp_path):
+    path = tmp_path / "f"
+    path.write_bytes(b"data")
+    cache = HashCache(str(tmp_path / "cache.db"))
+    st = os.stat(path)
+    assert cache.get(st, ("sha256",)) is None
+    cache.put(st, DIGESTS)
+    assert cache.get(st, ("sha256",)) == {"sha256": "a" * 64}
+    assert cache.get(st, ("sha256", "md5")) == DIGESTS
+    assert cache.get(st, ("sha256", "sha1")) is None
+    assert (cache.hits, cache.misses) == (2, 2)
+    cache.close()
+
+
+def test_changed_file_invalidates(tmp_path):
+    path = tmp_path / "f"
+    path.write_bytes(b"data")
+    cache = HashCache(str(tmp_path / "cache.db"))
+    cache.put(os.stat(path), DIGESTS)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    assert cache.get(os.stat(path), ("sha256",)) is None
+    path.write_bytes(b"other")
+    assert cache.get(os.stat(path), ("sha256",)) is None
+    cache.close()
+
+
+def test_persists_across_opens(tmp_path):
+    path = tmp_path / "f"
+    path.write_bytes(b"data")
+    cache = HashCache(str(tmp_path / "cache.db"))
+    cache.put(os.stat(path), DIGESTS)
+    cache.close()
+    cache = HashCache(str(tmp_path / "cache.db"))
+    assert cache.get(os.stat(path), ("md5",)) == {"md5": "b" * 32}
+    assert cache.stats()["entries"] == 1
+    cache.close()
+
+
+def test_eviction(tmp_path, monkeypatch):
+    import hash_cache
+    monkeypatch.setattr(hash_cache, "COMMIT_EVERY", 1)
+    cache = HashCache(str(tmp_path / "cache.db"), max_entries=10)
+    for i in range(12):
+        path = tmp_path / f"f{i}"
+        path.write_bytes(b"x" * i)
+        cache.put(os.stat(path), DIGESTS)
+    assert cache.stats()["entries"] <= 10
+    cache.close()
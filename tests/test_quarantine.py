@@ -0,0 +1,110 @@
+# QuarantineVault: add, restore and the catalog.
+import os
+import sqlite3
+
+import pytest
+
+import quarantine
+from quarantine import QuarantineVault
+
+
+@pytest.fixture
+def vault(tmp_path):
+    vault = QuarantineVault(str(tmp_path / "vault"))
+    yield vault
+    vault.close()
+
+
+def test_add_and_restore(tmp_path, vault):
+    path = tmp_path / "evil.bin"
+    path.write_bytes(b"payload")
+    os.chmod(path, 0o750)
+    item_id = vault.add(str(path), "sig")
+    assert not path.exists()
+    item = vault.get(item_id)
+    assert (item["path"], item["size"], item["mode"], item["signature"]) == (str(path), 7, 0o750, "sig")
+    assert vault.restore(item_id) == str(path)
+    assert path.read_bytes() == b"payload"
+    assert os.stat(path).st_mode & 0o7777 == 0o750
+    assert len(vault) == 0
+
+
+def test_restore_refuses_to_overwrite(tmp_path, vault):
+    path = tmp_path / "evil.bin"
+    path.write_bytes(b"payload")
+    item_id = vault.add(str(path))
+    path.write_bytes(b"new file")
+    with pytest.raises(FileExistsError):
+        vault.restore(item_id)
+    assert path.read_bytes() == b"new file"
+    assert vault.get(item_id) is not None
+    assert not os.path.exists(f"{path}.antigus-restore")
+    vault.restore(item_id, overwrite=True)
+    assert path.read_bytes() == b"payload"
+
+
+def test_symlink_left_in_place(tmp_path, vault):
+    target = tmp_path / "target"
+    target.write_bytes(b"data")
+    link = tmp_path / "link"
+    link.symlink_to(target)
+    with pytest.raises(OSError):
+        vault.add(str(link))
+    assert link.is_symlink() and target.read_bytes() == b"data"
+    assert os.listdir(vault.staging) == [] and len(vault) == 0
+
+
+def test_catalog_error_rolls_back(tmp_path, vault, monkeypatch):
+    path = tmp_path / "evil.bin"
+    path.write_bytes(b"payload")
+
+    class Broken:
+        def execute(self, *args):
+            raise sqlite3.OperationalError("database is locked")
+
+        def rollback(self):
+            pass
+
+    db = vault._db
+    monkeypatch.setattr(vault, "_db", Broken())
+    with pytest.raises(sqlite3.OperationalError):
+        vault.add(str(path))
+    monkeypatch.setattr(vault, "_db", db)
+    assert path.read_bytes() == b"payload"
+    assert os.listdir(vault.staging) == []
+    assert not any(files for _, _, files in os.walk(vault.objects))
+
+
+def test_duplicate_content_stored_once(tmp_path, vault):
+    for name in ("a", "b"):
+        (tmp_path / name).write_bytes(b"same")
+        vault.add(str(tmp_path / name))
+    assert vault.stats() == {"items": 2, "objects": 1, "bytes": 8}
+    first = vault.find(str(tmp_path / "a"))[0]
+    vault.delete(first["id"])
+    assert os.path.exists(vault.object_path(first["digest"]))
+
+
+def test_legacy_import_runs_once(tmp_path, monkeypatch):
+    directory = tmp_path / "vault"
+    directory.mkdir()
+    (directory / "old.bin").write_bytes(b"legacy")
+    vault = QuarantineVault(str(directory))
+    assert len(vault) == 1 and not (directory / "old.bin").exists()
+    vault.close()
+    calls = []
+    monkeypatch.setattr(QuarantineVault, "_import_legacy", lambda self: calls.append(self))
+    QuarantineVault(str(directory)).close()
+    assert calls == []
+
+
+def test_restore_file_reports_failure(tmp_path, monkeypatch):
+    monkeypatch.setattr(quarantine, "QUARANTINE_DIR", str(tmp_path / "vault"))
+    monkeypatch.setattr(quarantine, "_vault", None)
+    path = tmp_path / "evil.bin"
+    path.write_bytes(b"payload")
+    item_id = quarantine.quarantine_file(str(path))
+    path.write_bytes(b"new file")
+    assert quarantine.restore_file(item_id) is None
+    assert quarantine.restore_file(item_id, overwrite=True) == str(path)
+    quarantine.get_vault().close()
@@ -0,0 +1,121 @@
+# RealtimeMonitor's event table, fed events by hand, and the rescan that
+# follows lost events.
+import sys
+import time
+
+import pytest
+
+import arfetanti
+import quarantine
+import realtime_monitor
+from content_signatures import ContentMatcher, parse_content_signature
+from realtime_monitor import RealtimeMonitor
+
+
+def _monitor(tmp_path, **kwargs):
+    return RealtimeMonitor([str(tmp_path)], lambda path: None, use_fanotify=False, **kwargs)
+
+
+def _queued(monitor):
+    items = []
+    while not monitor._work.empty():
+        items.append(monitor._work.get_nowait()[0])
+    return items
+
+
+def test_debounce_and_coalesce(tmp_path):
+    monitor = _monitor(tmp_path, debounce=0.05)
+    monitor._on_event("modified", "/a")
+    monitor._on_event("closed", "/a")
+    monitor._on_event("closed", "/b")
+    monitor._dispatch()
+    assert _queued(monitor) == []
+    time.sleep(0.06)
+    monitor._on_event("closed", "/c")
+    monitor._dispatch()
+    assert _queued(monitor) == ["/a", "/b"]
+    assert monitor.coalesced == 1
+    assert monitor.stats()["pending"] == 1
+
+
+def test_open_files_wait_for_close(tmp_path, monkeypatch):
+    monitor = _monitor(tmp_path, debounce=0)
+    monitor._on_event("modified", "/open")
+    monitor._on_event("closed", "/done")
+    monitor._dispatch()
+    assert _queued(monitor) == ["/done"]
+    assert monitor.stats()["pending"] == 1
+    monitor._on_event("closed", "/open")
+    monitor._dispatch()
+    assert _queued(monitor) == ["/open"]
+    monitor._on_event("modified", "/stale")
+    monitor._dispatch()
+    monkeypatch.setattr(realtime_monitor, "STALE_AFTER", 0)
+    monitor._dispatch()
+    assert monitor.stats()["pending"] == 0
+
+
+def test_full_queue_keeps_order(tmp_path):
+    monitor = _monitor(tmp_path, debounce=0, queue_depth=2)
+    for name in "abcd":
+        monitor._on_event("closed", f"/{name}")
+    assert monitor._dispatch()
+    assert _queued(monitor) == ["/a", "/b"]
+    assert not monitor._dispatch()
+    assert _queued(monitor) == ["/c", "/d"]
+
+
+def test_table_full_remembers_directory(tmp_path):
+    monitor = _monitor(tmp_path, max_pending=2)
+    for path in ("/x/1", "/x/2", "/y/3"):
+        monitor._on_event("closed", path)
+    assert monitor.dropped == 1
+    assert monitor.take_overflow_dirs() == {"/y"}
+
+
+# A tick with a large backlog that is not yet due touches only its front.
+def test_dispatch_cost_does_not_grow_with_backlog(tmp_path):
+    monitor = _monitor(tmp_path, debounce=60)
+    for i in range(100000):
+        monitor._on_event("closed", f"/f{i}")
+    started = time.perf_counter()
+    for _ in range(1000):
+        monitor._dispatch()
+    assert time.perf_counter() - started < 0.5
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+def test_inotify_end_to_end(tmp_path):
+    seen = []
+    monitor = RealtimeMonitor([str(tmp_path)], seen.append, debounce=0.05, use_fanotify=False)
+    monitor.start()
+    try:
+        (tmp_path / "sub").mkdir()
+        time.sleep(0.1)
+        (tmp_path / "sub" / "new.bin").write_bytes(b"data")
+        deadline = time.monotonic() + 3
+        while not seen and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        monitor.stop()
+    assert seen == [str(tmp_path / "sub" / "new.bin")]
+
+
+# Lost events are made up for with the scan's full set of checks; a
+# content-only match is found and quarantined.
+def test_rescan_uses_scan_checks(tmp_path, monkeypatch):
+    tree = tmp_path / "tree"
+    tree.mkdir()
+    (tree / "dropper.sh").write_bytes(b"#!/bin/sh\necho malware-marker\n")
+    (tree / "clean.txt").write_text("hello\n")
+    monkeypatch.setattr(quarantine, "QUARANTINE_DIR", str(tmp_path / "vault"))
+    monkeypatch.setattr(quarantine, "_vault", None)
+    monkeypatch.setattr(arfetanti, "SCAN_CACHE_FILE", None)
+    monkeypatch.setattr(arfetanti, "BAD_HASHES", set())
+    monkeypatch.setattr(arfetanti, "CONTENT_SIGNATURES", ContentMatcher(
+        [parse_content_signature("Marker:*:*:6d616c776172652d6d61726b6572")]))
+    threats = arfetanti.rescan_tree(str(tree), arfetanti.scan_exclusions())
+    assert threats == [str(tree / "dropper.sh")]
+    assert not (tree / "dropper.sh").exists()
+    assert quarantine.get_vault().find(str(tree / "dropper.sh"))[0]["signature"] == "content:Marker"
+    quarantine.get_vault().close()
@@ -0,0 +1,102 @@
+# ScanExclusions on their own and through scan_tree, from relative and
+# absolute roots.
+import gzip
+import hashlib
+import os
+
+import pytest
+
+import quarantine
+from archive_scanner import ArchiveScanner
+from scan_exclusions import ScanExclusions
+from scan_pipeline import scan_tree
+
+EVIL = b"not really malware, just a test sample\n" * 8
+BAD = {hashlib.sha256(EVIL).hexdigest()}
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    root = tmp_path / "tree"
+    (root / "docs").mkdir(parents=True)
+    (root / "cache").mkdir()
+    (root / "docs" / "readme.txt").write_text("hello\n")
+    (root / "cache" / "evil.iso").write_bytes(EVIL)
+    (root / "evil.bin").write_bytes(EVIL)
+    (root / "evil.gz").write_bytes(gzip.compress(EVIL))
+    monkeypatch.chdir(tmp_path)
+    return root
+
+
+@pytest.fixture
+def vault(tree, monkeypatch):
+    # The vault lives inside the tree being scanned, as ~ does for a scan of ~.
+    monkeypatch.setattr(quarantine, "QUARANTINE_DIR", str(tree / "vault"))
+    yield quarantine.get_vault()
+    quarantine.get_vault().close()
+    monkeypatch.setattr(quarantine, "_vault", None)
+
+
+def _exclusions(*patterns):
+    return ScanExclusions(patterns, mountinfo=os.devnull)
+
+
+@pytest.mark.parametrize("relative", [True, False])
+def test_patterns(tree, relative):
+    root = "tree" if relative else str(tree)
+    threats = scan_tree(root, BAD, workers=0, quarantine=False, exclusions=_exclusions("*.iso", "docs/"))
+    assert sorted(threats) == [str(tree / "evil.bin")]
+
+
+@pytest.mark.parametrize("relative", [True, False])
+def test_anchored_pattern(tree, relative):
+    root = "tree" if relative else str(tree)
+    threats = scan_tree(root, BAD, workers=0, quarantine=False,
+                        exclusions=_exclusions(str(tree / "cache") + "/"))
+    assert threats == [str(tree / "evil.bin")]
+
+
+def test_negation_last_match_wins(tree):
+    threats = scan_tree(str(tree), BAD, workers=0, quarantine=False,
+                        exclusions=_exclusions("evil.*", "!*.iso"))
+    assert threats == [str(tree / "cache" / "evil.iso")]
+
+
+def test_excludes_path_parent(tree):
+    exclusions = _exclusions(str(tree / "cache") + "/")
+    assert exclusions.excludes_path("tree/cache/evil.iso")
+    assert exclusions.excludes_path(str(tree / "cache"), is_dir=True)
+    assert not exclusions.excludes_path("tree/evil.bin")
+
+
+def test_mount_points_skipped(tree, tmp_path):
+    inner = tree / "docs"
+    mountinfo = tmp_path / "mountinfo"
+    mountinfo.write_text(f"36 25 0:5 / {inner} rw - proc proc rw\n")
+    exclusions = ScanExclusions(mountinfo=str(mountinfo))
+    exclusions.start("tree")
+    assert exclusions.skip_mounts == {str(inner)}
+
+
+def test_hard_links_scanned_once(tree):
+    os.link(tree / "evil.bin", tree / "docs" / "again.bin")
+    threats = scan_tree("tree", BAD, workers=0, quarantine=False, exclusions=_exclusions())
+    assert str(tree / "docs" / "again.bin") not in threats
+
+
+# A relative scan must not find the vault's own objects (gzip streams of
+# the quarantined files) and move them into the vault a second time.
+def test_relative_scan_skips_vault(tree, vault):
+    patterns = [os.path.abspath(quarantine.QUARANTINE_DIR) + "/"]
+    archives = ArchiveScanner(BAD)
+    scan_tree("tree", BAD, workers=0, exclusions=_exclusions(*patterns), archives=archives)
+    assert len(vault) == 3
+    before = {item["digest"] for item in vault.list()}
+    os.chdir("tree")
+    threats = scan_tree(".", BAD, workers=2, exclusions=_exclusions(*patterns), archives=archives)
+    assert threats == []
+    assert len(vault) == 3
+    item = vault.find(str(tree / "evil.bin"))[0]
+    assert item["digest"] in before
+    assert vault.restore(item["id"]) == str(tree / "evil.bin")
+    assert (tree / "evil.bin").read_bytes() == EVIL
@@ -0,0 +1,70 @@
+# Manifests written by scan_tree and rematched against new definitions.
+import hashlib
+import os
+
+import pytest
+
+from scan_manifest import Manifest, ManifestWriter, find_manifests, rematch
+from scan_pipeline import scan_tree
+from signature_store import compile_definitions
+
+FILES = {"a.txt": b"alpha", "sub/b.bin": b"bravo", "sub/deeper/c.bin": b"charlie"}
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    root = tmp_path / "tree"
+    for name, data in FILES.items():
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_bytes(data)
+    writer = ManifestWriter(str(tmp_path / "manifests" / "host-1.agm"), str(root), host="host-1")
+    # Nothing is known to be bad when the scan runs.
+    assert scan_tree(str(root), set(), workers=2, quarantine=False, manifest=writer) == []
+    assert len(writer) == len(FILES)
+    return writer.close(), root
+
+
+def test_rows(manifest):
+    path, root = manifest
+    m = Manifest(path)
+    rows = {m.row(i)["path"]: m.row(i) for i in range(len(m))}
+    assert m.host == "host-1" and m.root == str(root)
+    for name, data in FILES.items():
+        row = rows[str(root / name)]
+        assert row["size"] == len(data)
+        assert row["mtime"] == pytest.approx(os.stat(root / name).st_mtime, abs=1e-6)
+        assert row["sha256"] == hashlib.sha256(data).hexdigest()
+        assert row["md5"] == hashlib.md5(data).hexdigest()
+    m.close()
+
+
+@pytest.mark.parametrize("algorithm", ["sha256", "sha1", "md5"])
+def test_rematch_lines(manifest, algorithm):
+    path, root = manifest
+    # A file matched by several digests is reported once.
+    lines = [hashlib.new(algorithm, b"bravo").hexdigest(), hashlib.sha256(b"bravo").hexdigest()]
+    hits = rematch([path], lines)
+    assert [(h["path"], h["host"], h["manifest"]) for h in hits] == [(str(root / "sub/b.bin"), "host-1", path)]
+
+
+def test_rematch_store(manifest, tmp_path):
+    path, root = manifest
+    store = compile_definitions([hashlib.md5(b"charlie").hexdigest(), hashlib.sha1(b"alpha").hexdigest()],
+                                str(tmp_path / "sigs.bin"))
+    hits = rematch(find_manifests([str(tmp_path / "manifests")]), store)
+    assert sorted(h["path"] for h in hits) == [str(root / "a.txt"), str(root / "sub/deeper/c.bin")]
+    store.close()
+
+
+def test_rematch_skips_bad_manifest(manifest, tmp_path):
+    bad = tmp_path / "bad.agm"
+    bad.write_bytes(b"x" * 64)
+    path, _ = manifest
+    assert len(rematch([str(bad), path], [hashlib.sha256(b"alpha").hexdigest()])) == 1
+
+
+def test_discard_writes_nothing(tmp_path):
+    writer = ManifestWriter(str(tmp_path / "m.agm"), str(tmp_path))
+    writer.add(str(tmp_path / "x"), None, {"sha256": "0" * 64})
+    writer.discard()
+    assert not os.path.exists(tmp_path / "m.agm")
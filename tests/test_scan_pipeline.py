@@ -0,0 +1,162 @@
+# scan_tree: the parallel pipeline against the serial path, the hash cache
+# and checkpoint resume.
+import gzip
+import hashlib
+import io
+import random
+import threading
+import zipfile
+
+import pytest
+
+from archive_scanner import ArchiveScanner
+from content_signatures import ContentMatcher, parse_content_signature
+from hash_cache import HashCache
+from prefilter import build_prefilter
+from scan_checkpoint import ScanCheckpointer
+from scan_pipeline import ScanProgress, scan_tree
+from signature_store import compile_definitions
+from similarity_hash import SimilarityIndex, digest_file
+
+EVIL = b"not really malware, just a test sample\n" * 8
+EVIL_SHA256 = hashlib.sha256(EVIL).hexdigest()
+EVIL_MD5 = hashlib.md5(b"another sample\n").hexdigest()
+
+
+def _sample(seed, size=40000):
+    rng = random.Random(seed)
+    return bytes(rng.getrandbits(8) for _ in range(size))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "tree"
+    rng = random.Random(1)
+    for d in range(6):
+        directory = root / f"d{d}" / "sub"
+        directory.mkdir(parents=True)
+        for f in range(5):
+            (directory.parent / f"f{f}.txt").write_bytes(bytes(rng.getrandbits(8) for _ in range(rng.randint(0, 3000))))
+        (directory / "leaf.txt").write_text(f"leaf {d}\n")
+    (root / "d0" / "evil.bin").write_bytes(EVIL)
+    (root / "d1" / "sub" / "evil.md5").write_bytes(b"another sample\n")
+    (root / "d2" / "script.sh").write_bytes(b"#!/bin/sh\necho malware-marker\n")
+    (root / "d3" / "sub" / "tail.bin").write_bytes(b"padding" * 10 + b"XYZ")
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr("ok.txt", b"fine")
+        z.writestr("inner/evil.exe", EVIL)
+    (root / "d4" / "bundle.zip").write_bytes(buf.getvalue())
+    (root / "d4" / "sub" / "payload.gz").write_bytes(gzip.compress(b"xx malware-marker xx"))
+    sample = _sample(7)
+    variant = bytearray(sample)
+    variant[20000:20004] = b"\x00\x01\x02\x03"
+    (root / "d5" / "variant.exe").write_bytes(bytes(variant))
+    (tmp_path / "sample.exe").write_bytes(sample)
+    return root
+
+
+@pytest.fixture
+def engines(tmp_path, tree):
+    store = compile_definitions([f"{EVIL_SHA256}:{len(EVIL)}", f"{EVIL_MD5}:15"], str(tmp_path / "sigs.bin"))
+    content = ContentMatcher([parse_content_signature(line) for line in
+                              ("Marker:*:*:6d616c776172652d6d61726b6572", "Tail:*:EOF-3:58595a")])
+    _, digest = digest_file(str(tmp_path / "sample.exe"))
+    similarity = SimilarityIndex([("Sample-A", digest)])
+    yield store, content, similarity
+    store.close()
+
+
+def _scan(tree, engines, workers, **kwargs):
+    store, content, similarity = engines
+    results = {}
+    def on_result(fpath, matched):
+        results[fpath] = matched
+    threats = scan_tree(str(tree), store, workers=workers, quarantine=False, on_result=on_result,
+                        prefilter=build_prefilter(store), content=content,
+                        archives=ArchiveScanner(store, content, similarity=similarity),
+                        similarity=similarity, **kwargs)
+    return threats, results
+
+
+# The request this pipeline came from: any number of workers gives the
+# serial path's results, threats in the same walk order.
+@pytest.mark.parametrize("workers,queue_depth", [(1, 256), (4, 256), (4, 1)])
+def test_parallel_matches_serial(tree, engines, workers, queue_depth):
+    serial = _scan(tree, engines, 0)
+    assert sorted(serial[0]) == [
+        str(tree / "d0" / "evil.bin"),
+        str(tree / "d1" / "sub" / "evil.md5"),
+        str(tree / "d2" / "script.sh"),
+        str(tree / "d3" / "sub" / "tail.bin"),
+        str(tree / "d4" / "bundle.zip!/inner/evil.exe"),
+        str(tree / "d4" / "sub" / "payload.gz!/payload"),
+        str(tree / "d5" / "variant.exe"),
+    ]
+    assert serial[1][str(tree / "d5" / "variant.exe")].startswith("similar:Sample-A:")
+    assert _scan(tree, engines, workers, queue_depth=queue_depth) == serial
+
+
+def test_processes_match_serial(tree):
+    bad = {EVIL_SHA256}
+    serial = scan_tree(str(tree), bad, workers=0, quarantine=False)
+    assert scan_tree(str(tree), bad, workers=2, use_processes=True, quarantine=False) == serial
+    assert serial == [str(tree / "d0" / "evil.bin")]
+
+
+def test_progress(tree, engines):
+    progress = ScanProgress()
+    _, results = _scan(tree, engines, 2, progress=progress)
+    assert progress.walk_finished
+    # Archive members are reported too, but only files are counted.
+    files = [path for path in results if "!/" not in path]
+    assert progress.done == progress.discovered == len(files)
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_hash_cache_hit_and_invalidate(tmp_path, tree, engines, workers):
+    cache = HashCache(str(tmp_path / "cache.db"))
+    first = _scan(tree, engines, workers, cache=cache)
+    files = len([p for p in first[1] if "!/" not in p])
+    assert (cache.hits, cache.misses) == (0, files)
+    assert _scan(tree, engines, workers, cache=cache) == first
+    assert cache.hits == files
+    # A rewritten file has a new mtime and size and is hashed again.
+    target = tree / "d0" / "evil.bin"
+    target.write_bytes(b"clean now")
+    hits, misses = cache.hits, cache.misses
+    threats, _ = _scan(tree, engines, workers, cache=cache)
+    assert str(target) not in threats
+    assert (cache.hits - hits, cache.misses - misses) == (files - 1, 1)
+    cache.close()
+
+
+def test_checkpoint_resume(tmp_path, tree, engines):
+    expected, results = _scan(tree, engines, 0)
+    total = len([p for p in results if "!/" not in p])
+    stop = threading.Event()
+    seen = []
+    def on_result(fpath, matched):
+        if "!/" not in fpath:
+            seen.append(fpath)
+        if len(seen) == 12:
+            stop.set()
+    store, content, similarity = engines
+    state = str(tmp_path / "checkpoint.json")
+    checkpoint = ScanCheckpointer(str(tree), path=state, interval=0)
+    scan_tree(str(tree), store, workers=2, queue_depth=4, quarantine=False, on_result=on_result,
+              stop_event=stop, checkpoint=checkpoint, content=content,
+              archives=ArchiveScanner(store, content, similarity=similarity), similarity=similarity)
+    assert checkpoint.saved
+
+    resumed = ScanCheckpointer(str(tree), path=state, interval=0, resume=True)
+    assert 0 < resumed.files_done() < total
+    progress = ScanProgress()
+    threats, rest = _scan(tree, engines, 2, checkpoint=resumed, progress=progress)
+    # Threats found before the interruption are carried over; files after
+    # the last checkpoint are judged again, and each file counted once.
+    assert sorted(threats) == sorted(expected)
+    assert progress.done == total
+    assert set(seen) | set(rest) >= set(results)
+    # A completed scan removes its checkpoint.
+    assert ScanCheckpointer(str(tree), path=state, resume=True).state is None
@@ -0,0 +1,59 @@
+# ScanScheduler decisions, fed made-up host samples.
+import threading
+import time
+
+from scan_scheduler import ScanScheduler
+
+
+def _sample(scan_cpu, other_cpu=10.0):
+    return {"scan_cpu": scan_cpu, "other_cpu": other_cpu, "disk_busy": 0.0, "memory": 50.0}
+
+
+def test_budget_shrinks_then_throttles():
+    scheduler = ScanScheduler(2, cpu_budget=50, adaptive=False)
+    assert scheduler._decide(_sample(120)) == ("shrink", 1)
+    scheduler.target = 1
+    # One worker is the floor, so the budget is kept by resting instead.
+    assert scheduler._decide(_sample(90)) == ("throttle", 1)
+    assert scheduler._decide(_sample(45)) == ("hold", 1)
+    scheduler.duty = 0.5
+    assert scheduler._decide(_sample(20)) == ("unthrottle", 1)
+    scheduler.duty = 1.0
+    assert scheduler._decide(_sample(20)) == ("grow", 2)
+
+
+def test_load_pauses():
+    scheduler = ScanScheduler(4)
+    assert scheduler._decide(_sample(10, other_cpu=99)) == ("pause", 1)
+    assert scheduler._decide(_sample(10, other_cpu=80)) == ("shrink", 3)
+
+
+def test_rest_blocks_acquire():
+    scheduler = ScanScheduler(1, adaptive=False, idle_priority=False, interval=0.2)
+    scheduler.duty = 0.25
+    resting = threading.Event()
+    def watch():
+        while not scheduler._stop.is_set():
+            if scheduler.resting:
+                resting.set()
+            time.sleep(0.005)
+    threading.Thread(target=watch, daemon=True).start()
+    waiter = threading.Thread(target=scheduler._wait_interval)
+    waiter.start()
+    assert resting.wait(1)
+    started = time.monotonic()
+    assert scheduler.acquire(0)
+    # Released when the rest ends, 0.15 s after it began.
+    assert 0.05 < time.monotonic() - started < 0.5
+    assert scheduler.paused_seconds > 0
+    scheduler.release()
+    waiter.join()
+    scheduler.stop()
+
+
+def test_acquire_stops_while_resting():
+    scheduler = ScanScheduler(1, adaptive=False, idle_priority=False)
+    scheduler.resting = True
+    stop = threading.Event()
+    stop.set()
+    assert not scheduler.acquire(0, stop)
@@ -0,0 +1,74 @@
+# SignatureStore lookups, compiled from definitions lines.
+import hashlib
+
+import pytest
+
+from signature_store import SignatureStore, apply_delta, compile_definitions, parse_definition
+
+DATA = [b"one", b"two", b"three"]
+ALGORITHMS = ("sha256", "sha1", "md5")
+
+
+def _hex(algorithm, data):
+    return hashlib.new(algorithm, data).hexdigest()
+
+
+@pytest.fixture
+def store(tmp_path):
+    lines = [f"{_hex(a, d)}:{len(d)}" for a in ALGORITHMS for d in DATA]
+    store = compile_definitions(["# header", ""] + lines, str(tmp_path / "sigs.bin"))
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_lookup_each_algorithm(store, algorithm):
+    for data in DATA:
+        digest = _hex(algorithm, data)
+        assert digest in store
+        assert digest.upper() in store
+        assert store.contains_digest(bytes.fromhex(digest))
+    assert _hex(algorithm, b"four") not in store
+
+
+def test_layout(store):
+    assert len(store) == 9
+    assert set(store.algorithms) == set(ALGORITHMS)
+    assert store.sections() == {32: 3, 20: 3, 16: 3}
+    assert store.known_sizes() == {3, 5}
+    assert "zz" not in store and 42 not in store
+    assert sorted(store) == sorted(_hex(a, d) for a in ALGORITHMS for d in DATA)
+
+
+def test_shared_prefix(tmp_path):
+    # Many digests in one prefix bucket exercise the binary search.
+    digests = [f"abcd{i:060x}" for i in range(0, 2000, 3)]
+    store = compile_definitions(digests, str(tmp_path / "sigs.bin"))
+    assert all(d in store for d in digests)
+    assert not any(f"abcd{i:060x}" in store for i in range(1, 2000, 3))
+    assert store.known_sizes() is None
+    store.close()
+
+
+def test_delta(store, tmp_path):
+    added = _hex("sha256", b"four")
+    removed = _hex("md5", b"one")
+    updated = apply_delta(store, [added], [removed], str(tmp_path / "new.bin"))
+    assert added in updated and removed not in updated
+    assert _hex("sha1", b"one") in updated
+    # The new signature has no size, so sizes can no longer be relied on.
+    assert updated.known_sizes() is None
+    updated.close()
+
+
+def test_parse_definition():
+    sha = _hex("sha256", b"x")
+    assert parse_definition(f"{sha} 12 name") == ("sha256", bytes.fromhex(sha), 12)
+    assert parse_definition("not a digest") is None
+    assert parse_definition("# comment") is None
+
+
+def test_reopen(store):
+    again = SignatureStore(store.path)
+    assert _hex("md5", b"two") in again
+    again.close()
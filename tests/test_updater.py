@@ -0,0 +1,116 @@
+# update_signature_store against a local stand-in for the definitions server.
+import http.server
+import threading
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+import updater_utils
+from signature_store import SignatureStore, compile_definitions
+
+A = "a" * 64
+B = "b" * 64
+C = "c" * 64
+
+
+class FeedServer:
+
+    def __init__(self):
+        self.requests = []
+        # (status, headers, body) for the next request
+        self.reply = (200, {}, b"")
+        feed = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                feed.requests.append((self.path, dict(self.headers)))
+                status, headers, body = feed.reply
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/defs.txt"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    # A session without retries, so a 5xx comes straight back.
+    monkeypatch.setattr(updater_utils, "_session", requests.Session())
+    server = FeedServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "signatures.bin"), str(tmp_path / "state.json")
+
+
+def _update(feed, paths):
+    return updater_utils.update_signature_store(feed.url, *paths)
+
+
+def test_full_download(feed, paths):
+    feed.reply = (200, {"ETag": '"v1"', "X-Definitions-Version": "1"}, f"{A}\n{B}:100\n".encode())
+    store, ok = _update(feed, paths)
+    assert ok
+    assert A in store and B in store and len(store) == 2
+    assert updater_utils.load_update_state(paths[1]) == {"etag": '"v1"', "last_modified": None, "version": "1"}
+
+
+def test_etag_not_modified(feed, paths):
+    feed.reply = (200, {"ETag": '"v1"'}, f"{A}\n".encode())
+    _update(feed, paths)
+    feed.reply = (304, {}, b"")
+    store, ok = _update(feed, paths)
+    assert ok
+    assert feed.requests[-1][1]["If-None-Match"] == '"v1"'
+    assert A in store
+
+
+def test_delta(feed, paths):
+    feed.reply = (200, {"X-Definitions-Version": "1"}, f"{A}\n{B}\n".encode())
+    _update(feed, paths)
+    feed.reply = (200, {"X-Definitions-Delta": "1", "X-Definitions-Version": "2"}, f"+{C}\n-{A}\n".encode())
+    store, ok = _update(feed, paths)
+    assert ok
+    assert "since=1" in feed.requests[-1][0]
+    assert A not in store and B in store and C in store
+
+
+def test_empty_body_keeps_store(feed, paths):
+    compile_definitions([A], paths[0]).close()
+    feed.reply = (200, {}, b"")
+    store, ok = _update(feed, paths)
+    assert not ok
+    assert A in store
+    assert A in SignatureStore(paths[0])
+
+
+def test_server_error_keeps_store(feed, paths):
+    compile_definitions([A], paths[0]).close()
+    feed.reply = (503, {}, b"")
+    store, ok = _update(feed, paths)
+    assert not ok
+    assert A in store
+
+
+def test_server_error_without_store(feed, paths):
+    feed.reply = (500, {}, b"")
+    store, ok = _update(feed, paths)
+    assert not ok
+    assert store == []
@@ -1,15 +1,131 @@
 # updater_utils.py
 # Utility functions for updating virus definitions
+#
+# Definitions server protocol:
+#   GET <url>             full list, one "<hex digest>[:<size>]" per line
+#   GET <url>?since=<N>   servers that support deltas answer with the header
+#                         "X-Definitions-Delta: 1" and lines "+<definition>"
+#                         or "-<definition>" for the changes since version N,
+#                         or 410 Gone when N is too old for a delta. Other
+#                         servers ignore the parameter and send the full list.
+# Every 200 response carries "X-Definitions-Version" and the usual ETag /
+# Last-Modified headers, which are sent back on the next request so an
+# unchanged feed costs a single 304.
+import json
+import os
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 60)
+UPDATE_STATE_FILE = "antigus_update_state.json"
+
+_session = None
+
+
+# Example: One pooled session shared by every download, with retries
+def get_session():
+    global _session
+    if _session is None:
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=("GET", "HEAD"))
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=4)
+        _session = requests.Session()
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+
+def _iter_body(response):
+    if response.encoding is None:
+        response.encoding = "utf-8"
+    for line in response.iter_lines(decode_unicode=True):
+        if line:
+            yield line
+
 
 def fetch_definitions(url):
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.text.splitlines()
-        else:
-            print(f"Failed to fetch definitions: {response.status_code}")
-            return []
+        with get_session().get(url, stream=True, timeout=DEFAULT_TIMEOUT) as response:
+            if response.status_code == 200:
+                return list(_iter_body(response))
+            else:
+                print(f"Failed to fetch definitions: {response.status_code}")
+                return []
     except Exception as e:
         print(f"Error fetching definitions: {e}")
         return []
+
+
+def load_update_state(path=UPDATE_STATE_FILE):
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except Exception:
+            pass
+    return {}
+
+
+def save_update_state(state, path=UPDATE_STATE_FILE):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def _request(url, state, delta):
+    headers = {}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+    params = {"since": state["version"]} if delta else None
+    return get_session().get(url, params=params, headers=headers, stream=True, timeout=DEFAULT_TIMEOUT)
+
+
+# Example: Bring the local signature store up to date with the feed at url.
+# Returns (store, ok): the current store, or [] if there is no usable one,
+# and whether the feed was reached and applied (a 304 counts). A full list
+# without a single definition is refused, so the store is never wiped by an
+# empty response.
+def update_signature_store(url, store_path, state_path=UPDATE_STATE_FILE):
+    from signature_store import SignatureStore, apply_delta, compile_definitions, load_definitions
+
+    have_store = os.path.exists(store_path)
+    state = load_update_state(state_path) if have_store else {}
+    try:
+        response = _request(url, state, delta=bool(state.get("version")))
+        if response.status_code == 410:
+            response.close()
+            state = {}
+            response = _request(url, state, delta=False)
+        with response:
+            if response.status_code == 304:
+                print("Definitions are already up to date.")
+                return SignatureStore(store_path), True
+            if response.status_code != 200:
+                print(f"Failed to fetch definitions: {response.status_code}")
+                return load_definitions(store_path), False
+            if response.headers.get("X-Definitions-Delta") == "1":
+                added, removed = [], []
+                for line in _iter_body(response):
+                    if line[0] == "+":
+                        added.append(line[1:])
+                    elif line[0] == "-":
+                        removed.append(line[1:])
+                store = apply_delta(SignatureStore(store_path), added, removed, store_path)
+                print(f"Applied definitions delta: +{len(added)} -{len(removed)}.")
+            else:
+                store = compile_definitions(_iter_body(response), store_path, require_records=True)
+            save_update_state({
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "version": response.headers.get("X-Definitions-Version"),
+            }, state_path)
+            return store, True
+    except Exception as e:
+        print(f"Error fetching definitions: {e}")
+        return load_definitions(store_path), False